@@ -1,53 +1,127 @@
 import os
-import logging
+import weakref
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 
+from assets import init_assets
+from compression import init_compression
+from config import Config
+from database import configure_engine, engine_options
+from logging_config import configure_logging
+from metrics import init_metrics
+from profiler import init_profiler
+from routing import RoutingSession, init_routing, replica_binds
+from serializers import init_json
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
 
 class Base(DeclarativeBase):
     pass
 
 
-db = SQLAlchemy(model_class=Base)
-# create the app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "dev_secret_key")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)  # needed for url_for to generate with https
+db = SQLAlchemy(model_class=Base, session_options={"class_": RoutingSession})
 
-# configure the database to use SQLite with a file in the root directory (not instance folder)
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:////" + os.path.join(os.getcwd(), "supermarket.db")
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
-# initialize the app with the extension, flask-sqlalchemy >= 3.0.x
-db.init_app(app)
+def create_app(config=None):
+    """
+    Create and configure the Flask application
 
-with app.app_context():
-    # Import the models here for table creation
-    import models  # noqa: F401
+    Building the app does no database I/O: the schema and sample data are
+    created by the ``init-db`` and ``seed-sample`` CLI commands instead.
+
+    Args:
+        config: Optional config object/class, or a dict of overrides applied
+            on top of ``config.Config``
+    """
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    if isinstance(config, dict):
+        app.config.update(config)
+    elif config is not None:
+        app.config.from_object(config)
+
+    configure_logging(app.config)
+    init_json(app)
+    # Registered first so it runs after every other after_request hook
+    init_compression(app)
+    init_assets(app)
+
+    app.secret_key = app.config["SECRET_KEY"]
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)  # needed for url_for to generate with https
 
-    db.create_all()
-    
-    # Import sample data population function
-    from models import populate_sample_data
-    
-    # Add sample data
-    populate_sample_data()
+    # initialize the app with the extension, flask-sqlalchemy >= 3.0.x
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config)
+    app.config["SQLALCHEMY_BINDS"] = dict(
+        app.config.get("SQLALCHEMY_BINDS") or {},
+        **replica_binds(app.config, app.config["SQLALCHEMY_ENGINE_OPTIONS"])
+    )
+    db.init_app(app)
+    init_routing(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            configure_engine(engine, app.config)
+    init_profiler(app, db)
+    init_metrics(app, db)
+
+    # Import the models so their tables are registered on the metadata,
+    # catalog so product writes bump the catalog version, replenishment so
+    # sales and stock changes keep the reorder plan current, outbox so they
+    # are published to consumers, pricing so promotion writes trigger a
+    # recompile, tills so sales add to their till session's totals, and
+    # stores so writes are booked to the request's store
+    import models  # noqa: F401
+    import catalog  # noqa: F401
+    import replenishment  # noqa: F401
+    import outbox  # noqa: F401
+    import pricing  # noqa: F401
+    import tills  # noqa: F401
+    from stores import init_stores
+    init_stores(app)
 
     # Import and register blueprints
+    from routes import main_bp
     from routes.inventory import inventory_bp
     from routes.checkout import checkout_bp
     from routes.reports import reports_bp
     from routes.mpesa import mpesa_bp
-    
+    from routes.events import events_bp
+    from routes.promotions import promotions_bp
+    from routes.tills import tills_bp
+
+    app.register_blueprint(main_bp)
     app.register_blueprint(inventory_bp)
     app.register_blueprint(checkout_bp)
     app.register_blueprint(reports_bp)
     app.register_blueprint(mpesa_bp)
+    app.register_blueprint(events_bp)
+    app.register_blueprint(promotions_bp)
+    app.register_blueprint(tills_bp)
+
+    from commands import register_commands
+    register_commands(app)
+
+    _apps.add(app)
+
+    return app
+
+
+# Apps whose engines forked children must not share; held weakly so apps
+# built and dropped (e.g. in tests) are not kept alive
+_apps = weakref.WeakSet()
+
+
+def _dispose_engines_after_fork():
+    """
+    Drop pooled connections inherited from the parent process in each forked
+    child (e.g. gunicorn --preload workers) so no socket or SQLite handle is
+    shared between processes. The parent's connections are left untouched.
+    """
+    for app in list(_apps):
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+
 
-    # Import and register the main routes - directly import the module
-    import routes
+# Registered once; hooks cannot be unregistered, so one per create_app() would pile up
+os.register_at_fork(after_in_child=_dispose_engines_after_fork)
@@ -0,0 +1,267 @@
+"""
+Hot/cold archival of sales and stock history
+
+``flask archive-history`` closes every whole month older than
+ARCHIVE_KEEP_MONTHS, one month per transaction:
+
+1. checkpoint the stock ledger at the end of the month (see stock_ledger.py),
+   so current stock never needs the archived movements again;
+2. add the month's per-day totals to DailySalesSummary (per store and
+   payment method) and DailyProductSales (per store and product);
+3. move its Transaction, TransactionItem and StockMovement rows into the
+   *_archive tables, which carry only the indexes history lookups need;
+4. record an ArchivedPeriod.
+
+The live tables then only hold recent months. Reports read sales through
+``product_sales``, ``payment_totals`` and ``daily_units``, which add the
+archived daily totals to the live rows, and receipts of archived sales are
+looked up with ``archived_transaction``. Archived days are whole days, so a
+range that starts or ends partway through an archived day counts all of it.
+"""
+import logging
+from datetime import date, datetime
+
+from sqlalchemy import delete, func, select, union_all
+
+from app import db
+from models import (
+    ArchivedPeriod, DailyProductSales, DailySalesSummary, Product, StockMovement, Transaction, TransactionItem,
+    stock_movement_archive, transaction_archive, transaction_item_archive
+)
+from stock_ledger import create_checkpoint
+
+logger = logging.getLogger(__name__)
+
+
+def _month_start(day, months_back=0):
+    month = day.year * 12 + day.month - 1 - months_back
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def _midnight(day):
+    return datetime.combine(day, datetime.min.time())
+
+
+def product_sales(start, end, store_id=None):
+    """
+    Units and revenue sold per product, live and archived
+
+    Args:
+        start (datetime): Start of the range
+        end (datetime): End of the range, inclusive
+        store_id (int): Only this store's sales, or None for the whole chain
+
+    Returns:
+        Subquery with product_id, quantity and revenue columns; sum them
+        grouped by product_id
+    """
+    live = (
+        select(TransactionItem.product_id, TransactionItem.quantity.label('quantity'),
+               TransactionItem.total_price.label('revenue'))
+        .join(Transaction, Transaction.id == TransactionItem.transaction_id)
+        .where(Transaction.transaction_date.between(start, end))
+    )
+    archived = select(DailyProductSales.product_id, DailyProductSales.quantity, DailyProductSales.revenue).where(
+        DailyProductSales.day.between(start.date(), end.date())
+    )
+    if store_id is not None:
+        live = live.where(Transaction.store_id == store_id)
+        archived = archived.where(DailyProductSales.store_id == store_id)
+    return union_all(live, archived).subquery()
+
+
+def payment_totals(start, end, store_id=None):
+    """
+    Transaction count and total amount per payment method, live and archived
+
+    Args:
+        start (datetime): Start of the range
+        end (datetime): End of the range, inclusive
+        store_id (int): Only this store's sales, or None for the whole chain
+
+    Returns:
+        list: (payment_method, transactions, total_amount) rows
+    """
+    live = (
+        select(Transaction.payment_method, func.count(Transaction.id).label('transactions'),
+               func.sum(Transaction.total_amount).label('total_amount'))
+        .where(Transaction.transaction_date.between(start, end))
+        .group_by(Transaction.payment_method)
+    )
+    archived = select(
+        DailySalesSummary.payment_method, DailySalesSummary.transactions, DailySalesSummary.total_amount
+    ).where(DailySalesSummary.day.between(start.date(), end.date()))
+    if store_id is not None:
+        live = live.where(Transaction.store_id == store_id)
+        archived = archived.where(DailySalesSummary.store_id == store_id)
+    rows = union_all(live, archived).subquery()
+    totals = db.session.execute(
+        select(rows.c.payment_method, func.sum(rows.c.transactions), func.sum(rows.c.total_amount))
+        .group_by(rows.c.payment_method)
+    )
+    return [(method, int(count), float(total or 0)) for method, count, total in totals]
+
+
+def daily_units(start=None, end=None):
+    """
+    Units sold per product per day, live and archived
+
+    Args:
+        start (datetime): Start of the range, or None for all history
+        end (datetime): End of the range, exclusive, or None
+
+    Returns:
+        Subquery with product_id, day and quantity columns. day is an ISO
+        date string on SQLite and a date elsewhere.
+    """
+    day = func.date(Transaction.transaction_date)
+    live = (
+        select(TransactionItem.product_id, day.label('day'), func.sum(TransactionItem.quantity).label('quantity'))
+        .join(Transaction, Transaction.id == TransactionItem.transaction_id)
+        .group_by(TransactionItem.product_id, day)
+    )
+    archived = select(DailyProductSales.product_id, DailyProductSales.day, DailyProductSales.quantity)
+    if start is not None:
+        live = live.where(Transaction.transaction_date >= start)
+        archived = archived.where(DailyProductSales.day >= start.date())
+    if end is not None:
+        live = live.where(Transaction.transaction_date < end)
+        archived = archived.where(DailyProductSales.day < end.date())
+    return union_all(live, archived).subquery()
+
+
+def archived_transaction(transaction_id):
+    """
+    An archived transaction in Transaction.to_dict() form, or None
+
+    Args:
+        transaction_id (int): The transaction's original id
+
+    Returns:
+        dict: The transaction with its items and 'archived': True
+    """
+    transaction = db.session.execute(
+        select(transaction_archive).where(transaction_archive.c.id == transaction_id)
+    ).mappings().first()
+    if transaction is None:
+        return None
+
+    items = db.session.execute(
+        select(transaction_item_archive, Product.name.label('product_name'))
+        .outerjoin(Product, Product.id == transaction_item_archive.c.product_id)
+        .where(transaction_item_archive.c.transaction_id == transaction_id)
+        .order_by(transaction_item_archive.c.id)
+    ).mappings()
+    return {
+        'id': transaction['id'],
+        'reference_number': transaction['reference_number'],
+        'transaction_date': transaction['transaction_date'].isoformat(),
+        'total_amount': transaction['total_amount'],
+        'payment_method': transaction['payment_method'],
+        'payment_reference': transaction['payment_reference'],
+        'cashier_name': transaction['cashier_name'],
+        'store_id': transaction['store_id'],
+        'till_session_id': transaction['till_session_id'],
+        'items': [{
+            'id': item['id'],
+            'product_id': item['product_id'],
+            'product_name': item['product_name'] if item['product_name'] is not None else "Unknown",
+            'quantity': item['quantity'],
+            'unit_price': item['unit_price'],
+            'discount': item['discount'],
+            'promotion_id': item['promotion_id'],
+            'total_price': item['total_price']
+        } for item in items],
+        'archived': True
+    }
+
+
+def _copy(table, archive_table, *conditions):
+    """INSERT ... SELECT the matching rows into the archive table; returns the row count"""
+    names = [column.name for column in archive_table.columns]
+    source = select(*[table.c[name] for name in names]).where(*conditions)
+    return db.session.execute(archive_table.insert().from_select(names, source)).rowcount
+
+
+def archive_month(month_start):
+    """
+    Summarize one month of history and move it into the archive; commits
+
+    Args:
+        month_start (date): First day of the month
+
+    Returns:
+        ArchivedPeriod: The record of what was moved
+    """
+    month_end = _month_start(month_start, months_back=-1)
+    begin, finish = _midnight(month_start), _midnight(month_end)
+
+    # Stock from the end of the month on must not need its movements
+    create_checkpoint(finish)
+
+    in_month = Transaction.transaction_date >= begin, Transaction.transaction_date < finish
+    day = func.date(Transaction.transaction_date)
+    db.session.execute(DailySalesSummary.__table__.insert().from_select(
+        ['store_id', 'day', 'payment_method', 'transactions', 'total_amount'],
+        select(Transaction.store_id, day, Transaction.payment_method, func.count(Transaction.id),
+               func.sum(Transaction.total_amount))
+        .where(*in_month)
+        .group_by(Transaction.store_id, day, Transaction.payment_method)
+    ))
+    db.session.execute(DailyProductSales.__table__.insert().from_select(
+        ['store_id', 'day', 'product_id', 'quantity', 'revenue'],
+        select(Transaction.store_id, day, TransactionItem.product_id, func.sum(TransactionItem.quantity),
+               func.sum(TransactionItem.total_price))
+        .join(Transaction, Transaction.id == TransactionItem.transaction_id)
+        .where(*in_month)
+        .group_by(Transaction.store_id, day, TransactionItem.product_id)
+    ))
+
+    items_in_month = TransactionItem.transaction_id.in_(select(Transaction.id).where(*in_month))
+    movements_in_month = StockMovement.movement_date >= begin, StockMovement.movement_date < finish
+    period = ArchivedPeriod(
+        period_start=month_start,
+        period_end=month_end,
+        transaction_items=_copy(TransactionItem.__table__, transaction_item_archive, items_in_month),
+        transactions=_copy(Transaction.__table__, transaction_archive, *in_month),
+        stock_movements=_copy(StockMovement.__table__, stock_movement_archive, *movements_in_month),
+    )
+    options = {'synchronize_session': False}
+    db.session.execute(delete(TransactionItem).where(items_in_month), execution_options=options)
+    db.session.execute(delete(Transaction).where(*in_month), execution_options=options)
+    db.session.execute(delete(StockMovement).where(*movements_in_month), execution_options=options)
+    db.session.add(period)
+    db.session.commit()
+    return period
+
+
+def archive_history(keep_months, log=logger.info):
+    """
+    Archive every whole month before the last keep_months
+
+    Args:
+        keep_months (int): Months kept live, counting the current one
+        log: Called with a line of text per archived month
+
+    Returns:
+        list: The ArchivedPeriod of each month archived, oldest first
+    """
+    if keep_months < 1:
+        raise ValueError('keep_months must be at least 1')
+    cutoff = _month_start(datetime.utcnow().date(), months_back=keep_months - 1)
+
+    oldest = [db.session.execute(select(func.min(column))).scalar()
+              for column in (Transaction.transaction_date, StockMovement.movement_date)]
+    oldest = [value for value in oldest if value is not None]
+    if not oldest:
+        return []
+
+    periods = []
+    month = _month_start(min(oldest).date())
+    while month < cutoff:
+        period = archive_month(month)
+        log(f'{month:%Y-%m}: archived {period.transactions} transactions, '
+            f'{period.transaction_items} items and {period.stock_movements} stock movements')
+        periods.append(period)
+        month = _month_start(month, months_back=-1)
+    return periods
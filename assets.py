@@ -0,0 +1,206 @@
+"""
+Fingerprinted static assets
+
+``flask build-assets`` copies everything under static/ to static/dist/ with
+a content hash in the file name (js/app.js -> js/app.3f2a9c1b04de.js),
+writes gzip and brotli variants next to each text asset, renders the app
+icon down to small favicons, and records the mapping in
+static/dist/manifest.json. Templates link assets through ``asset_url()``,
+which resolves to the fingerprinted URL when a manifest exists, so those
+files can be cached by browsers and proxies for a year. Without a build the
+plain static URLs are used.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import struct
+import zlib
+
+from flask import current_app, request, send_from_directory, url_for
+
+from compression import brotli, choose_encoding
+
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+PRECOMPRESS_EXTENSIONS = {'.js', '.css', '.svg', '.json', '.txt', '.html'}
+FAVICON_SIZES = (32, 180)
+
+
+def _fingerprint(path, data):
+    base, ext = os.path.splitext(path)
+    return f'{base}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _read_png(path):
+    """Decode an 8-bit, non-interlaced RGB or RGBA PNG into (width, height, channels, rows)"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:8] != b'\x89PNG\r\n\x1a\n':
+        raise ValueError(f'{path} is not a PNG file')
+
+    offset, idat = 8, []
+    while offset < len(data):
+        length, kind = struct.unpack('>I4s', data[offset:offset + 8])
+        chunk = data[offset + 8:offset + 8 + length]
+        if kind == b'IHDR':
+            width, height, depth, color_type, _, _, interlace = struct.unpack('>IIBBBBB', chunk)
+        elif kind == b'IDAT':
+            idat.append(chunk)
+        offset += length + 12
+    if depth != 8 or color_type not in (2, 6) or interlace:
+        raise ValueError(f'{path}: only 8-bit non-interlaced RGB/RGBA PNGs are supported')
+
+    channels = 3 if color_type == 2 else 4
+    stride = width * channels
+    raw = zlib.decompress(b''.join(idat))
+    rows, previous = [], bytearray(stride)
+    for y in range(height):
+        start = y * (stride + 1)
+        kind, row = raw[start], bytearray(raw[start + 1:start + 1 + stride])
+        if kind == 1:
+            for i in range(channels, stride):
+                row[i] = (row[i] + row[i - channels]) & 0xFF
+        elif kind == 2:
+            row = bytearray((a + b) & 0xFF for a, b in zip(row, previous))
+        elif kind == 3:
+            for i in range(stride):
+                left = row[i - channels] if i >= channels else 0
+                row[i] = (row[i] + ((left + previous[i]) >> 1)) & 0xFF
+        elif kind == 4:
+            for i in range(stride):
+                a = row[i - channels] if i >= channels else 0
+                b, c = previous[i], previous[i - channels] if i >= channels else 0
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                predictor = a if pa <= pb and pa <= pc else (b if pb <= pc else c)
+                row[i] = (row[i] + predictor) & 0xFF
+        rows.append(row)
+        previous = row
+    return width, height, channels, rows
+
+
+def _resize(width, height, channels, rows, size):
+    """Area-average downscale to a size x size image"""
+    xs = [(x * width // size, max((x + 1) * width // size, x * width // size + 1)) for x in range(size)]
+    resized = []
+    for y in range(size):
+        top, bottom = y * height // size, max((y + 1) * height // size, y * height // size + 1)
+        # Sum the source rows of this band column-wise, then average each block
+        sums = [0] * (width * channels)
+        for row in rows[top:bottom]:
+            sums = [s + v for s, v in zip(sums, row)]
+        out = bytearray()
+        for left, right in xs:
+            count = (right - left) * (bottom - top)
+            for c in range(channels):
+                out.append(round(sum(sums[left * channels + c:right * channels:channels]) / count))
+        resized.append(out)
+    return resized
+
+
+def _encode_png(size, channels, rows):
+    def chunk(kind, body):
+        return struct.pack('>I', len(body)) + kind + body + struct.pack('>I', zlib.crc32(kind + body))
+
+    raw = b''.join(b'\x00' + bytes(row) for row in rows)
+    header = struct.pack('>IIBBBBB', size, size, 8, 2 if channels == 3 else 6, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(raw, 9)) + chunk(b'IEND', b''))
+
+
+def build_assets(static_folder, icon_path=None, log=print):
+    """
+    Write fingerprinted, precompressed copies of the static files
+
+    Args:
+        static_folder: The app's static directory
+        icon_path: Optional large PNG to render into favicon-<size>.png files
+        log: Called with a line of text per file written
+
+    Returns:
+        dict: The manifest, mapping source paths to fingerprinted paths
+    """
+    dist = os.path.join(static_folder, DIST_DIR)
+    shutil.rmtree(dist, ignore_errors=True)
+
+    sources = {}
+    for directory, subdirs, files in os.walk(static_folder):
+        subdirs[:] = [d for d in subdirs if os.path.join(directory, d) != dist]
+        for name in files:
+            path = os.path.join(directory, name)
+            with open(path, 'rb') as f:
+                sources[os.path.relpath(path, static_folder).replace(os.sep, '/')] = f.read()
+
+    if icon_path:
+        width, height, channels, rows = _read_png(icon_path)
+        for size in FAVICON_SIZES:
+            sources[f'favicon-{size}.png'] = _encode_png(size, channels, _resize(width, height, channels, rows, size))
+
+    manifest = {}
+    for path, data in sorted(sources.items()):
+        hashed = _fingerprint(path, data)
+        target = os.path.join(dist, hashed)
+        _write(target, data)
+        manifest[path] = hashed
+        sizes = [f'{len(data)} B']
+        if os.path.splitext(path)[1] in PRECOMPRESS_EXTENSIONS:
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            _write(target + '.gz', compressed)
+            sizes.append(f'gzip {len(compressed)} B')
+            if brotli is not None:
+                compressed = brotli.compress(data, quality=11)
+                _write(target + '.br', compressed)
+                sizes.append(f'br {len(compressed)} B')
+        log(f'{path} -> {DIST_DIR}/{hashed} ({", ".join(sizes)})')
+
+    _write(os.path.join(dist, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+def asset_url(filename):
+    """URL of a static file, fingerprinted when the asset manifest has it"""
+    hashed = current_app.extensions['asset_manifest'].get(filename)
+    if hashed is None:
+        return url_for('static', filename=filename)
+    return url_for('asset', filename=hashed)
+
+
+def serve_asset(filename):
+    """Serve a fingerprinted file, preferring a precompressed variant the client accepts"""
+    dist = os.path.join(current_app.static_folder, DIST_DIR)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = choose_encoding(request.accept_encodings)
+    suffix = {'br': '.br', 'gzip': '.gz'}.get(encoding)
+
+    max_age = current_app.config['ASSET_MAX_AGE']
+
+    if suffix and os.path.isfile(os.path.join(dist, filename + suffix)):
+        response = send_from_directory(dist, filename + suffix, mimetype=mimetype, max_age=max_age)
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = send_from_directory(dist, filename, mimetype=mimetype, max_age=max_age)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.immutable = True
+    return response
+
+
+def init_assets(app):
+    """Load the asset manifest and expose asset_url() to templates"""
+    manifest_path = os.path.join(app.static_folder, DIST_DIR, MANIFEST)
+    manifest = {}
+    if os.path.isfile(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    app.extensions['asset_manifest'] = manifest
+
+    app.add_url_rule(f'{app.static_url_path}/{DIST_DIR}/<path:filename>', 'asset', serve_asset)
+    app.jinja_env.globals.update(asset_url=asset_url, asset_manifest=manifest)
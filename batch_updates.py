@@ -0,0 +1,206 @@
+"""
+Batch price and stock changes
+
+Applies a list of per-product changes (price, cost price and/or counted
+stock) in one transaction: one lookup query per chunk of products, one bulk
+UPDATE by primary key, and one executemany INSERT for the stock movements;
+reorder plans of products whose stock changed are refreshed in bulk, the
+change in stock is booked to the request's store (see stores.py), and the
+movements and price changes are recorded in the outbox (see outbox.py).
+With a store given, a counted stock level is that store's, and the chain
+total moves by the same amount; without one it is the chain total.
+Every change is validated first; if any fails, nothing is written. A dry run
+returns the same per-row diff without writing.
+"""
+import math
+from datetime import datetime
+from types import SimpleNamespace
+
+from sqlalchemy import select, update
+
+from app import db
+from catalog import bump_version
+from models import Product, StockMovement
+from outbox import PRODUCT_FIELDS, movement_events, product_events, record_events
+from replenishment import refresh_products
+from stores import adjust_store_stock, current_store_id, requested_store_id, store_levels
+
+# Largest number of changes accepted in one request
+MAX_BATCH_CHANGES = 20000
+
+# Products looked up per SELECT, to stay under database parameter limits
+LOOKUP_CHUNK = 500
+
+CHANGE_FIELDS = ('price', 'cost_price', 'stock_quantity')
+
+
+class BatchError(ValueError):
+    """Raised when the batch request itself is malformed"""
+    pass
+
+
+def _parse_change(change):
+    """Validate one change; returns (key, new values) or raises ValueError"""
+    if not isinstance(change, dict):
+        raise ValueError('Each change must be an object')
+    if ('product_id' in change) == ('barcode' in change):
+        raise ValueError('Give exactly one of product_id or barcode')
+    key = ('id', int(change['product_id'])) if 'product_id' in change else ('barcode', str(change['barcode']))
+
+    values = {}
+    for field in ('price', 'cost_price'):
+        if field in change:
+            value = float(change[field])
+            if not math.isfinite(value) or value < 0:
+                raise ValueError(f'{field} must be a number of at least 0')
+            values[field] = value
+    if 'stock_quantity' in change:
+        value = int(change['stock_quantity'])
+        if value < 0:
+            raise ValueError('stock_quantity cannot be negative')
+        values['stock_quantity'] = value
+    if not values:
+        raise ValueError(f"Nothing to change; give any of {', '.join(CHANGE_FIELDS)}")
+    return key, values
+
+
+def _load_products(keys, lock):
+    """Current rows for the given ('id'|'barcode', value) keys, indexed both ways"""
+    ids = sorted({value for kind, value in keys if kind == 'id'})
+    barcodes = sorted({value for kind, value in keys if kind == 'barcode'})
+    columns = (Product.id, Product.barcode, Product.name, Product.price, Product.cost_price, Product.stock_quantity)
+
+    found = {}
+    for values, column in ((ids, Product.id), (barcodes, Product.barcode)):
+        for i in range(0, len(values), LOOKUP_CHUNK):
+            query = select(*columns).where(column.in_(values[i:i + LOOKUP_CHUNK]))
+            if lock:
+                query = query.with_for_update()
+            for row in db.session.execute(query):
+                found[('id', row.id)] = found[('barcode', row.barcode)] = row
+    return found
+
+
+def apply_product_changes(changes, reference=None, notes=None, dry_run=False):
+    """
+    Validate and apply a batch of product changes
+
+    Args:
+        changes (list): Dicts with product_id or barcode and any of price,
+            cost_price and stock_quantity (the counted stock level, at the
+            request's store when one is given)
+        reference (str): Reference for the stock movements
+        notes (str): Notes for the stock movements; defaults to "Stock
+            adjusted from X to Y" per product
+        dry_run (bool): Only report what would change
+
+    Returns:
+        tuple: (applied, results, summary). applied is False when any change
+        failed or dry_run was set; results holds one entry per change, in
+        order, with its status ('updated', 'unchanged' or 'error') and diff
+
+    Raises:
+        BatchError: If changes is not a non-empty list within MAX_BATCH_CHANGES
+    """
+    if not isinstance(changes, list) or not changes:
+        raise BatchError('changes must be a non-empty list')
+    if len(changes) > MAX_BATCH_CHANGES:
+        raise BatchError(f'At most {MAX_BATCH_CHANGES} changes per batch')
+
+    parsed = []
+    for change in changes:
+        try:
+            parsed.append(_parse_change(change))
+        except (TypeError, ValueError) as e:
+            parsed.append(e)
+
+    if not dry_run:
+        # Take the write lock before reading so the stock levels we diff
+        # against cannot change underneath us
+        version = bump_version(db.session)
+    found = _load_products([item[0] for item in parsed if not isinstance(item, Exception)], lock=not dry_run)
+
+    results, updates, movements, seen = [], [], [], set()
+    now = datetime.utcnow()
+    store_id = current_store_id()
+    # Counts taken at one store are diffed against that store's level
+    store_counts = None
+    if requested_store_id() is not None:
+        store_counts = store_levels(store_id, {key[1] for key in found if key[0] == 'id'})
+    for index, item in enumerate(parsed):
+        result = {'index': index}
+        results.append(result)
+        if isinstance(item, Exception):
+            result.update(status='error', error=str(item))
+            continue
+
+        key, values = item
+        row = found.get(key)
+        if row is None:
+            result.update(status='error', error=f'Product with {key[0]} {key[1]} not found')
+            continue
+        result['product_id'] = row.id
+        if row.id in seen:
+            result.update(status='error', error=f'Product {row.id} appears more than once in the batch')
+            continue
+        seen.add(row.id)
+
+        current = dict(row._mapping)
+        if store_counts is not None:
+            current['stock_quantity'] = store_counts.get(row.id, 0)
+        diff = {field: {'old': current[field], 'new': value}
+                for field, value in values.items() if current[field] != value}
+        result['changes'] = diff
+        if not diff:
+            result['status'] = 'unchanged'
+            continue
+        result['status'] = 'updated'
+
+        update_values = dict({field: change['new'] for field, change in diff.items()}, id=row.id)
+        if 'stock_quantity' in diff:
+            old_stock, new_stock = diff['stock_quantity']['old'], diff['stock_quantity']['new']
+            # The chain total moves by the change in the counted level
+            update_values['stock_quantity'] = row.stock_quantity + new_stock - old_stock
+            movements.append({
+                'product_id': row.id,
+                'movement_date': now,
+                'quantity': new_stock - old_stock,
+                'movement_type': 'in' if new_stock > old_stock else 'out',
+                'reference': reference or 'Stock Adjustment',
+                'notes': notes or f'Stock adjusted from {old_stock} to {new_stock}',
+                'store_id': store_id,
+            })
+        updates.append(update_values)
+
+    summary = {status: sum(1 for result in results if result['status'] == status)
+               for status in ('updated', 'unchanged', 'error')}
+    if dry_run or summary['error'] or not updates:
+        # Also releases the catalog version taken above when nothing changed
+        db.session.rollback()
+        return not dry_run and not summary['error'], results, summary
+
+    for row in updates:
+        row.update(updated_at=now, catalog_version=version)
+    db.session.execute(update(Product), updates)
+    events = []
+    if movements:
+        table = StockMovement.__table__
+        ids = db.session.execute(
+            table.insert().returning(table.c.id, sort_by_parameter_order=True), movements
+        ).scalars().all()
+        events += movement_events(SimpleNamespace(**movement, id=movement_id)
+                                  for movement, movement_id in zip(movements, ids))
+        adjust_store_stock(db.session.connection(),
+                           {movement['product_id']: movement['quantity'] for movement in movements}, store_id)
+        refresh_products([movement['product_id'] for movement in movements], now)
+
+    # Stock changes reach consumers as movements; price changes as the product
+    repriced = [row['id'] for row in updates if 'price' in row or 'cost_price' in row]
+    columns = [Product.__table__.c[field] for field in PRODUCT_FIELDS]
+    for i in range(0, len(repriced), LOOKUP_CHUNK):
+        events += product_events('product.updated', db.session.execute(
+            select(*columns).where(Product.id.in_(repriced[i:i + LOOKUP_CHUNK]))
+        ))
+    record_events(db.session.connection(), events)
+    db.session.commit()
+    return True, results, summary
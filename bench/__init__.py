@@ -0,0 +1 @@
+"""Benchmarks and load generators, run as python -m bench.<name>"""
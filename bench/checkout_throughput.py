@@ -0,0 +1,145 @@
+"""
+Compare checkout throughput across database modes
+
+    python -m bench.checkout_throughput --workers 8 --duration 10
+    python -m bench.checkout_throughput --postgres-url postgresql://user:pw@localhost/bench
+
+Each mode gets a fresh database seeded with products, then --workers forked
+processes (like gunicorn workers) post checkout baskets for --duration
+seconds. Prints sales/s, error counts ("database is locked" and friends) and
+latency percentiles as JSON.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from fake_daraja import percentiles
+
+SQLITE_MODES = {
+    'sqlite-rollback': {
+        'SQLITE_JOURNAL_MODE': 'DELETE',
+        'SQLITE_SYNCHRONOUS': 'FULL',
+        'SQLITE_MMAP_SIZE': 0,
+    },
+    'sqlite-wal': {
+        'SQLITE_JOURNAL_MODE': 'WAL',
+        'SQLITE_SYNCHRONOUS': 'NORMAL',
+    },
+}
+
+
+def build_app(overrides, products):
+    from app import create_app, db
+    from models import Product
+    from stores import ensure_stores
+
+    app = create_app(overrides)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(Product.__table__.insert(), [
+            {
+                'barcode': f'77{i:011d}',
+                'name': f'Bench product {i}',
+                'description': '',
+                'price': round(1 + (i % 50) * 0.37, 2),
+                'cost_price': 1.0,
+                'category': f'Category {i % 10}',
+                'stock_quantity': 10 ** 7,
+            }
+            for i in range(1, products + 1)
+        ])
+        # Checkout sells from the default store's stock
+        ensure_stores()
+        # Children must open their own connections after fork
+        db.engine.dispose()
+    return app
+
+
+def worker(app, products, duration, seed, results):
+    rng = random.Random(seed)
+    client = app.test_client()
+    latencies, errors = [], {}
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        basket = [
+            {'product_id': rng.randint(1, products), 'quantity': rng.randint(1, 3)}
+            for _ in range(rng.randint(1, 5))
+        ]
+        started = time.perf_counter()
+        response = client.post('/checkout/transactions', json={
+            'items': basket,
+            'total_amount': 0,
+            'payment_method': 'cash',
+            'cashier_name': f'Bench {seed}'
+        })
+        elapsed = time.perf_counter() - started
+        if response.status_code == 201:
+            latencies.append(elapsed)
+        else:
+            message = (response.get_json(silent=True) or {}).get('error', str(response.status_code))
+            key = 'database is locked' if 'locked' in message else message[:80]
+            errors[key] = errors.get(key, 0) + 1
+    results.put((latencies, errors))
+
+
+def run_mode(name, overrides, args):
+    app = build_app(overrides, args.products)
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(app, args.products, args.duration, seed, results))
+        for seed in range(args.workers)
+    ]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    latencies, errors = [], {}
+    for _ in processes:
+        worker_latencies, worker_errors = results.get()
+        latencies.extend(worker_latencies)
+        for key, count in worker_errors.items():
+            errors[key] = errors.get(key, 0) + count
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+    return {
+        'mode': name,
+        'sales': len(latencies),
+        'sales_per_s': round(len(latencies) / elapsed, 2),
+        'errors': errors,
+        'latency': percentiles(sorted(latencies)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Checkout throughput per database mode')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--postgres-url', help='Also benchmark this PostgreSQL database (it is emptied)')
+    parser.add_argument('--modes', nargs='*', help='Subset of modes to run')
+    args = parser.parse_args()
+
+    reports = []
+    with tempfile.TemporaryDirectory() as tmp:
+        modes = {
+            name: dict(settings, SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(tmp, f'{name}.db'))
+            for name, settings in SQLITE_MODES.items()
+        }
+        if args.postgres_url:
+            modes['postgresql'] = {'SQLALCHEMY_DATABASE_URI': args.postgres_url}
+        for name, overrides in modes.items():
+            if args.modes and name not in args.modes:
+                continue
+            reports.append(run_mode(name, overrides, args))
+
+    print(json.dumps({'workers': args.workers, 'duration_s': args.duration, 'results': reports}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
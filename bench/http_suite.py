@@ -0,0 +1,274 @@
+"""
+Reproducible HTTP benchmark for the core endpoints
+
+    python -m bench.http_suite --concurrency 8 --duration 15 --output results.json
+
+Seeds a fresh database with synthetic_data (or uses --database-url as is),
+serves the app and a fake Daraja server from local threads, and drives four
+scenarios in turn:
+
+- checkout: POST /checkout/transactions with Zipf-ish random baskets
+- search: GET /checkout/search for each keystroke prefix of product names
+- reports: the report endpoints for today/week/month and inventory status
+- mpesa: POST /mpesa/initiate then GET /mpesa/verify until settled
+
+Prints, and optionally writes, JSON with throughput, error counts and latency
+percentiles per scenario and per endpoint, plus the commit and settings used,
+so runs can be diffed across commits.
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+from sqlalchemy import select, update
+
+from fake_daraja import percentiles
+
+# Daraja's STK query error message while the customer has yet to answer
+DARAJA_PENDING = 'The transaction is being processed'
+
+REPORT_PATHS = [
+    '/reports/sales/summary?period=today',
+    '/reports/sales/summary?period=week',
+    '/reports/sales/summary?period=month',
+    '/reports/sales/by-category?period=week',
+    '/reports/sales/top-products?period=month',
+    '/reports/inventory/status',
+]
+
+
+def top_up_stock(quantity):
+    """
+    Add quantity to every product's stock at the default store, where
+    checkout sells without a store header, and to its chain-wide total;
+    commits
+    """
+    from app import db
+    from models import DEFAULT_STORE_ID, Product
+    from stores import adjust_store_stock
+
+    product_ids = db.session.scalars(select(Product.id)).all()
+    db.session.execute(update(Product).values(stock_quantity=Product.stock_quantity + quantity))
+    adjust_store_stock(db.session.connection(), dict.fromkeys(product_ids, quantity), DEFAULT_STORE_ID)
+    db.session.commit()
+
+
+def serve(app, port):
+    """Run a WSGI app on a daemon thread; returns the server"""
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Scenario:
+    """One workload; step() performs a unit of work and returns [(name, seconds, ok, error)]"""
+
+    def __init__(self, name, base_url, catalog, seed):
+        self.name = name
+        self.base_url = base_url
+        self.catalog = catalog
+        self.rng = random.Random(seed)
+        self.http = requests.Session()
+
+    def timed(self, method, name, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.http.request(method, self.base_url + path, timeout=60, **kwargs)
+            ok = response.status_code < 400
+            is_json = response.headers.get('Content-Type', '').startswith('application/json')
+            body = response.json() if is_json else None
+            error = None if ok else str((body or {}).get('error') or (body or {}).get('message') or response.status_code)
+        except requests.RequestException as e:
+            ok, body, error = False, None, type(e).__name__
+        return (name, time.perf_counter() - started, ok, error), body
+
+    def step(self):
+        return getattr(self, f'step_{self.name}')()
+
+    def pick_product(self):
+        # Favour the front of the catalog to mimic best sellers
+        index = min(int(self.rng.paretovariate(1.2)) - 1, len(self.catalog) - 1)
+        return self.catalog[index]
+
+    def step_checkout(self):
+        basket = [{'product_id': self.pick_product()['id'], 'quantity': self.rng.randint(1, 3)}
+                  for _ in range(self.rng.randint(1, 6))]
+        sample, _ = self.timed('POST', 'checkout', '/checkout/transactions', json={
+            'items': basket, 'total_amount': 0, 'payment_method': 'cash', 'cashier_name': 'Bench'
+        })
+        return [sample]
+
+    def step_search(self):
+        name = self.pick_product()['name']
+        samples = []
+        for length in range(1, min(len(name), 6) + 1):
+            sample, _ = self.timed('GET', 'search', '/checkout/search', params={'q': name[:length]})
+            samples.append(sample)
+        return samples
+
+    def step_reports(self):
+        samples = []
+        for path in REPORT_PATHS:
+            sample, _ = self.timed('GET', path.split('?')[0], path)
+            samples.append(sample)
+        return samples
+
+    def step_mpesa(self):
+        samples = []
+        sample, body = self.timed('POST', 'mpesa_initiate', '/mpesa/initiate', json={
+            'phone_number': f'2547{self.rng.randrange(10 ** 8):08d}',
+            'amount': self.rng.randint(10, 5000),
+            'reference': f'BENCH-{self.rng.randrange(10 ** 9)}'
+        })
+        samples.append(sample)
+        if not body or not body.get('success'):
+            return samples
+        checkout_request_id = body['data']['checkout_request_id']
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            sample, body = self.timed('GET', 'mpesa_verify', f'/mpesa/verify/{checkout_request_id}')
+            data = (body or {}).get('data') or {}
+            # A pending payment answers 400, with Daraja's answer in data, until
+            # the callback lands; that is not an error, but any other failure is
+            if data.get('error') and DARAJA_PENDING in (body.get('message') or ''):
+                sample = (sample[0], sample[1], True, None)
+            samples.append(sample)
+            if sample[2] and (body.get('success') or data.get('result_code') not in (None, '0', 0)):
+                break
+            time.sleep(0.2)
+        return samples
+
+
+def run_scenario(name, base_url, catalog, concurrency, duration, seed):
+    samples = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def loop(worker_seed):
+        scenario = Scenario(name, base_url, catalog, worker_seed)
+        local = []
+        while time.monotonic() < deadline:
+            local.extend(scenario.step())
+        with lock:
+            samples.extend(local)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(loop, [seed * 1000 + i for i in range(concurrency)]))
+    elapsed = time.perf_counter() - started
+
+    by_endpoint, errors = {}, {}
+    for endpoint, seconds, ok, error in samples:
+        by_endpoint.setdefault(endpoint, []).append((seconds, ok))
+        if error:
+            # Group messages like "Not enough stock for X" by their leading words
+            key = ' '.join(error.split()[:4])
+            errors[key] = errors.get(key, 0) + 1
+    return {
+        'requests': len(samples),
+        'requests_per_s': round(len(samples) / elapsed, 2),
+        'errors': sum(1 for _, _, ok, _ in samples if not ok),
+        'error_messages': errors,
+        'latency': percentiles(sorted(seconds for _, seconds, _, _ in samples)),
+        'endpoints': {
+            endpoint: dict(percentiles(sorted(s for s, _ in values)), errors=sum(1 for _, ok in values if not ok))
+            for endpoint, values in sorted(by_endpoint.items())
+        },
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTTP benchmark for the core endpoints')
+    parser.add_argument('--scenarios', nargs='*', default=['checkout', 'search', 'reports', 'mpesa'])
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=15.0, help='Seconds per scenario')
+    parser.add_argument('--database-url', help='Use this (already seeded) database instead of a fresh one')
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--transactions-per-day', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--daraja-latency-ms', type=float, default=50)
+    parser.add_argument('--callback-delay', type=float, default=1.0)
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    app_port, daraja_port = free_port(), free_port()
+
+    # M-PESA settings are read at import time, so set them before importing the app
+    os.environ.update({
+        'MPESA_API_BASE_URL': f'http://127.0.0.1:{daraja_port}',
+        'MPESA_CONSUMER_KEY': 'bench', 'MPESA_CONSUMER_SECRET': 'bench', 'MPESA_PASS_KEY': 'bench',
+        'MPESA_CALLBACK_URL': f'http://127.0.0.1:{app_port}/mpesa/callback',
+    })
+    from app import create_app, db
+    from fake_daraja import FakeDarajaSettings, create_fake_daraja_app
+    from models import Product
+
+    database_url = args.database_url or 'sqlite:///' + os.path.join(tmp.name, 'bench.db')
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database_url})
+    with app.app_context():
+        if not args.database_url:
+            from synthetic_data import generate_synthetic_data
+            db.create_all()
+            generate_synthetic_data(products=args.products, days=args.days,
+                                    transactions_per_day=args.transactions_per_day, seed=args.seed,
+                                    end_date=datetime.utcnow())
+            # Deep stock so the checkout scenario measures sales, not sell-outs
+            top_up_stock(10 ** 6)
+        catalog = [{'id': id, 'name': name} for id, name in
+                   db.session.query(Product.id, Product.name).order_by(Product.id).limit(args.products)]
+        db.session.remove()
+
+    serve(create_fake_daraja_app(FakeDarajaSettings(
+        latency_ms=args.daraja_latency_ms, callback_delay=args.callback_delay, seed=args.seed
+    )), daraja_port)
+    serve(app, app_port)
+    base_url = f'http://127.0.0.1:{app_port}'
+
+    results = {}
+    for name in args.scenarios:
+        results[name] = run_scenario(name, base_url, catalog, args.concurrency, args.duration, args.seed)
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.utcnow().isoformat(),
+        'settings': {key: value for key, value in vars(args).items() if key != 'output'},
+        'database': database_url.split('@')[-1],
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Measure log volume on the checkout path
+
+    python -m bench.log_volume --requests 200
+    LOG_LEVEL=DEBUG python -m bench.log_volume   # compare another configuration
+
+Serves the app from a local thread (so werkzeug's request log is included),
+posts checkout baskets and counts every record that passes the configured
+levels. Prints records and bytes per request, broken down by logger and
+level, as JSON.
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+from collections import Counter
+
+import requests
+
+from bench.http_suite import free_port, serve, top_up_stock
+from logging_config import JsonFormatter
+
+
+class CountingHandler(logging.Handler):
+    """Counts records and their encoded size without writing them anywhere"""
+
+    def __init__(self):
+        super().__init__()
+        self.formatter = JsonFormatter()
+        self.records = Counter()
+        self.bytes = 0
+
+    def emit(self, record):
+        # Handler.handle() already holds self.lock here
+        self.records[f'{record.name.split(".")[0]}:{record.levelname}'] += 1
+        self.bytes += len(self.format(record)) + 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Log records and bytes per checkout request')
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    from app import create_app, db
+    from models import populate_sample_data
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tmp, 'logs.db')})
+        with app.app_context():
+            db.create_all()
+            populate_sample_data()
+            # Deep stock, so every checkout is a sale and not the stock-out path
+            top_up_stock(10 ** 6)
+
+        counter = CountingHandler()
+        logging.getLogger().addHandler(counter)
+
+        port = free_port()
+        server = serve(app, port)
+        http = requests.Session()
+        for i in range(args.requests):
+            http.post(f'http://127.0.0.1:{port}/checkout/transactions', json={
+                'items': [{'product_id': 1 + i % 20, 'quantity': 1}, {'product_id': 1 + (i * 7) % 20, 'quantity': 2}],
+                'total_amount': 0,
+                'payment_method': 'cash'
+            })
+        server.shutdown()
+        logging.getLogger().removeHandler(counter)
+        with app.app_context():
+            db.engine.dispose()
+
+    total = sum(counter.records.values())
+    print(json.dumps({
+        'requests': args.requests,
+        'log_level': logging.getLevelName(logging.getLogger().level),
+        'records_per_request': round(total / args.requests, 2),
+        'bytes_per_request': round(counter.bytes / args.requests, 1),
+        'records_by_logger': dict(counter.records.most_common()),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Micro-benchmarks for serialization and report queries
+
+    python -m bench.micro --products 20000 --repeat 5
+
+Runs against a fresh synthetic dataset (or --database-url) and times, in
+process and without HTTP, the model to_dict() serializers and each report
+view. Prints JSON with the best and median time per case.
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy.orm import joinedload, selectinload
+
+REPORT_VIEWS = [
+    ('reports.sales_summary', '/reports/sales/summary?period=month'),
+    ('reports.sales_by_category', '/reports/sales/by-category?period=month'),
+    ('reports.top_products', '/reports/sales/top-products?period=month'),
+    ('reports.inventory_status', '/reports/inventory/status'),
+]
+
+
+def timeit(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return {
+        'best_ms': round(min(samples) * 1000, 3),
+        'median_ms': round(statistics.median(samples) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serialization and report query micro-benchmarks')
+    parser.add_argument('--database-url', help='Use this (already seeded) database')
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--transactions-per-day', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    from app import create_app, db
+    from models import Product, StockMovement, Transaction, TransactionItem
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or 'sqlite:///' + os.path.join(tmp, 'micro.db')
+        app = create_app({'SQLALCHEMY_DATABASE_URI': database_url, 'SQL_PROFILER_ENABLED': False})
+        results = {}
+        with app.app_context():
+            if not args.database_url:
+                from synthetic_data import generate_synthetic_data
+                db.create_all()
+                generate_synthetic_data(products=args.products, days=args.days,
+                                        transactions_per_day=args.transactions_per_day, seed=args.seed,
+                                        end_date=datetime.utcnow())
+
+            products = Product.query.all()
+            transactions = Transaction.query.options(
+                selectinload(Transaction.items).joinedload(TransactionItem.product)
+            ).order_by(Transaction.id.desc()).limit(1000).all()
+            movements = StockMovement.query.options(
+                joinedload(StockMovement.product)
+            ).order_by(StockMovement.id.desc()).limit(10000).all()
+
+            results['product.to_dict'] = dict(
+                timeit(lambda: [p.to_dict() for p in products], args.repeat), rows=len(products))
+            results['transaction.to_dict'] = dict(
+                timeit(lambda: [t.to_dict() for t in transactions], args.repeat), rows=len(transactions))
+            results['stock_movement.to_dict'] = dict(
+                timeit(lambda: [m.to_dict() for m in movements], args.repeat), rows=len(movements))
+            db.session.remove()
+
+        for endpoint, path in REPORT_VIEWS:
+            view = app.view_functions[endpoint]
+
+            def call():
+                with app.test_request_context(path):
+                    response = view()
+                    db.session.remove()
+                    return response
+
+            results[path] = timeit(call, args.repeat)
+
+        with app.app_context():
+            db.engine.dispose()
+
+    print(json.dumps({'database': database_url.split('@')[-1], 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Drive the M-PESA initiate/verify flow of a running app and report latency
+
+Start fake_daraja.py and the app pointed at it (see fake_daraja.py), then:
+    python -m bench.mpesa_load --base-url http://127.0.0.1:5000 \\
+        --payments 200 --concurrency 20
+
+Prints JSON with throughput and p50/p95/p99 latency for initiate, each verify
+poll and the end-to-end payment, so runs can be compared across commits.
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from fake_daraja import percentiles
+
+
+def run_payment(base_url, index, poll_interval, poll_timeout):
+    """Initiate one payment and poll verify until it settles"""
+    http = requests.Session()
+    timings = {'initiate': [], 'verify': []}
+    started = time.perf_counter()
+
+    t0 = time.perf_counter()
+    response = http.post(f'{base_url}/mpesa/initiate', json={
+        'phone_number': f'2547{index % 100000000:08d}',
+        'amount': 100 + index % 50,
+        'reference': f'LOAD-{index}'
+    }, timeout=60)
+    timings['initiate'].append(time.perf_counter() - t0)
+    body = response.json()
+    if not body.get('success'):
+        return timings, 'initiate_failed', time.perf_counter() - started
+
+    checkout_request_id = body['data']['checkout_request_id']
+    deadline = time.monotonic() + poll_timeout
+    outcome = 'timeout'
+    while time.monotonic() < deadline:
+        t0 = time.perf_counter()
+        result = http.get(f'{base_url}/mpesa/verify/{checkout_request_id}', timeout=60).json()
+        timings['verify'].append(time.perf_counter() - t0)
+        result_code = (result.get('data') or {}).get('result_code')
+        if result.get('success'):
+            outcome = 'paid'
+            break
+        if result_code is not None and str(result_code) != '0':
+            outcome = 'cancelled'
+            break
+        time.sleep(poll_interval)
+    return timings, outcome, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the M-PESA payment flow')
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--payments', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    parser.add_argument('--poll-timeout', type=float, default=60.0)
+    args = parser.parse_args()
+
+    samples = {'initiate': [], 'verify': [], 'end_to_end': []}
+    outcomes = {}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [
+            pool.submit(run_payment, args.base_url.rstrip('/'), i, args.poll_interval, args.poll_timeout)
+            for i in range(args.payments)
+        ]
+        for future in futures:
+            timings, outcome, total = future.result()
+            samples['initiate'].extend(timings['initiate'])
+            samples['verify'].extend(timings['verify'])
+            samples['end_to_end'].append(total)
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    elapsed = time.perf_counter() - started
+
+    print(json.dumps({
+        'payments': args.payments,
+        'concurrency': args.concurrency,
+        'elapsed_s': round(elapsed, 3),
+        'payments_per_s': round(args.payments / elapsed, 3),
+        'outcomes': outcomes,
+        'latency': {name: percentiles(sorted(values)) for name, values in samples.items()}
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
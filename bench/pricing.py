@@ -0,0 +1,130 @@
+"""
+Time checkout pricing with many active promotions
+
+    python -m bench.pricing --products 20000 --promotions 5000 --baskets 5000
+
+Seeds a throwaway database with products and a mix of percent_off,
+amount_off, multi_buy and bundle promotions on products and categories,
+then prices random baskets through ``pricing_engine()`` as checkout does
+(the promotion version read included). Prints the compile time and
+per-basket latency percentiles as JSON.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from fake_daraja import percentiles
+
+CATEGORIES = 50
+
+
+def seed(products, promotions, rng):
+    from app import db
+    from models import Product, Promotion, PromotionItem
+    from stores import ensure_stores
+
+    db.session.execute(Product.__table__.insert(), [
+        {
+            'barcode': f'88{i:011d}',
+            'name': f'Bench product {i}',
+            'description': '',
+            'price': round(0.5 + rng.random() * 20, 2),
+            'cost_price': 0.4,
+            'category': f'Category {i % CATEGORIES}',
+            'stock_quantity': 1000,
+        }
+        for i in range(1, products + 1)
+    ])
+    rows, items = [], []
+    for promotion_id in range(1, promotions + 1):
+        kind = rng.choice(('percent_off', 'amount_off', 'multi_buy', 'bundle'))
+        row = {'id': promotion_id, 'name': f'Bench promotion {promotion_id}', 'kind': kind, 'product_id': None,
+               'category': None, 'quantity': None, 'active': True}
+        if kind == 'bundle':
+            row['value'] = round(rng.uniform(2, 20), 2)
+            items += [{'promotion_id': promotion_id, 'product_id': product_id, 'quantity': rng.randint(1, 2)}
+                      for product_id in rng.sample(range(1, products + 1), rng.randint(2, 4))]
+        else:
+            # One rule in twenty covers a whole category
+            if rng.random() < 0.05:
+                row['category'] = f'Category {rng.randrange(CATEGORIES)}'
+            else:
+                row['product_id'] = rng.randint(1, products)
+            row['value'] = {'percent_off': rng.choice((5, 10, 25)), 'amount_off': 0.2,
+                            'multi_buy': round(rng.uniform(2, 30), 2)}[kind]
+            if kind == 'multi_buy':
+                row['quantity'] = rng.randint(2, 4)
+        rows.append(row)
+    db.session.execute(Promotion.__table__.insert(), rows)
+    if items:
+        db.session.execute(PromotionItem.__table__.insert(), items)
+    # The bulk-inserted stock belongs to the default store
+    ensure_stores()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Checkout pricing benchmark')
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--promotions', type=int, default=5000)
+    parser.add_argument('--baskets', type=int, default=5000)
+    parser.add_argument('--lines', type=int, default=20, help='Lines per basket')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    from app import create_app, db
+    from models import Product
+    from pricing import bump_version, pricing_engine
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tmp, 'pricing.db'),
+                          'SQL_PROFILER_ENABLED': False})
+        with app.app_context():
+            db.create_all()
+            seed(args.products, args.promotions, rng)
+            catalog = db.session.execute(
+                db.select(Product.id, Product.category, Product.price).order_by(Product.id)
+            ).all()
+
+            started = time.perf_counter()
+            engine = pricing_engine()
+            compile_ms = round((time.perf_counter() - started) * 1000, 3)
+
+            # Popular products sell more, as in a real store
+            weights = [1 / rank for rank in range(1, len(catalog) + 1)]
+            samples, discounted = [], 0
+            for _ in range(args.baskets):
+                lines = [(product_id, category, price, rng.randint(1, 4))
+                         for product_id, category, price in rng.choices(catalog, weights, k=args.lines)]
+                # Checkout has its transaction open by the time it prices
+                db.session.connection()
+                started = time.perf_counter()
+                priced = pricing_engine().price(lines)
+                samples.append(time.perf_counter() - started)
+                discounted += sum(1 for _, promotion_id in priced if promotion_id is not None)
+                db.session.rollback()
+
+            # A promotion write makes the next sale recompile
+            bump_version(db.session)
+            db.session.commit()
+            started = time.perf_counter()
+            pricing_engine()
+            recompile_ms = round((time.perf_counter() - started) * 1000, 3)
+            db.engine.dispose()
+
+    print(json.dumps({
+        'products': args.products,
+        'promotions': engine.rules,
+        'lines_per_basket': args.lines,
+        'compile_ms': compile_ms,
+        'recompile_ms': recompile_ms,
+        'discounted_lines': round(discounted / (args.baskets * args.lines), 3),
+        'per_basket': percentiles(sorted(samples)),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Check read/write routing against a local second database
+
+    python -m bench.replica_harness
+
+Builds a primary SQLite database and a lagging copy used as the replica,
+then verifies that report and history views read from the replica, that
+writes and other views use the primary, that READ_YOUR_WRITES_SECONDS pins a
+writing client to the primary, and that SQLITE_READONLY_REPLICA opens a
+read-only connection. Exits non-zero if any check fails.
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+
+CHECKS = []
+
+
+def check(name, condition, detail=''):
+    CHECKS.append(condition)
+    print(f"{'PASS' if condition else 'FAIL'}  {name}{f' ({detail})' if detail and not condition else ''}")
+
+
+def make_app(primary, **overrides):
+    from app import create_app
+    return create_app(dict({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{primary}'}, **overrides))
+
+
+def copy_database(source, target):
+    """Snapshot the primary into the replica file, like a replication catch-up"""
+    with sqlite3.connect(source) as src, sqlite3.connect(target) as dst:
+        src.backup(dst)
+
+
+def transaction_count(path):
+    with sqlite3.connect(path) as connection:
+        return connection.execute('SELECT COUNT(*) FROM "transaction"').fetchone()[0]
+
+
+def sell(client, product_id=1):
+    response = client.post('/checkout/transactions', json={
+        'items': [{'product_id': product_id, 'quantity': 1}],
+        'total_amount': 0,
+        'payment_method': 'cash'
+    })
+    return response.status_code
+
+
+def main():
+    from app import db
+    from models import populate_sample_data
+
+    with tempfile.TemporaryDirectory() as tmp:
+        primary = os.path.join(tmp, 'primary.db')
+        replica = os.path.join(tmp, 'replica.db')
+
+        app = make_app(primary, SQLALCHEMY_REPLICA_URI=f'sqlite:///{replica}')
+        with app.app_context():
+            db.create_all()
+            populate_sample_data()
+            db.engine.dispose()
+        copy_database(primary, replica)
+
+        client = app.test_client()
+        check('checkout writes succeed', sell(client) == 201)
+        primary_count, replica_count = transaction_count(primary), transaction_count(replica)
+        check('write reached the primary only', primary_count == replica_count + 1,
+              f'primary={primary_count} replica={replica_count}')
+
+        listed = len(client.get('/checkout/transactions').get_json()['transactions'])
+        check('transaction history reads the replica', listed == replica_count, f'listed={listed}')
+
+        summary = client.get('/reports/sales/summary').get_json()['data']['sales']
+        check('reports read the replica', summary['total_transactions'] == replica_count,
+              f"reported={summary['total_transactions']}")
+
+        product = client.get('/inventory/products/1').get_json()['product']
+        with sqlite3.connect(primary) as connection:
+            stock = connection.execute('SELECT stock_quantity FROM product WHERE id = 1').fetchone()[0]
+        check('unmarked views read the primary', product['stock_quantity'] == stock)
+
+        # Read-your-writes window
+        app = make_app(primary, SQLALCHEMY_REPLICA_URI=f'sqlite:///{replica}', READ_YOUR_WRITES_SECONDS=30)
+        writer, other = app.test_client(), app.test_client()
+        sell(writer)
+        primary_count = transaction_count(primary)
+        listed = len(writer.get('/checkout/transactions').get_json()['transactions'])
+        check('writer sees its own sale within the window', listed == min(primary_count, 50), f'listed={listed}')
+        listed = len(other.get('/checkout/transactions').get_json()['transactions'])
+        check('other clients still read the replica', listed == replica_count, f'listed={listed}')
+
+        # Read-only connection to the primary file
+        app = make_app(primary, SQLITE_READONLY_REPLICA=True)
+        client = app.test_client()
+        summary = client.get('/reports/sales/summary').get_json()
+        check('read-only SQLite replica serves reports', summary['success'])
+        with app.app_context():
+            try:
+                with db.engines['replica'].begin() as connection:
+                    connection.execute(db.text("UPDATE product SET stock_quantity = stock_quantity WHERE id = 1"))
+                rejected = False
+            except Exception:
+                rejected = True
+            db.engine.dispose()
+            db.engines['replica'].dispose()
+        check('read-only SQLite replica rejects writes', rejected)
+
+    return 0 if all(CHECKS) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
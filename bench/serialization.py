@@ -0,0 +1,86 @@
+"""
+Benchmark the product listing's serialization
+
+    python -m bench.serialization --products 100000 --repeat 5
+
+Seeds a catalog (or uses --database-url) and times, in process, building
+and encoding the /inventory/products payload four ways: ORM instances with
+to_dict() and the stdlib encoder (the old path), column tuples with the
+stdlib encoder, column tuples with orjson, and the checkout grid's
+?fields= projection with orjson. Prints JSON with build and encode time and
+payload size per case.
+"""
+import argparse
+import json
+import os
+import tempfile
+from datetime import datetime
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import select
+
+from bench.micro import timeit
+from serializers import OrjsonProvider, orjson
+
+GRID_FIELDS = 'id,name,price,category,stock_quantity'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Product listing serialization benchmark')
+    parser.add_argument('--database-url', help='Use this (already seeded) database')
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    if orjson is None:
+        parser.error('orjson is not installed')
+
+    from app import create_app, db
+    from models import Product, product_rows
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or 'sqlite:///' + os.path.join(tmp, 'serialization.db')
+        app = create_app({'SQLALCHEMY_DATABASE_URI': database_url, 'SQL_PROFILER_ENABLED': False})
+        stdlib, fast = DefaultJSONProvider(app), OrjsonProvider(app)
+
+        def orm_rows(fields):
+            db.session.expunge_all()
+            return [product.to_dict() for product in Product.query.order_by(Product.id)]
+
+        def tuple_rows(fields):
+            names = product_rows.parse_fields(fields)
+            return product_rows.serialize(
+                names, db.session.execute(select(*product_rows.columns(names)).order_by(Product.id)))
+
+        cases = [
+            ('orm_to_dict+stdlib', orm_rows, stdlib, None),
+            ('columns+stdlib', tuple_rows, stdlib, None),
+            ('columns+orjson', tuple_rows, fast, None),
+            ('columns+orjson+grid_fields', tuple_rows, fast, GRID_FIELDS),
+        ]
+
+        results = {}
+        with app.app_context():
+            if not args.database_url:
+                from synthetic_data import generate_synthetic_data
+                db.create_all()
+                generate_synthetic_data(products=args.products, days=1, transactions_per_day=0,
+                                        seed=args.seed, end_date=datetime.utcnow(), stock_movements=False)
+
+            for name, build, provider, fields in cases:
+                payload = {'success': True, 'products': build(fields)}
+                body = provider.dumps(payload, separators=(',', ':'))
+                results[name] = {
+                    'rows': len(payload['products']),
+                    'bytes': len(body.encode()),
+                    'build': timeit(lambda: build(fields), args.repeat),
+                    'encode': timeit(lambda: provider.dumps(payload, separators=(',', ':')), args.repeat),
+                }
+            db.session.remove()
+            db.engine.dispose()
+
+    print(json.dumps({'products': args.products, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Measure application cold start and preloaded worker fork time
+
+    python -m bench.startup --runs 5
+
+cold_start: fresh interpreter importing main (what every non-preloaded
+gunicorn worker and every CLI invocation pays).
+fork_first_request: fork of a process that already built the app, up to the
+child's first served request (what a gunicorn --preload worker pays).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from fake_daraja import percentiles
+
+COLD_START_SNIPPET = (
+    "import time; t = time.perf_counter(); import main; "
+    "print(time.perf_counter() - t)"
+)
+
+
+def measure_cold_start(runs):
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', COLD_START_SNIPPET],
+            capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(float(output.strip().splitlines()[-1]))
+    return samples
+
+
+def measure_fork(runs, path):
+    from main import app
+
+    samples = []
+    for _ in range(runs):
+        read_fd, write_fd = os.pipe()
+        started = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            status = app.test_client().get(path).status_code
+            os.write(write_fd, str(status).encode())
+            os._exit(0)
+        os.close(write_fd)
+        status = os.read(read_fd, 16)
+        samples.append(time.perf_counter() - started)
+        os.close(read_fd)
+        os.waitpid(pid, 0)
+        if status != b'200':
+            raise RuntimeError(f'Child request to {path} returned {status!r}')
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cold start and fork time')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--path', default='/inventory/products', help='Request served by each forked child')
+    args = parser.parse_args()
+
+    cold = measure_cold_start(args.runs)
+    fork = measure_fork(args.runs, args.path)
+    print(json.dumps({
+        'cold_start': dict(percentiles(sorted(cold)), median_ms=round(statistics.median(cold) * 1000, 3)),
+        'fork_first_request': dict(percentiles(sorted(fork)), median_ms=round(statistics.median(fork) * 1000, 3)),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Product catalog versioning
+
+Every flush that creates, changes or deletes a Product bumps a single
+catalog version counter and stamps the written rows with it; deletes leave a
+ProductTombstone. Catalog views answer If-None-Match with 304 while the
+version is unchanged (``catalog_conditional``), and tills holding a local
+copy fetch only what changed from /inventory/products/changes?since=<version>.
+
+The counter is an UPDATE on one row, so concurrent product writes commit in
+version order and a till can never skip a change. Bulk statements that bypass
+the ORM unit of work (executemany inserts or updates) must call
+``bump_version`` themselves and write its result to ``catalog_version``.
+
+Changes to stock_quantity alone do not bump the version: every sale changes
+it, and an UPDATE of the one counter row per sale would serialize checkouts.
+The delta feed therefore carries catalog fields, not stock levels. Every
+stock change writes a StockMovement, so catalog ETags also carry the newest
+movement id, and views showing stock still revalidate after it moves (on
+PostgreSQL a movement committing out of id order can be missed until the
+next one).
+"""
+from functools import wraps
+
+import sqlalchemy as sa
+from flask import current_app, g, make_response, request
+
+from app import db
+from models import CatalogState, Product, ProductTombstone, StockMovement
+from routing import RoutingSession
+
+STATE_ID = 1
+
+# Product columns whose changes alone leave the catalog version alone
+STOCK_FIELDS = frozenset({'stock_quantity', 'updated_at'})
+
+
+def current_version(db_session):
+    """The latest committed catalog version visible to the session (0 before any write)"""
+    version = db_session.execute(
+        sa.select(CatalogState.version).where(CatalogState.id == STATE_ID)
+    ).scalar()
+    return version or 0
+
+
+def current_marks(db_session):
+    """The catalog version and the newest stock movement id, in one query"""
+    row = db_session.execute(sa.select(
+        sa.select(CatalogState.version).where(CatalogState.id == STATE_ID).scalar_subquery(),
+        sa.select(sa.func.max(StockMovement.id)).scalar_subquery()
+    )).one()
+    return row[0] or 0, row[1] or 0
+
+
+def bump_version(db_session):
+    """Increment the catalog version in the session's transaction and return it"""
+    table = CatalogState.__table__
+    connection = db_session.connection()
+    result = connection.execute(
+        table.update().where(table.c.id == STATE_ID).values(version=table.c.version + 1)
+    )
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(id=STATE_ID, version=1))
+        return 1
+    return connection.execute(sa.select(table.c.version).where(table.c.id == STATE_ID)).scalar_one()
+
+
+def _catalog_changed(product):
+    """Whether a loaded product has pending changes other than to its stock"""
+    state = sa.inspect(product)
+    return any(state.attrs[attr.key].history.has_changes()
+               for attr in state.mapper.column_attrs if attr.key not in STOCK_FIELDS)
+
+
+@sa.event.listens_for(RoutingSession, 'before_flush')
+def _stamp_product_writes(db_session, flush_context, instances):
+    written = [obj for obj in db_session.new if isinstance(obj, Product)]
+    written += [obj for obj in db_session.dirty if isinstance(obj, Product) and _catalog_changed(obj)]
+    deleted = [obj for obj in db_session.deleted if isinstance(obj, Product)]
+    if not written and not deleted:
+        return
+
+    version = bump_version(db_session)
+    for product in written:
+        product.catalog_version = version
+    for product in deleted:
+        db_session.add(ProductTombstone(product_id=product.id, catalog_version=version))
+
+
+def catalog_etag(version, stock_mark):
+    return f'catalog-{version}-{stock_mark}'
+
+
+def catalog_conditional(view):
+    """
+    Tag a catalog view's response with the catalog version and answer a
+    matching If-None-Match with 304 without running the view
+
+    The version and stock mark are read before the view's queries, so the
+    body is never older than its ETag. The version is also left in
+    ``g.catalog_version`` for the view.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.catalog_version, stock_mark = current_marks(db.session)
+        etag = catalog_etag(g.catalog_version, stock_mark)
+        if request.if_none_match.contains_weak(etag):
+            response = current_app.response_class(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag, weak=True)
+        # Cache, but revalidate on every use
+        response.cache_control.no_cache = True
+        return response
+    return wrapper
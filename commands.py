@@ -0,0 +1,220 @@
+import os
+
+import click
+
+from app import db
+
+
+def register_commands(app):
+    """Register the database and build CLI commands on the app"""
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create any missing database tables, columns and indexes"""
+        from database import upgrade_schema
+        from stores import ensure_stores
+        db.create_all()
+        for change in upgrade_schema(db.engine, db.metadata):
+            click.echo(change.capitalize())
+        assigned = ensure_stores()
+        if assigned:
+            click.echo(f'Assigned the stock of {assigned} products to the default store.')
+        click.echo('Database schema is up to date.')
+
+    @app.cli.command('seed-sample')
+    def seed_sample_command():
+        """Populate the demo products and transactions if the catalog is empty"""
+        from models import populate_sample_data
+        populate_sample_data()
+        click.echo('Sample data loaded.')
+
+    @app.cli.command('seed-synthetic')
+    @click.option('--products', default=100000, show_default=True, help='Number of SKUs')
+    @click.option('--days', default=90, show_default=True, help='Days of sales history')
+    @click.option('--transactions-per-day', default=2000, show_default=True, help='Average sales per day')
+    @click.option('--seed', default=42, show_default=True, help='Random seed')
+    @click.option('--end-date', type=click.DateTime(formats=['%Y-%m-%d']), help='Last day of history (default today)')
+    @click.option('--zipf', 'zipf_exponent', default=1.1, show_default=True, help='Popularity skew')
+    @click.option('--no-movements', is_flag=True, help='Skip per-line stock movements')
+    @click.option('--stores', default=1, show_default=True, help='Stores to spread sales and stock across')
+    def seed_synthetic_command(products, days, transactions_per_day, seed, end_date, zipf_exponent, no_movements,
+                               stores):
+        """Generate a large deterministic dataset for benchmarking"""
+        from stores import ensure_stores
+        from synthetic_data import generate_synthetic_data
+        db.create_all()
+        ensure_stores()
+        stats = generate_synthetic_data(
+            products=products,
+            days=days,
+            transactions_per_day=transactions_per_day,
+            seed=seed,
+            end_date=end_date,
+            zipf_exponent=zipf_exponent,
+            stock_movements=not no_movements,
+            stores=stores,
+            progress=click.echo
+        )
+        click.echo(', '.join(f'{key}: {value}' for key, value in stats.items()))
+        from replenishment import rebuild_velocity
+        click.echo(f'Reorder plans built for {rebuild_velocity()} products.')
+
+    @app.cli.command('add-store')
+    @click.argument('code')
+    @click.argument('name')
+    def add_store_command(code, name):
+        """Add a store to the chain; requests select it with the X-Store-Id header"""
+        from models import Store
+        if db.session.query(Store.id).filter_by(code=code).first() is not None:
+            raise click.BadParameter(f'Store {code} already exists', param_hint='CODE')
+        store = Store(code=code, name=name)
+        db.session.add(store)
+        db.session.commit()
+        click.echo(f'Added store {store.id} ({code}).')
+
+    @app.cli.command('build-assets')
+    @click.option('--icon', default='generated-icon.png', show_default=True,
+                  help='PNG to render into favicons (empty to skip)')
+    def build_assets_command(icon):
+        """Write fingerprinted, precompressed static assets to static/dist"""
+        from assets import build_assets
+        icon_path = os.path.join(app.root_path, icon) if icon else None
+        if icon_path and not os.path.isfile(icon_path):
+            raise click.BadParameter(f'{icon_path} not found', param_hint='--icon')
+        manifest = build_assets(app.static_folder, icon_path, log=click.echo)
+        click.echo(f'{len(manifest)} assets written; restart the app to serve them.')
+
+    @app.cli.command('checkpoint-stock')
+    @click.option('--as-of', help='ISO 8601 date or UTC timestamp (default: midnight UTC today)')
+    def checkpoint_stock_command(as_of):
+        """Record every product's ledger stock, so as-of queries stay fast (run nightly)"""
+        from datetime import datetime
+        from stock_ledger import create_checkpoint, parse_as_of
+        try:
+            when = parse_as_of(as_of) or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+            count = create_checkpoint(when)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint='--as-of')
+        click.echo(f'Checkpointed stock for {count} products as of {when.isoformat()}.')
+
+    @app.cli.command('reconcile-stock')
+    @click.option('--fix', is_flag=True, help='Book adjustment movements so the ledger matches stock')
+    @click.option('--show', default=20, show_default=True, help='Drifted products to list')
+    def reconcile_stock_command(fix, show):
+        """Report products whose stock differs from the sum of their stock movements"""
+        from stock_ledger import reconcile
+        drifted = reconcile(fix=fix)
+        if not drifted:
+            click.echo('Stock ledger matches stock levels for every product.')
+            return
+        for row in drifted[:show]:
+            click.echo(f"{row['product_id']:>8}  {row['name'][:40]:<40}  stock {row['stock_quantity']:>7}  "
+                       f"ledger {row['ledger_quantity']:>7}  drift {row['drift']:+}")
+        if len(drifted) > show:
+            click.echo(f'... and {len(drifted) - show} more')
+        total = sum(abs(row['drift']) for row in drifted)
+        action = 'Booked adjustments for' if fix else 'Found'
+        click.echo(f'{action} {len(drifted)} drifted products ({total} units in total).')
+        if not fix:
+            raise SystemExit(1)
+
+    @app.cli.command('refresh-reorder')
+    @click.option('--rebuild', is_flag=True, help='Recompute sales velocity from the full sales history')
+    def refresh_reorder_command(rebuild):
+        """Bring reorder plans up to date (run nightly; --rebuild after bulk imports)"""
+        from replenishment import rebuild_velocity, refresh_products
+        if rebuild:
+            count = rebuild_velocity()
+        else:
+            count = refresh_products()
+            db.session.commit()
+        click.echo(f'Reorder plans refreshed for {count} products.')
+
+    @app.cli.command('forecast-demand')
+    @click.option('--history-days', type=int, help='Days of sales history to fit [FORECAST_HISTORY_DAYS]')
+    @click.option('--horizon', type=int, help='Days to forecast [FORECAST_HORIZON_DAYS]')
+    @click.option('--workers', type=int, help='Processes to fit with [FORECAST_WORKERS]')
+    def forecast_demand_command(history_days, horizon, workers):
+        """Forecast next week's demand for every product (run nightly)"""
+        from forecasting import run_forecast
+        run = run_forecast(
+            history_days=history_days or app.config['FORECAST_HISTORY_DAYS'],
+            horizon=horizon or app.config['FORECAST_HORIZON_DAYS'],
+            workers=workers or app.config['FORECAST_WORKERS'],
+            log=click.echo
+        )
+        click.echo(f'Forecast run {run.id}: {run.products} products from {run.first_day.isoformat()} '
+                   f'in {run.elapsed_seconds}s.')
+
+    @app.cli.command('archive-history')
+    @click.option('--keep-months', type=int, help='Months kept live, counting this one [ARCHIVE_KEEP_MONTHS]')
+    def archive_history_command(keep_months):
+        """Move closed months of sales and stock movements to the archive tables"""
+        from archive import archive_history
+        try:
+            periods = archive_history(keep_months or app.config['ARCHIVE_KEEP_MONTHS'], log=click.echo)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint='--keep-months')
+        click.echo(f'Archived {len(periods)} months.' if periods else 'Nothing to archive.')
+
+    @app.cli.command('dispatch-events')
+    @click.option('--consumer', required=True, help='Name the offset is kept under, e.g. loyalty')
+    @click.option('--sink', required=True, help='file:<path>, webhook:<url> or queue:<directory>')
+    @click.option('--batch-size', type=int, help='Events per batch [OUTBOX_BATCH_SIZE]')
+    @click.option('--follow', is_flag=True, help='Keep polling for new events until interrupted')
+    def dispatch_events_command(consumer, sink, batch_size, follow):
+        """Publish the events a consumer has not been sent yet to a sink"""
+        import requests
+        from outbox import make_sink, run_dispatcher
+        try:
+            target = make_sink(sink, app.config)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint='--sink')
+        try:
+            sent = run_dispatcher(
+                consumer, target,
+                batch_size=batch_size or app.config['OUTBOX_BATCH_SIZE'],
+                follow=follow,
+                poll_seconds=app.config['OUTBOX_POLL_SECONDS'],
+                log=click.echo
+            )
+        except (OSError, requests.RequestException) as e:
+            raise click.ClickException(f'Sink failed; {consumer} will resume from its last offset: {e}')
+        click.echo(f'Sent {sent} events to {consumer}.')
+
+    @app.cli.command('prune-events')
+    @click.option('--days', type=int, help='Keep events this many days [OUTBOX_RETENTION_DAYS]')
+    def prune_events_command(days):
+        """Delete old events that every consumer has been sent"""
+        from datetime import datetime, timedelta
+        from outbox import prune_events
+        days = app.config['OUTBOX_RETENTION_DAYS'] if days is None else days
+        count = prune_events(datetime.utcnow() - timedelta(days=days))
+        click.echo(f'Deleted {count} events.')
+
+    @app.cli.command('sweep-reservations')
+    @click.option('--follow', is_flag=True, help='Keep sweeping every --interval seconds until interrupted')
+    @click.option('--interval', type=float, default=15, show_default=True, help='Seconds between sweeps with --follow')
+    def sweep_reservations_command(follow, interval):
+        """Give back the stock of reservations whose payments never completed"""
+        import time
+        from reservations import sweep_expired
+        while True:
+            count = sweep_expired()
+            db.session.commit()
+            if count or not follow:
+                click.echo(f'Expired {count} reservations.')
+            if not follow:
+                break
+            time.sleep(interval)
+
+    @app.cli.command('close-tills')
+    @click.option('--store', 'store_id', type=int, help='Only close tills of this store id')
+    def close_tills_command(store_id):
+        """End-of-day close: take the Z-report of every open till session"""
+        from tills import close_open_sessions
+        reports = close_open_sessions(store_id)
+        for report in reports:
+            click.echo(f'Closed till {report.till} at store {report.store_id} ({report.cashier_name}): '
+                       f'{report.transaction_count} sales, {report.total_amount:.2f}; Z-report {report.id}')
+        click.echo(f'Closed {len(reports)} till sessions.')
@@ -0,0 +1,74 @@
+"""
+Negotiated response compression
+
+Compresses JSON, HTML, CSS and JavaScript responses larger than
+COMPRESS_MIN_SIZE with brotli (when the Brotli package is installed and the
+client accepts it) or gzip. Streamed and file responses are left alone;
+fingerprinted static assets are precompressed by ``flask build-assets``
+instead (see assets.py).
+"""
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/javascript',
+    'text/html',
+    'text/css',
+    'text/plain',
+    'text/javascript',
+    'image/svg+xml',
+}
+
+
+def choose_encoding(accept_encodings):
+    """Best supported content coding from a parsed Accept-Encoding header, or None"""
+    candidates = ['br', 'gzip'] if brotli is not None else ['gzip']
+    best = accept_encodings.best_match(candidates)
+    if best is None or accept_encodings[best] <= 0:
+        return None
+    return best
+
+
+def compress(data, encoding, config):
+    """Compress bytes with the given content coding"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=config['COMPRESS_BROTLI_QUALITY'])
+    return gzip.compress(data, compresslevel=config['COMPRESS_LEVEL'], mtime=0)
+
+
+def init_compression(app):
+    """Compress eligible responses according to the request's Accept-Encoding"""
+    if not app.config.get('COMPRESS_ENABLED'):
+        return
+
+    min_size = app.config['COMPRESS_MIN_SIZE']
+
+    @app.after_request
+    def compress_response(response):
+        if (response.direct_passthrough
+                or response.status_code < 200 or response.status_code in (204, 206, 304)
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES
+                or 'Content-Encoding' in response.headers):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        if (response.content_length or 0) < min_size:
+            return response
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        response.set_data(compress(response.get_data(), encoding, app.config))
+        response.headers['Content-Encoding'] = encoding
+        # A strong ETag names the uncompressed bytes, so it must not be reused
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,113 @@
+import os
+
+from logging_config import parse_levels
+
+
+def _database_url():
+    """DATABASE_URL from the environment, defaulting to SQLite in the working directory"""
+    url = os.environ.get("DATABASE_URL")
+    if not url:
+        return "sqlite:////" + os.path.join(os.getcwd(), "supermarket.db")
+    # Hosting providers still hand out the scheme SQLAlchemy 1.4+ rejects
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    return url
+
+
+class Config:
+    """Default application configuration, overridable via create_app(config)"""
+
+    SECRET_KEY = os.environ.get("SESSION_SECRET", "dev_secret_key")
+
+    SQLALCHEMY_DATABASE_URI = _database_url()
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Read replica for reports and history views (see routing.py). Without a
+    # replica URL, SQLITE_READONLY_REPLICA opens the primary file read-only.
+    SQLALCHEMY_REPLICA_URI = os.environ.get("DATABASE_REPLICA_URL")
+    SQLITE_READONLY_REPLICA = os.environ.get("SQLITE_READONLY_REPLICA", "").lower() in ("1", "true", "yes")
+    # Keep a client on the primary this many seconds after it writes (0 = off)
+    READ_YOUR_WRITES_SECONDS = float(os.environ.get("READ_YOUR_WRITES_SECONDS", "0"))
+
+    # Connection pool (server databases and file-backed SQLite)
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+
+    # PRAGMAs applied to every new SQLite connection
+    SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+    # Per-request SQL profiling (see profiler.py)
+    SQL_PROFILER_ENABLED = os.environ.get("SQL_PROFILER_ENABLED", "1").lower() in ("1", "true", "yes")
+    SQL_SLOW_QUERY_MS = float(os.environ.get("SQL_SLOW_QUERY_MS", "100"))
+    SQL_N_PLUS_ONE_THRESHOLD = int(os.environ.get("SQL_N_PLUS_ONE_THRESHOLD", "5"))
+    # Default query budget for views without @query_budget (0 = unlimited)
+    SQL_QUERY_BUDGET = int(os.environ.get("SQL_QUERY_BUDGET", "0"))
+    # Raise QueryBudgetExceeded instead of logging; for tests and CI
+    SQL_PROFILER_STRICT = os.environ.get("SQL_PROFILER_STRICT", "").lower() in ("1", "true", "yes")
+
+    # Prometheus /metrics endpoint and request instrumentation (see metrics.py)
+    METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1").lower() in ("1", "true", "yes")
+
+    # Logging (see logging_config.py): root level, per-logger overrides such as
+    # "sqlalchemy.engine=INFO,routes.checkout=DEBUG", and "json" or "text" output
+    LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+    LOG_LEVELS = parse_levels(os.environ.get("LOG_LEVELS"))
+    LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+
+    # JSON encoder for API responses: "orjson" (used when installed) or "default"
+    JSON_PROVIDER = os.environ.get("JSON_PROVIDER", "orjson")
+
+    # Response compression (see compression.py): gzip, or brotli when installed
+    COMPRESS_ENABLED = os.environ.get("COMPRESS_ENABLED", "1").lower() in ("1", "true", "yes")
+    COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", "1024"))
+    COMPRESS_LEVEL = int(os.environ.get("COMPRESS_LEVEL", "6"))
+    COMPRESS_BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", "4"))
+
+    # Cache lifetime for fingerprinted files under /static/dist (see assets.py)
+    ASSET_MAX_AGE = int(os.environ.get("ASSET_MAX_AGE", str(365 * 24 * 3600)))
+
+    # Reorder planning (see replenishment.py): sales velocity half-life, and
+    # default supplier lead time, safety stock and order cycle, in days
+    VELOCITY_HALF_LIFE_DAYS = float(os.environ.get("VELOCITY_HALF_LIFE_DAYS", "14"))
+    REORDER_LEAD_TIME_DAYS = int(os.environ.get("REORDER_LEAD_TIME_DAYS", "7"))
+    REORDER_SAFETY_DAYS = int(os.environ.get("REORDER_SAFETY_DAYS", "3"))
+    REORDER_CYCLE_DAYS = int(os.environ.get("REORDER_CYCLE_DAYS", "14"))
+
+    # Demand forecasting (see forecasting.py): days of sales history fitted,
+    # days forecast, and processes used to fit (1 = in process)
+    FORECAST_HISTORY_DAYS = int(os.environ.get("FORECAST_HISTORY_DAYS", "84"))
+    FORECAST_HORIZON_DAYS = int(os.environ.get("FORECAST_HORIZON_DAYS", "7"))
+    FORECAST_WORKERS = int(os.environ.get("FORECAST_WORKERS", "1"))
+
+    # Months of sales and stock history kept in the live tables, counting the
+    # current one; older whole months are moved by flask archive-history
+    ARCHIVE_KEEP_MONTHS = int(os.environ.get("ARCHIVE_KEEP_MONTHS", "3"))
+
+    # Threads used to run per-store queries of chain-wide reports (see stores.py)
+    STORE_FANOUT_WORKERS = int(os.environ.get("STORE_FANOUT_WORKERS", "4"))
+
+    # Change stream (see outbox.py): events per dispatched or pulled batch, age
+    # an event must reach before it is read, webhook sink timeout in seconds,
+    # dispatcher poll interval, and days consumed events are kept
+    OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", "500"))
+    OUTBOX_SETTLE_SECONDS = float(os.environ.get("OUTBOX_SETTLE_SECONDS", "1"))
+    OUTBOX_WEBHOOK_TIMEOUT = float(os.environ.get("OUTBOX_WEBHOOK_TIMEOUT", "10"))
+    OUTBOX_POLL_SECONDS = float(os.environ.get("OUTBOX_POLL_SECONDS", "1"))
+    OUTBOX_RETENTION_DAYS = int(os.environ.get("OUTBOX_RETENTION_DAYS", "7"))
+
+    # Offset of the stores' local time from UTC, for promotions' daily hours (see pricing.py)
+    PROMOTION_UTC_OFFSET_HOURS = float(os.environ.get("PROMOTION_UTC_OFFSET_HOURS", "0"))
+
+    # Seconds a basket's stock stays held for an M-PESA payment before the
+    # sweeper gives it back (see reservations.py)
+    RESERVATION_TTL_SECONDS = int(os.environ.get("RESERVATION_TTL_SECONDS", "180"))
+
+    # Receipts kept rendered per worker process, and the characters per line
+    # of text and ESC/POS receipts (42 suits 80 mm thermal paper, 32 suits 58 mm)
+    RECEIPT_CACHE_SIZE = int(os.environ.get("RECEIPT_CACHE_SIZE", "1000"))
+    RECEIPT_WIDTH = int(os.environ.get("RECEIPT_WIDTH", "42"))
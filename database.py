@@ -0,0 +1,98 @@
+"""
+Engine configuration for the supported database backends
+
+SQLite connections get WAL journaling, a busy timeout, synchronous=NORMAL
+and memory-mapped I/O so concurrent tills do not serialize on the rollback
+journal. PostgreSQL gets a sized, pre-pinged LIFO pool.
+"""
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.schema import CreateColumn
+
+
+def engine_options(config):
+    """Build SQLALCHEMY_ENGINE_OPTIONS for the configured database URL"""
+    url = make_url(config["SQLALCHEMY_DATABASE_URI"])
+    options = dict(config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+
+    if url.get_backend_name() == "sqlite":
+        if url.database in (None, "", ":memory:"):
+            # In-memory databases use a single static connection
+            return options
+        options.setdefault("pool_size", config["DB_POOL_SIZE"])
+        options.setdefault("max_overflow", config["DB_MAX_OVERFLOW"])
+        options.setdefault("pool_timeout", config["DB_POOL_TIMEOUT"])
+        options.setdefault("connect_args", {}).setdefault("timeout", config["SQLITE_BUSY_TIMEOUT_MS"] / 1000.0)
+        return options
+
+    options.setdefault("pool_size", config["DB_POOL_SIZE"])
+    options.setdefault("max_overflow", config["DB_MAX_OVERFLOW"])
+    options.setdefault("pool_timeout", config["DB_POOL_TIMEOUT"])
+    options.setdefault("pool_recycle", config["DB_POOL_RECYCLE"])
+    options.setdefault("pool_pre_ping", True)
+    # Reuse the most recently returned connection so idle extras can be recycled
+    options.setdefault("pool_use_lifo", True)
+    if url.get_backend_name() == "postgresql":
+        options.setdefault("connect_args", {}).setdefault("application_name", "supermarket-manager")
+    return options
+
+
+def configure_engine(engine, config):
+    """Attach per-connection setup to an engine created by Flask-SQLAlchemy"""
+    if engine.dialect.name != "sqlite":
+        return
+
+    pragmas = [
+        f"PRAGMA busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA synchronous = {config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA mmap_size = {int(config['SQLITE_MMAP_SIZE'])}",
+    ]
+    journal_mode = config["SQLITE_JOURNAL_MODE"]
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            # journal_mode is persistent for WAL but must run outside a transaction
+            if journal_mode and not _is_memory_or_readonly(engine.url):
+                cursor.execute(f"PRAGMA journal_mode = {journal_mode}")
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+def _is_memory_or_readonly(url):
+    return url.database in (None, "", ":memory:") or url.query.get("mode") == "ro"
+
+
+def upgrade_schema(engine, metadata):
+    """
+    Add columns and indexes the models define but an existing database lacks
+
+    create_all() only creates whole tables, so databases created before a
+    model gained a column need it added in place. Only additive changes are
+    made; new NOT NULL columns must have a server_default.
+
+    Returns:
+        list: A description of each change applied
+    """
+    inspector = inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+    changes = []
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                    connection.exec_driver_sql(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}")
+                    changes.append(f"added column {table.name}.{column.name}")
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(connection)
+                    changes.append(f"added index {index.name}")
+    return changes
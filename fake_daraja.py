@@ -0,0 +1,340 @@
+"""
+Local stand-in for the Safaricom Daraja API
+
+Serves the OAuth, STK push and STK query endpoints used by MpesaIntegration
+and delivers asynchronous payment callbacks, so the real HTTP payment path can
+be exercised and load-tested without network access.
+
+Usage:
+    python fake_daraja.py --port 8090 --latency-ms 150 --jitter-ms 100 \\
+        --error-rate 0.01 --failure-rate 0.1 --callback-delay 3
+
+Then start the app with:
+    MPESA_API_BASE_URL=http://127.0.0.1:8090 MPESA_CONSUMER_KEY=fake \\
+    MPESA_CONSUMER_SECRET=fake MPESA_PASS_KEY=fake \\
+    MPESA_CALLBACK_URL=http://127.0.0.1:5000/mpesa/callback python main.py
+"""
+import argparse
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+from flask import Flask, jsonify, request
+
+logger = logging.getLogger(__name__)
+
+# Result code Daraja uses when the customer cancels the STK prompt
+RESULT_CANCELLED = 1032
+
+
+class FakeDarajaSettings:
+    """Tunable behaviour of the fake server"""
+
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, failure_rate=0.0,
+                 callback_delay=2.0, callback_url=None, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.failure_rate = failure_rate
+        self.callback_delay = callback_delay
+        self.callback_url = callback_url
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def roll(self, rate):
+        with self.lock:
+            return self.random.random() < rate
+
+    def delay(self):
+        """Sleep for the configured latency plus uniform jitter"""
+        with self.lock:
+            jitter = self.random.uniform(0, self.jitter_ms) if self.jitter_ms else 0
+        total = (self.latency_ms + jitter) / 1000.0
+        if total > 0:
+            time.sleep(total)
+
+
+class LatencyRecorder:
+    """Thread-safe store of observed durations, reported as percentiles"""
+
+    def __init__(self):
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            self._samples.setdefault(name, []).append(seconds)
+
+    def summary(self):
+        with self._lock:
+            snapshot = {name: sorted(values) for name, values in self._samples.items()}
+        return {name: percentiles(values) for name, values in snapshot.items()}
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+
+def percentiles(sorted_values):
+    """Count, mean and p50/p95/p99/max in milliseconds for sorted durations"""
+    if not sorted_values:
+        return {'count': 0}
+
+    def pick(q):
+        index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+        return round(sorted_values[index] * 1000, 3)
+
+    return {
+        'count': len(sorted_values),
+        'mean_ms': round(sum(sorted_values) / len(sorted_values) * 1000, 3),
+        'p50_ms': pick(0.50),
+        'p95_ms': pick(0.95),
+        'p99_ms': pick(0.99),
+        'max_ms': round(sorted_values[-1] * 1000, 3),
+    }
+
+
+class CallbackScheduler:
+    """
+    Delivers callbacks after a delay using one timer thread and a small
+    delivery pool, rather than one sleeping thread per payment
+    """
+
+    def __init__(self, recorder, workers=8):
+        self._recorder = recorder
+        self._queue = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='daraja-callback')
+        self._http = requests.Session()
+        self._thread = threading.Thread(target=self._run, name='daraja-scheduler', daemon=True)
+        self._thread.start()
+
+    def schedule(self, delay, url, payload, on_delivered=None):
+        with self._cond:
+            heapq.heappush(self._queue, (time.monotonic() + delay, next(self._sequence), url, payload, on_delivered))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                due = self._queue[0][0]
+                now = time.monotonic()
+                if due > now:
+                    self._cond.wait(due - now)
+                    continue
+                _, _, url, payload, on_delivered = heapq.heappop(self._queue)
+            self._pool.submit(self._deliver, url, payload, on_delivered)
+
+    def _deliver(self, url, payload, on_delivered):
+        started = time.perf_counter()
+        try:
+            response = self._http.post(url, json=payload, timeout=30)
+            self._recorder.record('callback', time.perf_counter() - started)
+            if response.status_code != 200:
+                logger.warning("Callback to %s returned %s", url, response.status_code)
+        except requests.RequestException as e:
+            self._recorder.record('callback_error', time.perf_counter() - started)
+            logger.warning("Callback to %s failed: %s", url, e)
+        if on_delivered:
+            on_delivered()
+
+
+def create_fake_daraja_app(settings=None):
+    """Build the fake Daraja Flask application"""
+    settings = settings or FakeDarajaSettings()
+    recorder = LatencyRecorder()
+    scheduler = CallbackScheduler(recorder)
+    tokens = set()
+    payments = {}
+    state_lock = threading.Lock()
+
+    app = Flask(__name__)
+    app.config['DARAJA_SETTINGS'] = settings
+    app.config['DARAJA_RECORDER'] = recorder
+
+    def error(status, code, message):
+        return jsonify({
+            'requestId': uuid.uuid4().hex,
+            'errorCode': code,
+            'errorMessage': message
+        }), status
+
+    def authorized():
+        header = request.headers.get('Authorization', '')
+        if not header.startswith('Bearer '):
+            return False
+        with state_lock:
+            return header[len('Bearer '):] in tokens
+
+    @app.before_request
+    def start_timer():
+        request.environ['fake_daraja.started'] = time.perf_counter()
+
+    @app.after_request
+    def record_latency(response):
+        started = request.environ.get('fake_daraja.started')
+        if started is not None and request.endpoint and not request.path.startswith('/__fake'):
+            recorder.record(request.endpoint, time.perf_counter() - started)
+        return response
+
+    @app.route('/oauth/v1/generate', methods=['GET'])
+    def generate_token():
+        settings.delay()
+        if not request.headers.get('Authorization', '').startswith('Basic '):
+            return error(400, '400.008.01', 'Invalid Authentication passed')
+        if settings.roll(settings.error_rate):
+            return error(500, '500.001.1001', 'Simulated upstream error')
+        token = uuid.uuid4().hex
+        with state_lock:
+            tokens.add(token)
+        return jsonify({'access_token': token, 'expires_in': '3599'})
+
+    @app.route('/mpesa/stkpush/v1/processrequest', methods=['POST'])
+    def stk_push():
+        settings.delay()
+        if not authorized():
+            return error(401, '404.001.03', 'Invalid Access Token')
+        if settings.roll(settings.error_rate):
+            return error(500, '500.001.1001', 'Simulated upstream error')
+
+        data = request.get_json(silent=True) or {}
+        for field in ('BusinessShortCode', 'Password', 'Timestamp', 'Amount', 'PhoneNumber', 'CallBackURL'):
+            if not data.get(field):
+                return error(400, '400.002.02', f'Bad Request - Invalid {field}')
+
+        merchant_request_id = f'{random.randint(10000, 99999)}-{random.randint(1000000, 9999999)}-1'
+        checkout_request_id = f"ws_CO_{datetime.now().strftime('%d%m%Y%H%M%S')}{uuid.uuid4().hex[:12]}"
+        failed = settings.roll(settings.failure_rate)
+        payment = {
+            'merchant_request_id': merchant_request_id,
+            'amount': data['Amount'],
+            'phone_number': data['PhoneNumber'],
+            'result_code': RESULT_CANCELLED if failed else 0,
+            'completed': False
+        }
+        with state_lock:
+            payments[checkout_request_id] = payment
+
+        def mark_completed():
+            with state_lock:
+                payment['completed'] = True
+
+        callback_url = settings.callback_url or data['CallBackURL']
+        scheduler.schedule(settings.callback_delay, callback_url,
+                           callback_payload(checkout_request_id, payment), mark_completed)
+
+        return jsonify({
+            'MerchantRequestID': merchant_request_id,
+            'CheckoutRequestID': checkout_request_id,
+            'ResponseCode': '0',
+            'ResponseDescription': 'Success. Request accepted for processing',
+            'CustomerMessage': 'Success. Request accepted for processing'
+        })
+
+    @app.route('/mpesa/stkpushquery/v1/query', methods=['POST'])
+    def stk_query():
+        settings.delay()
+        if not authorized():
+            return error(401, '404.001.03', 'Invalid Access Token')
+        if settings.roll(settings.error_rate):
+            return error(500, '500.001.1001', 'Simulated upstream error')
+
+        data = request.get_json(silent=True) or {}
+        checkout_request_id = data.get('CheckoutRequestID')
+        with state_lock:
+            payment = payments.get(checkout_request_id)
+            payment = dict(payment) if payment else None
+        if payment is None:
+            return error(400, '400.002.02', 'Bad Request - Invalid CheckoutRequestID')
+        if not payment['completed']:
+            return error(500, '500.001.1001', 'The transaction is being processed')
+
+        return jsonify({
+            'ResponseCode': '0',
+            'ResponseDescription': 'The service request has been accepted successsfully',
+            'MerchantRequestID': payment['merchant_request_id'],
+            'CheckoutRequestID': checkout_request_id,
+            'ResultCode': str(payment['result_code']),
+            'ResultDesc': result_description(payment['result_code'])
+        })
+
+    @app.route('/__fake/stats', methods=['GET'])
+    def stats():
+        """Server-side latency percentiles per endpoint and for callbacks"""
+        with state_lock:
+            pending = sum(1 for p in payments.values() if not p['completed'])
+        return jsonify({'latency': recorder.summary(), 'pending_callbacks': pending})
+
+    @app.route('/__fake/stats', methods=['DELETE'])
+    def reset_stats():
+        recorder.reset()
+        return jsonify({'success': True})
+
+    return app
+
+
+def result_description(result_code):
+    if result_code == 0:
+        return 'The service request is processed successfully.'
+    return 'Request cancelled by user'
+
+
+def callback_payload(checkout_request_id, payment):
+    """Build the stkCallback body Safaricom posts to the CallBackURL"""
+    stk_callback = {
+        'MerchantRequestID': payment['merchant_request_id'],
+        'CheckoutRequestID': checkout_request_id,
+        'ResultCode': payment['result_code'],
+        'ResultDesc': result_description(payment['result_code'])
+    }
+    if payment['result_code'] == 0:
+        stk_callback['CallbackMetadata'] = {
+            'Item': [
+                {'Name': 'Amount', 'Value': payment['amount']},
+                {'Name': 'MpesaReceiptNumber', 'Value': uuid.uuid4().hex[:10].upper()},
+                {'Name': 'TransactionDate', 'Value': int(datetime.now().strftime('%Y%m%d%H%M%S'))},
+                {'Name': 'PhoneNumber', 'Value': int(payment['phone_number'])}
+            ]
+        }
+    return {'Body': {'stkCallback': stk_callback}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local fake Daraja API server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency-ms', type=float, default=0, help='Base latency added to every API call')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='Extra uniform random latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of API calls answered with HTTP 500')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of payments the customer cancels')
+    parser.add_argument('--callback-delay', type=float, default=2.0, help='Seconds before the callback is sent')
+    parser.add_argument('--callback-url', help='Override the CallBackURL sent in STK push requests')
+    parser.add_argument('--seed', type=int, help='Seed for reproducible error and failure sequences')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    settings = FakeDarajaSettings(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        failure_rate=args.failure_rate,
+        callback_delay=args.callback_delay,
+        callback_url=args.callback_url,
+        seed=args.seed
+    )
+    app = create_fake_daraja_app(settings)
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
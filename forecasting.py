@@ -0,0 +1,198 @@
+"""
+Per-product demand forecasting
+
+``flask forecast-demand`` (a nightly batch job) builds a products x days
+matrix of units sold, live and archived (see archive.py), with one grouped
+query. It fits an additive Holt-Winters model (damped trend, weekly
+seasonality) to every row at once, and stores each product's daily forecast
+for the coming week as a ForecastRun with ProductForecast rows, which
+/reports/forecast serves.
+
+The model's recurrences run over days, not products: each day of history is
+a handful of NumPy operations on arrays holding every SKU under every
+candidate set of smoothing parameters. Each SKU then keeps the candidate
+with the lowest one-day-ahead error. --workers splits the rows across a
+process pool.
+"""
+import json
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import delete, func, select
+
+from app import db
+from archive import daily_units
+from models import ForecastRun, Product, ProductForecast
+
+logger = logging.getLogger(__name__)
+
+SEASON_DAYS = 7
+
+# Trend damping: each further day ahead carries PHI times the previous trend
+PHI = 0.9
+
+# Candidate (alpha, beta, gamma) smoothing weights for level, trend and season
+PARAMETER_GRID = [
+    (alpha, beta, gamma)
+    for alpha in (0.05, 0.2, 0.5)
+    for beta in (0.0, 0.1)
+    for gamma in (0.05, 0.3)
+]
+
+
+def demand_matrix(start, days):
+    """
+    Units sold per product per day
+
+    Args:
+        start (date): First day of history
+        days (int): Number of days
+
+    Returns:
+        tuple: (product_ids, matrix) where product_ids is a sorted int64
+        array and matrix[i, d] is units of product_ids[i] sold on start + d
+    """
+    product_ids = np.fromiter(db.session.execute(select(Product.id).order_by(Product.id)).scalars(), dtype=np.int64)
+    matrix = np.zeros((len(product_ids), days))
+
+    begin = datetime.combine(start, datetime.min.time())
+    sales = daily_units(begin, begin + timedelta(days=days))
+    rows = db.session.execute(
+        select(sales.c.product_id, sales.c.day, func.sum(sales.c.quantity))
+        .group_by(sales.c.product_id, sales.c.day)
+    ).all()
+    if not rows or not len(product_ids):
+        return product_ids, matrix
+
+    sold_ids, sold_on, units = zip(*rows)
+    # date() is a string on SQLite and a date elsewhere; there are only `days` distinct values
+    offsets = {value: (date.fromisoformat(str(value)) - start).days for value in set(sold_on)}
+    sold_ids = np.array(sold_ids, dtype=np.int64)
+    columns = np.array([offsets[value] for value in sold_on])
+    rows_at = np.minimum(np.searchsorted(product_ids, sold_ids), len(product_ids) - 1)
+    # Skip sales of products that have since been deleted
+    known = product_ids[rows_at] == sold_ids
+    matrix[rows_at[known], columns[known]] = np.array(units, dtype=np.float64)[known]
+    return product_ids, matrix
+
+
+def fit_forecast(demand, horizon):
+    """
+    Fit Holt-Winters to every row of a demand matrix and forecast ahead
+
+    Args:
+        demand: (products, days) array of daily units; needs at least two
+            weeks of history
+        horizon (int): Days to forecast
+
+    Returns:
+        tuple: (forecast, mae): a (products, horizon) array of non-negative
+        daily units, and each product's mean absolute one-day-ahead error
+    """
+    y = np.asarray(demand, dtype=np.float64)
+    products, days = y.shape
+    if days < 2 * SEASON_DAYS:
+        raise ValueError(f'Need at least {2 * SEASON_DAYS} days of history')
+
+    # Parameters down axis 0, products along axis 1
+    alpha, beta, gamma = (np.array(values)[:, None] for values in zip(*PARAMETER_GRID))
+    shape = (len(PARAMETER_GRID), products)
+
+    first_week = y[:, :SEASON_DAYS]
+    level = np.broadcast_to(first_week.mean(axis=1), shape).copy()
+    trend = np.zeros(shape)
+    seasonal = np.broadcast_to((first_week - first_week.mean(axis=1, keepdims=True)).T[:, None, :],
+                               (SEASON_DAYS,) + shape).copy()
+    abs_error = np.zeros(shape)
+
+    for t in range(SEASON_DAYS, days):
+        actual = y[:, t]
+        season = seasonal[t % SEASON_DAYS]
+        damped = level + PHI * trend
+        abs_error += np.abs(actual - (damped + season))
+        new_level = alpha * (actual - season) + (1 - alpha) * damped
+        trend = beta * (new_level - level) + (1 - beta) * PHI * trend
+        seasonal[t % SEASON_DAYS] = gamma * (actual - new_level) + (1 - gamma) * season
+        level = new_level
+
+    best = abs_error.argmin(axis=0)
+    columns = np.arange(products)
+    level, trend = level[best, columns], trend[best, columns]
+    steps = np.arange(1, horizon + 1)
+    trend_weight = np.cumsum(PHI ** steps)
+    season_index = (days + steps - 1) % SEASON_DAYS
+    forecast = (level[:, None] + trend[:, None] * trend_weight
+                + seasonal[season_index][:, best, columns].T)
+    mae = abs_error[best, columns] / (days - SEASON_DAYS)
+    return np.clip(forecast, 0, None), mae
+
+
+def fit_forecast_parallel(demand, horizon, workers):
+    """fit_forecast over row blocks in a process pool; same result as fit_forecast"""
+    if workers <= 1 or len(demand) < 2 * workers:
+        return fit_forecast(demand, horizon)
+    blocks = np.array_split(demand, workers)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(fit_forecast, blocks, [horizon] * len(blocks)))
+    return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
+
+def run_forecast(history_days, horizon, workers=1, today=None, log=logger.info):
+    """
+    Forecast demand for every product and store it as a new ForecastRun;
+    commits, keeping only the newest run's per-product rows
+
+    Args:
+        history_days (int): Whole days of history to fit, ending yesterday
+        horizon (int): Days to forecast, starting today
+        workers (int): Processes to fit with
+        today (date): First forecast day; defaults to today (UTC)
+        log: Called with a line of progress text
+
+    Returns:
+        ForecastRun: The stored run
+    """
+    started = time.perf_counter()
+    today = today or datetime.utcnow().date()
+    history_start = today - timedelta(days=history_days)
+
+    product_ids, demand = demand_matrix(history_start, history_days)
+    loaded = time.perf_counter()
+    log(f'Loaded {demand.shape[0]} products x {demand.shape[1]} days in {loaded - started:.1f}s')
+
+    forecast, mae = fit_forecast_parallel(demand, horizon, workers)
+    fitted = time.perf_counter()
+    log(f'Fitted in {fitted - loaded:.1f}s')
+
+    run = ForecastRun(
+        history_start=history_start,
+        history_days=history_days,
+        first_day=today,
+        horizon_days=horizon,
+        products=len(product_ids),
+        mean_absolute_error=float(mae.mean()) if len(mae) else None,
+    )
+    db.session.add(run)
+    db.session.flush()
+
+    rounded = np.round(forecast, 2)
+    totals = np.round(rounded.sum(axis=1), 2)
+    rows = [{
+        'run_id': run.id,
+        'product_id': product_id,
+        'total_units': total,
+        'daily_units': json.dumps(daily),
+        'mean_absolute_error': error,
+    } for product_id, total, daily, error in zip(
+        product_ids.tolist(), totals.tolist(), rounded.tolist(), np.round(mae, 3).tolist()
+    )]
+    db.session.execute(delete(ProductForecast).where(ProductForecast.run_id != run.id))
+    if rows:
+        db.session.execute(ProductForecast.__table__.insert(), rows)
+    run.elapsed_seconds = round(time.perf_counter() - started, 2)
+    db.session.commit()
+    log(f'Stored {len(rows)} forecasts in {time.perf_counter() - fitted:.1f}s')
+    return run
@@ -0,0 +1,22 @@
+"""
+Gunicorn settings picked up automatically from the working directory
+
+Sets up the shared directory prometheus_client uses to aggregate metrics
+across worker processes.
+"""
+import os
+import shutil
+import tempfile
+
+# Must be set before the app (and prometheus_client) is imported
+if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = os.path.join(tempfile.gettempdir(), f"supermarket-metrics-{os.getpid()}")
+    # Start every master with an empty directory so stale worker files are not summed
+    shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"])
+
+
+def child_exit(server, worker):
+    """Drop the exited worker's live gauges from the aggregated metrics"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
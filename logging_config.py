@@ -0,0 +1,130 @@
+"""
+Application logging
+
+Request threads only put records on an in-memory queue; a QueueListener
+thread formats them (as JSON lines by default) and writes them to stderr, so
+slow terminals or log collectors never stall a sale. Levels are set per
+logger from LOG_LEVEL and LOG_LEVELS.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+
+# Quiet the chatty libraries unless LOG_LEVELS says otherwise
+DEFAULT_LOG_LEVELS = {
+    'sqlalchemy': 'WARNING',
+    'urllib3': 'WARNING',
+    'werkzeug': 'INFO',
+}
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+_listener = None
+# The config logging was last set up with, to set it up again after fork()
+_config = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with any `extra` fields included"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        elif record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that only interpolates the message on the calling thread;
+    JSON encoding and I/O happen on the listener thread
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def parse_levels(value):
+    """Parse "sqlalchemy=WARNING,routes.checkout=DEBUG" into a dict"""
+    levels = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(config):
+    """
+    Route all logging through a queue to a background writer
+
+    Safe to call more than once; the previous listener is flushed and replaced.
+    """
+    global _listener, _config
+
+    _stop_listener()
+    _config = config
+
+    stream = logging.StreamHandler(sys.stderr)
+    if config.get('LOG_FORMAT', 'json') == 'json':
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(NonBlockingQueueHandler(log_queue))
+    root.setLevel(config.get('LOG_LEVEL', 'INFO'))
+
+    levels = dict(DEFAULT_LOG_LEVELS)
+    levels.update(config.get('LOG_LEVELS') or {})
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _reconfigure_after_fork():
+    # The listener thread does not survive fork(), and the inherited queue may
+    # hold records the parent has yet to write; forked workers build their own
+    global _listener
+    if _config is not None:
+        _listener = None
+        configure_logging(_config)
+
+
+atexit.register(_stop_listener)
+os.register_at_fork(after_in_child=_reconfigure_after_fork)
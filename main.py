@@ -1,4 +1,12 @@
-from app import app  # noqa: F401
+from app import create_app, db
+
+app = create_app()
 
 if __name__ == "__main__":
+    # The development server sets up its own schema and demo data;
+    # deployments run `flask --app main init-db` once instead.
+    with app.app_context():
+        from models import populate_sample_data
+        db.create_all()
+        populate_sample_data()
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,125 @@
+"""
+Prometheus instrumentation and the /metrics endpoint
+
+Request latency histograms and in-flight gauges cover every blueprint, and
+the pool, cache and M-PESA helpers below feed the rest. When
+PROMETHEUS_MULTIPROC_DIR is set (gunicorn.conf.py does this), each worker
+writes its samples to that shared directory and /metrics aggregates all
+workers, so any worker can answer a scrape.
+"""
+import os
+import time
+
+from flask import Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+    REGISTRY, generate_latest, multiprocess
+)
+from sqlalchemy import event
+
+# Buckets from 5 ms to 10 s: checkout and search are expected in the tens of ms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route',
+    ['method', 'endpoint'], buckets=LATENCY_BUCKETS
+)
+REQUEST_COUNT = Counter(
+    'http_requests_total', 'HTTP requests by route and status',
+    ['method', 'endpoint', 'status']
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    'http_requests_in_progress', 'Requests currently being served',
+    ['endpoint'], multiprocess_mode='livesum'
+)
+
+DB_POOL_CHECKED_OUT = Gauge(
+    'db_pool_checked_out_connections', 'Pooled connections currently in use',
+    ['bind'], multiprocess_mode='livesum'
+)
+DB_POOL_SIZE = Gauge(
+    'db_pool_connections', 'Connections currently held by the pool',
+    ['bind'], multiprocess_mode='livesum'
+)
+
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', 'Cache lookups by cache and result',
+    ['cache', 'result']
+)
+
+MPESA_LATENCY = Histogram(
+    'mpesa_upstream_duration_seconds', 'Latency of Daraja API calls',
+    ['operation'], buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+MPESA_ERRORS = Counter(
+    'mpesa_upstream_errors_total', 'Failed Daraja API calls',
+    ['operation', 'reason']
+)
+
+
+def record_cache(cache, hit):
+    """Count a cache lookup as a hit or a miss"""
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def observe_mpesa(operation, started, error=None):
+    """Record a Daraja call that began at time.perf_counter() value started"""
+    MPESA_LATENCY.labels(operation).observe(time.perf_counter() - started)
+    if error:
+        MPESA_ERRORS.labels(operation, error).inc()
+
+
+def instrument_pool(bind, engine):
+    """Track pool usage through pool events so every worker reports its own connections"""
+    name = bind or 'default'
+    checked_out = DB_POOL_CHECKED_OUT.labels(name)
+    connections = DB_POOL_SIZE.labels(name)
+
+    event.listen(engine, 'connect', lambda dbapi_connection, record: connections.inc())
+    event.listen(engine, 'close', lambda dbapi_connection, record: connections.dec())
+    event.listen(engine, 'checkout', lambda dbapi_connection, record, proxy: checked_out.inc())
+    event.listen(engine, 'checkin', lambda dbapi_connection, record: checked_out.dec())
+
+
+def metrics_response():
+    """Render all metrics in the text exposition format"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_metrics(app, db):
+    """Instrument every request and expose /metrics"""
+    if not app.config.get('METRICS_ENABLED'):
+        return
+
+    with app.app_context():
+        for bind, engine in db.engines.items():
+            instrument_pool(bind, engine)
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_endpoint = request.endpoint or 'unmatched'
+        g.metrics_started = time.perf_counter()
+        REQUESTS_IN_PROGRESS.labels(g.metrics_endpoint).inc()
+
+    @app.teardown_request
+    def observe_request(exc):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        endpoint = g.pop('metrics_endpoint')
+        REQUEST_LATENCY.labels(request.method, endpoint).observe(time.perf_counter() - started)
+        REQUESTS_IN_PROGRESS.labels(endpoint).dec()
+        status = g.pop('metrics_status', 500 if exc else 200)
+        REQUEST_COUNT.labels(request.method, endpoint, str(status)).inc()
+
+    @app.after_request
+    def remember_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    app.add_url_rule('/metrics', 'metrics', metrics_response)
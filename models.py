@@ -1,8 +1,14 @@
 from app import db
 from datetime import datetime
+import json
 import random
 from decimal import Decimal
 
+from serializers import RowSerializer
+
+# Store of rows written without one (see stores.py)
+DEFAULT_STORE_ID = 1
+
 
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -15,6 +21,19 @@ class Product(db.Model):
     stock_quantity = db.Column(db.Integer, nullable=False, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Catalog version of the last write to this product (see catalog.py)
+    catalog_version = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
+    # Supplier lead time for reorder planning; None uses REORDER_LEAD_TIME_DAYS
+    lead_time_days = db.Column(db.Integer, nullable=True)
+    
+    # Keyset pagination of /inventory/products sorts by (column, id)
+    __table_args__ = (
+        db.Index('ix_product_name_id', 'name', 'id'),
+        db.Index('ix_product_category_id', 'category', 'id'),
+        db.Index('ix_product_category_name_id', 'category', 'name', 'id'),
+        db.Index('ix_product_price_id', 'price', 'id'),
+        db.Index('ix_product_stock_quantity_id', 'stock_quantity', 'id'),
+    )
     
     def to_dict(self):
         return {
@@ -24,7 +43,8 @@ class Product(db.Model):
             'description': self.description,
             'price': self.price,
             'category': self.category,
-            'stock_quantity': self.stock_quantity
+            'stock_quantity': self.stock_quantity,
+            'lead_time_days': self.lead_time_days
         }
 
 
@@ -36,10 +56,20 @@ class Transaction(db.Model):
     payment_method = db.Column(db.String(20), nullable=False)
     payment_reference = db.Column(db.String(50), nullable=True)
     cashier_name = db.Column(db.String(100), nullable=False, default="System")
+    store_id = db.Column(db.Integer, nullable=False, default=DEFAULT_STORE_ID, server_default='1')
+    till_session_id = db.Column(db.Integer, nullable=True)  # the TillSession that rang it up, if any
     
     # Relationships
     items = db.relationship('TransactionItem', backref='transaction', lazy=True, cascade="all, delete-orphan")
     
+    # Date-range reports and the archival scan; a store's sales totals are
+    # read from its own index range without touching the table
+    __table_args__ = (
+        db.Index('ix_transaction_date', 'transaction_date'),
+        db.Index('ix_transaction_store_date', 'store_id', 'transaction_date', 'payment_method', 'total_amount'),
+        db.Index('ix_transaction_till_session', 'till_session_id'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -49,6 +79,8 @@ class Transaction(db.Model):
             'payment_method': self.payment_method,
             'payment_reference': self.payment_reference,
             'cashier_name': self.cashier_name,
+            'store_id': self.store_id,
+            'till_session_id': self.till_session_id,
             'items': [item.to_dict() for item in self.items]
         }
 
@@ -59,11 +91,18 @@ class TransactionItem(db.Model):
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
     unit_price = db.Column(db.Float, nullable=False)
-    total_price = db.Column(db.Float, nullable=False)
+    total_price = db.Column(db.Float, nullable=False)  # after discount
+    # Promotion discount on the line, and the promotion that gave it (see pricing.py)
+    discount = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+    promotion_id = db.Column(db.Integer, nullable=True)
     
     # Relationship
     product = db.relationship('Product', backref='transaction_items')
     
+    __table_args__ = (
+        db.Index('ix_transaction_item_transaction', 'transaction_id'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -71,6 +110,8 @@ class TransactionItem(db.Model):
             'product_name': self.product.name if self.product else "Unknown",
             'quantity': self.quantity,
             'unit_price': self.unit_price,
+            'discount': self.discount,
+            'promotion_id': self.promotion_id,
             'total_price': self.total_price
         }
 
@@ -83,10 +124,19 @@ class StockMovement(db.Model):
     movement_type = db.Column(db.String(20), nullable=False)  # 'in', 'out', 'adjustment'
     reference = db.Column(db.String(50), nullable=True)  # Could be a transaction reference or other document
     notes = db.Column(db.Text, nullable=True)
+    store_id = db.Column(db.Integer, nullable=False, default=DEFAULT_STORE_ID, server_default='1')
     
     # Relationship
     product = db.relationship('Product', backref='stock_movements')
     
+    # Ledger scans by product and date range (see stock_ledger.py), and a
+    # store's movement history
+    __table_args__ = (
+        db.Index('ix_stock_movement_product_date', 'product_id', 'movement_date'),
+        db.Index('ix_stock_movement_date', 'movement_date'),
+        db.Index('ix_stock_movement_store_date', 'store_id', 'movement_date'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -96,10 +146,408 @@ class StockMovement(db.Model):
             'quantity': self.quantity,
             'movement_type': self.movement_type,
             'reference': self.reference,
-            'notes': self.notes
+            'notes': self.notes,
+            'store_id': self.store_id
+        }
+
+
+class Store(db.Model):
+    """A branch of the chain (see stores.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    code = db.Column(db.String(20), unique=True, nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'code': self.code,
+            'name': self.name
+        }
+
+
+class StoreStock(db.Model):
+    """A product's stock at one store; Product.stock_quantity is the total over all stores"""
+    store_id = db.Column(db.Integer, db.ForeignKey('store.id'), primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True, index=True)
+    stock_quantity = db.Column(db.Integer, nullable=False, default=0)
+    # Units held by open StockReservations; available to sell is stock_quantity - held_quantity
+    held_quantity = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    product = db.relationship('Product', backref=db.backref('store_stock', cascade='all, delete-orphan'))
+
+
+class StockReservation(db.Model):
+    """Units held at a store while a payment completes (see reservations.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    store_id = db.Column(db.Integer, db.ForeignKey('store.id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='held')  # 'held', 'converted', 'released', 'expired'
+    # The payment provider's id for the payment, e.g. the M-PESA CheckoutRequestID
+    payment_reference = db.Column(db.String(100), nullable=True, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    transaction_id = db.Column(db.Integer, nullable=True)  # the sale it was converted into
+    
+    items = db.relationship('StockReservationItem', backref='reservation', lazy=True, cascade="all, delete-orphan")
+    
+    # The sweeper reads expired holds straight off this index
+    __table_args__ = (
+        db.Index('ix_stock_reservation_status_expires', 'status', 'expires_at'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'store_id': self.store_id,
+            'status': self.status,
+            'payment_reference': self.payment_reference,
+            'expires_at': self.expires_at.isoformat(),
+            'transaction_id': self.transaction_id,
+            'items': [{'product_id': item.product_id, 'quantity': item.quantity} for item in self.items]
+        }
+
+
+class StockReservationItem(db.Model):
+    """Units of one product held by a StockReservation"""
+    reservation_id = db.Column(db.Integer, db.ForeignKey('stock_reservation.id'), primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False)
+
+
+class CatalogState(db.Model):
+    """Single-row counter bumped by every product write"""
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ProductTombstone(db.Model):
+    """Records a deleted product so tills syncing catalog changes can drop it"""
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, nullable=False)
+    catalog_version = db.Column(db.Integer, nullable=False, index=True)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class StockCheckpoint(db.Model):
+    """A product's ledger stock at a point in time, so as-of queries scan only later movements"""
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    as_of = db.Column(db.DateTime, nullable=False, index=True)
+    stock_quantity = db.Column(db.Integer, nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('product_id', 'as_of', name='uq_stock_checkpoint_product_as_of'),
+    )
+
+class ProductVelocity(db.Model):
+    """Per-product sales rate and reorder plan, kept current as sales and stock change (see replenishment.py)"""
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    # Exponentially weighted units sold per day, as of last_sale_at
+    units_per_day = db.Column(db.Float, nullable=False, default=0.0)
+    last_sale_at = db.Column(db.DateTime, nullable=True)
+    # Plan derived from the rate, stock and lead time at updated_at
+    days_of_cover = db.Column(db.Float, nullable=True)
+    reorder_point = db.Column(db.Integer, nullable=False, default=0)
+    reorder_quantity = db.Column(db.Integer, nullable=False, default=0)
+    needs_reorder = db.Column(db.Boolean, nullable=False, default=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    product = db.relationship('Product', backref=db.backref('velocity', uselist=False, cascade='all, delete-orphan'))
+    
+    # /reports/inventory/reorder reads the most urgent rows straight off this index
+    __table_args__ = (
+        db.Index('ix_product_velocity_reorder', 'needs_reorder', 'days_of_cover'),
+    )
+
+
+class ForecastRun(db.Model):
+    """One batch of demand forecasts (see forecasting.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    history_start = db.Column(db.Date, nullable=False)
+    history_days = db.Column(db.Integer, nullable=False)
+    first_day = db.Column(db.Date, nullable=False)  # first forecast day
+    horizon_days = db.Column(db.Integer, nullable=False)
+    products = db.Column(db.Integer, nullable=False)
+    mean_absolute_error = db.Column(db.Float, nullable=True)  # one-day-ahead, per product per day
+    elapsed_seconds = db.Column(db.Float, nullable=True)
+
+
+class ProductForecast(db.Model):
+    """A product's daily demand forecast from one ForecastRun"""
+    run_id = db.Column(db.Integer, db.ForeignKey('forecast_run.id'), primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)
+    total_units = db.Column(db.Float, nullable=False)
+    daily_units = db.Column(db.Text, nullable=False)  # JSON list, one value per forecast day
+    mean_absolute_error = db.Column(db.Float, nullable=False)
+    
+    # Highest forecast demand first in /reports/forecast
+    __table_args__ = (
+        db.Index('ix_product_forecast_run_total', 'run_id', 'total_units'),
+    )
+
+
+def _archive_table(model, *indexes):
+    """Copy of a model's table for archived rows: same columns, without foreign keys or Python defaults"""
+    table = model.__table__
+    return db.Table(
+        f'{table.name}_archive',
+        *[db.Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable,
+                    server_default=column.server_default.arg if column.server_default is not None else None)
+          for column in table.columns],
+        *indexes
+    )
+
+
+# Rows of closed months moved out of the live tables (see archive.py)
+transaction_archive = _archive_table(
+    Transaction,
+    db.Index('ix_transaction_archive_date', 'transaction_date'),
+)
+transaction_item_archive = _archive_table(
+    TransactionItem,
+    db.Index('ix_transaction_item_archive_transaction', 'transaction_id'),
+)
+stock_movement_archive = _archive_table(
+    StockMovement,
+    db.Index('ix_stock_movement_archive_product_date', 'product_id', 'movement_date'),
+    db.Index('ix_stock_movement_archive_date', 'movement_date'),
+)
+
+
+class ArchivedPeriod(db.Model):
+    """One archival pass over a closed month"""
+    id = db.Column(db.Integer, primary_key=True)
+    period_start = db.Column(db.Date, nullable=False, index=True)
+    period_end = db.Column(db.Date, nullable=False)  # exclusive
+    transactions = db.Column(db.Integer, nullable=False)
+    transaction_items = db.Column(db.Integer, nullable=False)
+    stock_movements = db.Column(db.Integer, nullable=False)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class DailySalesSummary(db.Model):
+    """Archived sales per day and payment method; sum rows, as a day may be archived in more than one pass"""
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+    payment_method = db.Column(db.String(20), nullable=False)
+    transactions = db.Column(db.Integer, nullable=False)
+    total_amount = db.Column(db.Float, nullable=False)
+    store_id = db.Column(db.Integer, nullable=False, default=DEFAULT_STORE_ID, server_default='1')
+    
+    __table_args__ = (
+        db.Index('ix_daily_sales_summary_store_day', 'store_id', 'day'),
+    )
+
+
+class DailyProductSales(db.Model):
+    """Archived units and revenue per day and product; sum rows like DailySalesSummary"""
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+    product_id = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    revenue = db.Column(db.Float, nullable=False)
+    store_id = db.Column(db.Integer, nullable=False, default=DEFAULT_STORE_ID, server_default='1')
+    
+    __table_args__ = (
+        db.Index('ix_daily_product_sales_store_day', 'store_id', 'day'),
+    )
+
+
+class OutboxEvent(db.Model):
+    """A committed change to sales, stock or the catalog, for downstream consumers (see outbox.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    event_type = db.Column(db.String(40), nullable=False)
+    aggregate_id = db.Column(db.Integer, nullable=False)
+    store_id = db.Column(db.Integer, nullable=True)
+    payload = db.Column(db.Text, nullable=False)  # JSON object
+    
+    # Consumer offsets are event ids, so SQLite must never reuse one after pruning
+    __table_args__ = {'sqlite_autoincrement': True}
+
+
+class ConsumerOffset(db.Model):
+    """The last OutboxEvent id a consumer has been sent"""
+    consumer = db.Column(db.String(100), primary_key=True)
+    last_event_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class Promotion(db.Model):
+    """A pricing rule applied to checkout baskets (see pricing.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # 'percent_off', 'amount_off', 'multi_buy', 'bundle'
+    # What it applies to: one product or a category; bundles list their products as items
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=True, index=True)
+    category = db.Column(db.String(50), nullable=True)
+    # Units per deal, for multi_buy
+    quantity = db.Column(db.Integer, nullable=True)
+    # percent_off: percent off; amount_off: off each unit; multi_buy and bundle: price of one deal
+    value = db.Column(db.Float, nullable=False)
+    # Valid from/until (UTC), and optionally only between two local times of day
+    starts_at = db.Column(db.DateTime, nullable=True)
+    ends_at = db.Column(db.DateTime, nullable=True)
+    daily_start = db.Column(db.Time, nullable=True)
+    daily_end = db.Column(db.Time, nullable=True)
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    items = db.relationship('PromotionItem', backref='promotion', lazy=True, cascade="all, delete-orphan")
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'kind': self.kind,
+            'product_id': self.product_id,
+            'category': self.category,
+            'quantity': self.quantity,
+            'value': self.value,
+            'starts_at': self.starts_at.isoformat() if self.starts_at else None,
+            'ends_at': self.ends_at.isoformat() if self.ends_at else None,
+            'daily_start': self.daily_start.isoformat() if self.daily_start else None,
+            'daily_end': self.daily_end.isoformat() if self.daily_end else None,
+            'active': self.active,
+            'items': [{'product_id': item.product_id, 'quantity': item.quantity} for item in self.items]
+        }
+
+
+class PromotionItem(db.Model):
+    """A product and quantity making up a bundle promotion"""
+    promotion_id = db.Column(db.Integer, db.ForeignKey('promotion.id'), primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=1)
+
+
+class PromotionState(db.Model):
+    """Single-row counter bumped by every promotion write, so checkout knows when to recompile"""
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class TillSession(db.Model):
+    """A cashier's shift on one till, with running sales totals (see tills.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    store_id = db.Column(db.Integer, db.ForeignKey('store.id'), nullable=False)
+    till = db.Column(db.String(50), nullable=False)
+    cashier_name = db.Column(db.String(100), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='open')  # 'open' or 'closed'
+    opened_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    closed_at = db.Column(db.DateTime, nullable=True)
+    opening_float = db.Column(db.Float, nullable=False, default=0)
+    # Kept current by every sale rung up in the session
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+    total_amount = db.Column(db.Float, nullable=False, default=0)
+    
+    totals = db.relationship('TillSessionTotal', lazy=True, cascade="all, delete-orphan",
+                             order_by='TillSessionTotal.payment_method')
+    
+    # One open session per till; closed ones are listed by store and time
+    __table_args__ = (
+        db.Index('ux_till_session_open_till', 'store_id', 'till', unique=True,
+                 sqlite_where=db.text("status = 'open'"), postgresql_where=db.text("status = 'open'")),
+        db.Index('ix_till_session_store_opened', 'store_id', 'opened_at'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'store_id': self.store_id,
+            'till': self.till,
+            'cashier_name': self.cashier_name,
+            'status': self.status,
+            'opened_at': self.opened_at.isoformat(),
+            'closed_at': self.closed_at.isoformat() if self.closed_at else None,
+            'opening_float': self.opening_float,
+            'transaction_count': self.transaction_count,
+            'total_amount': round(self.total_amount, 2),
+            'payment_methods': [total.to_dict() for total in self.totals]
+        }
+
+
+class TillSessionTotal(db.Model):
+    """Running count and value of a till session's sales by one payment method"""
+    till_session_id = db.Column(db.Integer, db.ForeignKey('till_session.id'), primary_key=True)
+    payment_method = db.Column(db.String(20), primary_key=True)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+    total_amount = db.Column(db.Float, nullable=False, default=0)
+    
+    def to_dict(self):
+        return {
+            'method': self.payment_method,
+            'count': self.transaction_count,
+            'total': round(self.total_amount, 2)
         }
 
 
+class ZReport(db.Model):
+    """Snapshot of a till session's totals taken when it closed; never changed afterwards"""
+    id = db.Column(db.Integer, primary_key=True)
+    till_session_id = db.Column(db.Integer, db.ForeignKey('till_session.id'), nullable=False, unique=True)
+    store_id = db.Column(db.Integer, nullable=False)
+    till = db.Column(db.String(50), nullable=False)
+    cashier_name = db.Column(db.String(100), nullable=False)
+    opened_at = db.Column(db.DateTime, nullable=False)
+    closed_at = db.Column(db.DateTime, nullable=False)
+    transaction_count = db.Column(db.Integer, nullable=False)
+    total_amount = db.Column(db.Float, nullable=False)
+    opening_float = db.Column(db.Float, nullable=False)
+    expected_cash = db.Column(db.Float, nullable=False)  # opening float plus cash sales
+    counted_cash = db.Column(db.Float, nullable=True)
+    payment_methods = db.Column(db.Text, nullable=False)  # JSON list of {method, count, total}
+    
+    # A store's reports for a day are one index range
+    __table_args__ = (
+        db.Index('ix_z_report_store_closed', 'store_id', 'closed_at'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'till_session_id': self.till_session_id,
+            'store_id': self.store_id,
+            'till': self.till,
+            'cashier_name': self.cashier_name,
+            'opened_at': self.opened_at.isoformat(),
+            'closed_at': self.closed_at.isoformat(),
+            'transaction_count': self.transaction_count,
+            'total_amount': self.total_amount,
+            'opening_float': self.opening_float,
+            'expected_cash': self.expected_cash,
+            'counted_cash': self.counted_cash,
+            'cash_variance': round(self.counted_cash - self.expected_cash, 2) if self.counted_cash is not None else None,
+            'payment_methods': json.loads(self.payment_methods)
+        }
+
+
+# Column-tuple equivalents of to_dict() for list endpoints (see serializers.py)
+product_rows = RowSerializer({
+    'id': Product.id,
+    'barcode': Product.barcode,
+    'name': Product.name,
+    'description': Product.description,
+    'price': Product.price,
+    'category': Product.category,
+    'stock_quantity': Product.stock_quantity,
+})
+
+stock_movement_rows = RowSerializer({
+    'id': StockMovement.id,
+    'product_id': StockMovement.product_id,
+    # Read through an outer join on Product
+    'product_name': (Product.name, lambda name: name if name is not None else "Unknown"),
+    'movement_date': (StockMovement.movement_date, datetime.isoformat),
+    'quantity': StockMovement.quantity,
+    'movement_type': StockMovement.movement_type,
+    'reference': StockMovement.reference,
+    'notes': StockMovement.notes,
+    'store_id': StockMovement.store_id,
+})
+
+
 def populate_sample_data():
     """Function to populate sample data for development purposes"""
     # Only add sample data if the tables are empty
@@ -148,9 +596,21 @@ def populate_sample_data():
         ]
         
         # Add products to database
-        for product_data in products:
-            product = Product(**product_data)
-            db.session.add(product)
+        product_objs = [Product(**product_data) for product_data in products]
+        db.session.add_all(product_objs)
+        db.session.flush()  # to get the product ids
+        
+        # Record the opening stock so the stock ledger sums to each product's stock
+        db.session.add_all([
+            StockMovement(
+                product_id=product_obj.id,
+                quantity=product_obj.stock_quantity,
+                movement_type='in',
+                reference='Initial Stock',
+                notes='Opening stock for sample data'
+            )
+            for product_obj in product_objs
+        ])
         
         # Create some sample transactions
         for i in range(1, 11):
@@ -164,14 +624,12 @@ def populate_sample_data():
                 cashier_name='Demo Cashier'
             )
             db.session.add(transaction)
-            db.session.flush()  # to get the transaction id
             
             # Add 1-5 random items to the transaction
             transaction_total = 0
             for _ in range(random.randint(1, 5)):
                 # Select a random product
-                product = random.choice(products)
-                product_obj = Product.query.filter_by(name=product['name']).first()
+                product_obj = random.choice(product_objs)
                 
                 # Random quantity between 1 and 3
                 quantity = random.randint(1, 3)
@@ -183,7 +641,7 @@ def populate_sample_data():
                 
                 # Create transaction item
                 transaction_item = TransactionItem(
-                    transaction_id=transaction.id,
+                    transaction=transaction,
                     product_id=product_obj.id,
                     quantity=quantity,
                     unit_price=unit_price,
@@ -15,8 +15,15 @@ MPESA_PASS_KEY = os.environ.get('MPESA_PASS_KEY', '')
 # API Endpoints - Using sandbox URLs for testing
 MPESA_ENVIRONMENT = 'sandbox'  # Change to 'production' for live environment
 
+# Override the API host, e.g. http://127.0.0.1:8090 for the local fake_daraja server
+MPESA_API_BASE_URL = os.environ.get('MPESA_API_BASE_URL', '').rstrip('/')
+
 # URL endpoints
-if MPESA_ENVIRONMENT == 'sandbox':
+if MPESA_API_BASE_URL:
+    MPESA_AUTH_URL = f'{MPESA_API_BASE_URL}/oauth/v1/generate?grant_type=client_credentials'
+    MPESA_STK_PUSH_URL = f'{MPESA_API_BASE_URL}/mpesa/stkpush/v1/processrequest'
+    MPESA_QUERY_URL = f'{MPESA_API_BASE_URL}/mpesa/stkpushquery/v1/query'
+elif MPESA_ENVIRONMENT == 'sandbox':
     MPESA_AUTH_URL = 'https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials'
     MPESA_STK_PUSH_URL = 'https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest'
     MPESA_QUERY_URL = 'https://sandbox.safaricom.co.ke/mpesa/stkpushquery/v1/query'
@@ -26,4 +33,7 @@ else:
     MPESA_QUERY_URL = 'https://api.safaricom.co.ke/mpesa/stkpushquery/v1/query'
 
 # Callback URLs
-MPESA_CALLBACK_URL = 'https://your-domain.com/mpesa/callback'  # Update with your callback URL
\ No newline at end of file
+MPESA_CALLBACK_URL = os.environ.get('MPESA_CALLBACK_URL', 'https://your-domain.com/mpesa/callback')  # Update with your callback URL
+
+# Seconds to wait for the Daraja API before giving up on a request
+MPESA_REQUEST_TIMEOUT = float(os.environ.get('MPESA_REQUEST_TIMEOUT', '30'))
\ No newline at end of file
@@ -9,11 +9,30 @@ from mpesa_config import (
     MPESA_CONSUMER_KEY, MPESA_CONSUMER_SECRET,
     MPESA_BUSINESS_SHORT_CODE, MPESA_PASS_KEY,
     MPESA_AUTH_URL, MPESA_STK_PUSH_URL, MPESA_QUERY_URL,
-    MPESA_CALLBACK_URL
+    MPESA_CALLBACK_URL, MPESA_REQUEST_TIMEOUT
 )
+from metrics import observe_mpesa, record_cache
 
 logger = logging.getLogger(__name__)
 
+# Shared HTTP session so repeated calls reuse pooled keep-alive connections
+_http = requests.Session()
+
+# Cached OAuth token: (token, expiry as a time.monotonic() value)
+_token_cache = {'token': None, 'expires_at': 0.0}
+
+
+def _timed_post(operation, url, payload, headers):
+    """POST to Daraja, recording latency and failures for the operation"""
+    started = time.perf_counter()
+    try:
+        response = _http.post(url, json=payload, headers=headers, timeout=MPESA_REQUEST_TIMEOUT)
+    except requests.RequestException:
+        observe_mpesa(operation, started, error='network')
+        raise
+    observe_mpesa(operation, started, error=None if response.status_code == 200 else f'http_{response.status_code}')
+    return response
+
 class MpesaException(Exception):
     """Custom exception for Mpesa API errors"""
     pass
@@ -30,7 +49,14 @@ class MpesaIntegration:
         """
         if not MPESA_CONSUMER_KEY or not MPESA_CONSUMER_SECRET:
             raise MpesaException("Missing M-PESA API credentials. Please set MPESA_CONSUMER_KEY and MPESA_CONSUMER_SECRET")
+        
+        # Reuse the token until shortly before Safaricom expires it
+        if _token_cache['token'] and time.monotonic() < _token_cache['expires_at']:
+            record_cache('mpesa_token', hit=True)
+            return _token_cache['token']
+        record_cache('mpesa_token', hit=False)
             
+        started = time.perf_counter()
         try:
             # Create auth string and encode it
             auth_string = f"{MPESA_CONSUMER_KEY}:{MPESA_CONSUMER_SECRET}"
@@ -41,17 +67,23 @@ class MpesaIntegration:
                 "Authorization": f"Basic {auth_base64}"
             }
             
-            response = requests.get(MPESA_AUTH_URL, headers=headers)
+            response = _http.get(MPESA_AUTH_URL, headers=headers, timeout=MPESA_REQUEST_TIMEOUT)
             response_data = response.json()
             
             if 'access_token' in response_data:
+                observe_mpesa('oauth', started)
+                expires_in = int(response_data.get('expires_in', 3599))
+                _token_cache['token'] = response_data['access_token']
+                _token_cache['expires_at'] = time.monotonic() + max(expires_in - 60, 0)
                 return response_data['access_token']
             else:
-                logger.error(f"Failed to get access token: {response_data}")
+                observe_mpesa('oauth', started, error=f'http_{response.status_code}')
+                logger.error("Failed to get access token: %s", response_data)
                 raise MpesaException(f"Failed to get access token: {response_data.get('errorMessage', 'Unknown error')}")
                 
-        except requests.RequestException as e:
-            logger.error(f"Network error during token request: {str(e)}")
+        except (requests.RequestException, ValueError) as e:
+            observe_mpesa('oauth', started, error='network')
+            logger.error("Network error during token request: %s", e)
             raise MpesaException(f"Network error: {str(e)}")
     
     @staticmethod
@@ -127,14 +159,14 @@ class MpesaIntegration:
                 "TransactionDesc": description
             }
             
-            response = requests.post(MPESA_STK_PUSH_URL, 
-                                  json=payload, 
-                                  headers=headers)
+            response = _timed_post('stk_push', MPESA_STK_PUSH_URL, payload, headers)
             
             if response.status_code == 200:
                 return response.json()
             else:
-                logger.error(f"STK Push failed with status {response.status_code}: {response.text}")
+                if response.status_code == 401:
+                    _token_cache['token'] = None
+                logger.error("STK Push failed with status %s: %s", response.status_code, response.text)
                 return {
                     "ResponseCode": "1",
                     "ResponseDescription": f"Error: {response.text}",
@@ -142,14 +174,14 @@ class MpesaIntegration:
                 }
                 
         except MpesaException as e:
-            logger.error(f"M-PESA API error: {str(e)}")
+            logger.error("M-PESA API error: %s", e)
             return {
                 "ResponseCode": "1",
                 "ResponseDescription": f"M-PESA API error: {str(e)}",
                 "error": True
             }
         except Exception as e:
-            logger.error(f"Unexpected error in STK Push: {str(e)}")
+            logger.error("Unexpected error in STK Push: %s", e)
             return {
                 "ResponseCode": "1",
                 "ResponseDescription": f"System error: {str(e)}",
@@ -200,14 +232,14 @@ class MpesaIntegration:
                 "CheckoutRequestID": checkout_request_id
             }
             
-            response = requests.post(MPESA_QUERY_URL, 
-                                  json=payload, 
-                                  headers=headers)
+            response = _timed_post('stk_query', MPESA_QUERY_URL, payload, headers)
             
             if response.status_code == 200:
                 return response.json()
             else:
-                logger.error(f"Query failed with status {response.status_code}: {response.text}")
+                if response.status_code == 401:
+                    _token_cache['token'] = None
+                logger.error("Query failed with status %s: %s", response.status_code, response.text)
                 return {
                     "ResponseCode": "1",
                     "ResponseDescription": f"Error: {response.text}",
@@ -215,14 +247,14 @@ class MpesaIntegration:
                 }
                 
         except MpesaException as e:
-            logger.error(f"M-PESA API error during status check: {str(e)}")
+            logger.error("M-PESA API error during status check: %s", e)
             return {
                 "ResponseCode": "1",
                 "ResponseDescription": f"M-PESA API error: {str(e)}",
                 "error": True
             }
         except Exception as e:
-            logger.error(f"Unexpected error in status check: {str(e)}")
+            logger.error("Unexpected error in status check: %s", e)
             return {
                 "ResponseCode": "1",
                 "ResponseDescription": f"System error: {str(e)}",
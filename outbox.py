@@ -0,0 +1,385 @@
+"""
+Transactional outbox and change stream
+
+Sales, stock movements and catalog writes append OutboxEvent rows in the
+same database transaction as the change itself, so an event exists exactly
+when its change committed. ORM writes are collected after each flush and
+written just before commit:
+
+- transaction.created: the sale with its items
+- stock_movement.created: every movement, including those of sales
+- product.created, product.updated, product.deleted: catalog changes. Stock
+  levels change with every sale and are followed through the movements, so a
+  change to stock_quantity alone does not emit product.updated.
+
+Bulk writes that bypass the ORM call ``record_events`` themselves.
+
+``flask dispatch-events`` publishes events in id order, in batches, to a sink
+(``make_sink``): a JSON Lines file, a webhook, or a spool directory standing
+in for a message queue. Each consumer's position is a ConsumerOffset, moved
+past a batch only after its sink accepted it, so delivery is at least once:
+after a crash the last batch is sent again, and consumers skip event ids they
+have already seen. Consumers can also pull with GET /events?after=<id>.
+
+Event ids are taken when the row is written, not when it commits, so readers
+only see events older than OUTBOX_SETTLE_SECONDS; that leaves a concurrent
+transaction holding an earlier id time to commit before anyone reads past it.
+"""
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import requests
+import sqlalchemy as sa
+from flask import current_app
+
+from app import db
+from models import ConsumerOffset, OutboxEvent, Product, StockMovement, Transaction, TransactionItem
+from routing import RoutingSession
+
+logger = logging.getLogger(__name__)
+
+# Session.info key holding the changes flushed since the last commit
+PENDING_KEY = 'outbox_pending'
+
+# Product attributes that change without emitting product.updated
+UNPUBLISHED_PRODUCT_FIELDS = {'stock_quantity', 'updated_at', 'catalog_version'}
+
+PRODUCT_FIELDS = ('id', 'barcode', 'name', 'description', 'price', 'cost_price', 'category', 'stock_quantity',
+                  'lead_time_days', 'catalog_version')
+MOVEMENT_FIELDS = ('id', 'product_id', 'movement_date', 'quantity', 'movement_type', 'reference', 'notes',
+                   'store_id')
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def event_dict(row):
+    """An OutboxEvent row as sent to consumers"""
+    return {
+        'id': row.id,
+        'type': row.event_type,
+        'aggregate_id': row.aggregate_id,
+        'store_id': row.store_id,
+        'created_at': row.created_at.isoformat(),
+        'data': json.loads(row.payload),
+    }
+
+
+def product_payload(product):
+    """Event payload of a Product, or of a row with its columns"""
+    return {field: getattr(product, field) for field in PRODUCT_FIELDS}
+
+
+def movement_payload(movement):
+    """Event payload of a StockMovement, or of any object with its attributes"""
+    payload = {field: getattr(movement, field) for field in MOVEMENT_FIELDS}
+    payload['movement_date'] = _isoformat(payload['movement_date'])
+    return payload
+
+
+def product_events(event_type, products):
+    """Events of one type for Products, or rows with their columns"""
+    return [{
+        'event_type': event_type,
+        'aggregate_id': product.id,
+        'store_id': None,
+        'payload': product_payload(product),
+    } for product in products]
+
+
+def movement_events(movements):
+    """stock_movement.created events for movements written in bulk"""
+    return [{
+        'event_type': 'stock_movement.created',
+        'aggregate_id': movement.id,
+        'store_id': movement.store_id,
+        'payload': movement_payload(movement),
+    } for movement in movements]
+
+
+def record_events(connection, events):
+    """
+    Append events to the outbox in the connection's transaction
+
+    Args:
+        connection: Connection in the writing transaction
+        events: Dicts with event_type, aggregate_id, store_id (or None) and
+            payload (a JSON-serializable dict)
+    """
+    now = datetime.utcnow()
+    rows = [{
+        'created_at': now,
+        'event_type': event['event_type'],
+        'aggregate_id': event['aggregate_id'],
+        'store_id': event['store_id'],
+        'payload': json.dumps(event['payload'], separators=(',', ':')),
+    } for event in events]
+    if rows:
+        connection.execute(OutboxEvent.__table__.insert(), rows)
+
+
+def _product_changed(product):
+    state = sa.inspect(product)
+    return any(state.attrs[column.key].history.has_changes()
+               for column in state.mapper.column_attrs if column.key not in UNPUBLISHED_PRODUCT_FIELDS)
+
+
+def _pending(db_session):
+    """Changes flushed since the last commit, by kind and id"""
+    return db_session.info.setdefault(PENDING_KEY, {
+        'transactions': {}, 'movements': {}, 'created': {}, 'updated': {}, 'deleted': set()
+    })
+
+
+@sa.event.listens_for(RoutingSession, 'after_flush')
+def _collect_changes(db_session, flush_context):
+    for obj in db_session.new:
+        if isinstance(obj, Transaction):
+            _pending(db_session)['transactions'][obj.id] = obj
+        elif isinstance(obj, StockMovement):
+            _pending(db_session)['movements'][obj.id] = obj
+        elif isinstance(obj, Product):
+            _pending(db_session)['created'][obj.id] = obj
+    for obj in db_session.dirty:
+        if isinstance(obj, Product) and _product_changed(obj):
+            pending = _pending(db_session)
+            if obj.id not in pending['created']:
+                pending['updated'][obj.id] = obj
+    for obj in db_session.deleted:
+        if isinstance(obj, Product):
+            pending = _pending(db_session)
+            pending['updated'].pop(obj.id, None)
+            if pending['created'].pop(obj.id, None) is None:
+                pending['deleted'].add(obj.id)
+
+
+@sa.event.listens_for(RoutingSession, 'before_commit')
+def _write_events(db_session):
+    # Commit flushes after this hook; flush now so every change is collected
+    db_session.flush()
+    pending = db_session.info.pop(PENDING_KEY, None)
+    if pending is None:
+        return
+
+    connection = db_session.connection()
+    transactions = pending['transactions']
+    items = {transaction_id: [] for transaction_id in transactions}
+    if transactions:
+        table = TransactionItem.__table__
+        for item in connection.execute(
+            sa.select(table).where(table.c.transaction_id.in_(sorted(transactions))).order_by(table.c.id)
+        ).mappings():
+            items[item['transaction_id']].append({
+                'id': item['id'],
+                'product_id': item['product_id'],
+                'quantity': item['quantity'],
+                'unit_price': item['unit_price'],
+                'discount': item['discount'],
+                'promotion_id': item['promotion_id'],
+                'total_price': item['total_price'],
+            })
+
+    # New products first, so no event refers to a product not yet announced
+    events = product_events('product.created', pending['created'].values())
+    events += [{
+        'event_type': 'transaction.created',
+        'aggregate_id': transaction.id,
+        'store_id': transaction.store_id,
+        'payload': {
+            'id': transaction.id,
+            'reference_number': transaction.reference_number,
+            'transaction_date': _isoformat(transaction.transaction_date),
+            'total_amount': transaction.total_amount,
+            'payment_method': transaction.payment_method,
+            'payment_reference': transaction.payment_reference,
+            'cashier_name': transaction.cashier_name,
+            'store_id': transaction.store_id,
+            'items': items[transaction.id],
+        },
+    } for transaction in transactions.values()]
+    events += movement_events(pending['movements'].values())
+    events += product_events('product.updated', pending['updated'].values())
+    events += [{
+        'event_type': 'product.deleted',
+        'aggregate_id': product_id,
+        'store_id': None,
+        'payload': {'id': product_id},
+    } for product_id in sorted(pending['deleted'])]
+    record_events(connection, events)
+
+
+@sa.event.listens_for(RoutingSession, 'after_soft_rollback')
+def _forget_changes(db_session, previous_transaction):
+    db_session.info.pop(PENDING_KEY, None)
+
+
+def read_events(after, limit, settle_seconds=None):
+    """
+    Events after an offset, oldest first
+
+    Args:
+        after (int): Last event id already seen (0 for the start)
+        limit (int): Most events to return
+        settle_seconds (float): Leave out events younger than this;
+            defaults to OUTBOX_SETTLE_SECONDS
+
+    Returns:
+        list: OutboxEvent rows
+    """
+    if settle_seconds is None:
+        settle_seconds = current_app.config['OUTBOX_SETTLE_SECONDS']
+    settled = datetime.utcnow() - timedelta(seconds=settle_seconds)
+    return db.session.execute(
+        sa.select(OutboxEvent)
+        .where(OutboxEvent.id > after, OutboxEvent.created_at <= settled)
+        .order_by(OutboxEvent.id)
+        .limit(limit)
+    ).scalars().all()
+
+
+class FileSink:
+    """Appends each event to a JSON Lines file"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, events):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for event in events:
+                f.write(json.dumps(event, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class WebhookSink:
+    """POSTs each batch as {"events": [...]}; any non-2xx response fails the batch"""
+
+    def __init__(self, url, timeout):
+        self.url = url
+        self.timeout = timeout
+        self.http = requests.Session()
+
+    def send(self, events):
+        response = self.http.post(self.url, json={'events': events}, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class QueueSink:
+    """
+    Local stand-in for a message queue: each batch becomes one JSON file in a
+    spool directory, named by its first and last event ids so names sort in
+    order. Consumers process the files in name order and delete them.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def send(self, events):
+        name = f"{events[0]['id']:012d}-{events[-1]['id']:012d}.json"
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.', suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'events': events}, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        # Readers never see a partly written batch
+        os.replace(temp_path, os.path.join(self.directory, name))
+
+
+def make_sink(spec, config):
+    """
+    Build a sink from file:<path>, webhook:<url> or queue:<directory>
+
+    Raises:
+        ValueError: If the spec names no known sink
+    """
+    kind, _, target = spec.partition(':')
+    if not target:
+        raise ValueError('Sink must be file:<path>, webhook:<url> or queue:<directory>')
+    if kind == 'file':
+        return FileSink(target)
+    if kind == 'webhook':
+        return WebhookSink(target, config['OUTBOX_WEBHOOK_TIMEOUT'])
+    if kind == 'queue':
+        return QueueSink(target)
+    raise ValueError(f'Unknown sink {kind!r}; use file, webhook or queue')
+
+
+def dispatch_batch(consumer, sink, batch_size):
+    """
+    Send the consumer's next batch of events to the sink and advance its
+    offset; commits
+
+    Returns:
+        int: Number of events sent
+    """
+    offset = db.session.get(ConsumerOffset, consumer)
+    if offset is None:
+        # Registered before the first send, so pruning waits for this consumer
+        offset = ConsumerOffset(consumer=consumer, last_event_id=0)
+        db.session.add(offset)
+        db.session.commit()
+    rows = read_events(offset.last_event_id, batch_size)
+    if not rows:
+        db.session.rollback()
+        return 0
+    # Raises if the sink did not take the batch; the offset stays put
+    sink.send([event_dict(row) for row in rows])
+    offset.last_event_id = rows[-1].id
+    db.session.commit()
+    return len(rows)
+
+
+def run_dispatcher(consumer, sink, batch_size, follow=False, poll_seconds=1.0, log=logger.info):
+    """
+    Send a consumer every pending event; with follow, keep polling for new
+    ones and retry failed batches until interrupted. One dispatcher per
+    consumer at a time.
+
+    Returns:
+        int: Number of events sent
+    """
+    sent = 0
+    while True:
+        try:
+            count = dispatch_batch(consumer, sink, batch_size)
+        except Exception as e:
+            db.session.rollback()
+            if not follow:
+                raise
+            log(f'{consumer}: batch failed, retrying in {poll_seconds}s: {e}')
+            time.sleep(poll_seconds)
+            continue
+        sent += count
+        if count:
+            log(f'{consumer}: sent {count} events (offset {db.session.get(ConsumerOffset, consumer).last_event_id})')
+        if count < batch_size:
+            if not follow:
+                return sent
+            time.sleep(poll_seconds)
+
+
+def prune_events(older_than):
+    """
+    Delete events older than a cutoff that every consumer has been sent;
+    commits
+
+    Args:
+        older_than (datetime): Keep events created at or after this
+
+    Returns:
+        int: Number of events deleted
+    """
+    consumed = db.session.execute(sa.select(sa.func.min(ConsumerOffset.last_event_id))).scalar()
+    if consumed is None:
+        return 0
+    count = db.session.execute(
+        sa.delete(OutboxEvent).where(OutboxEvent.id <= consumed, OutboxEvent.created_at < older_than)
+    ).rowcount
+    db.session.commit()
+    return count
@@ -0,0 +1,81 @@
+"""
+Keyset (cursor) pagination helpers
+
+A page is ordered by one sort column plus the primary key as a tie-breaker.
+The cursor is an opaque token holding the sort name and the last row's sort
+value and id, so the next page starts with an indexed range scan
+(``WHERE (col, id) > (value, last_id)``) instead of an OFFSET that reads and
+discards every earlier row.
+"""
+import base64
+import json
+
+import sqlalchemy as sa
+
+
+class InvalidQuery(ValueError):
+    """Raised for a malformed sort, cursor, limit or filter parameter"""
+    pass
+
+
+def parse_sort(value, sortable, default):
+    """
+    Resolve a ?sort= value such as "price" or "-name"
+
+    Args:
+        value: The raw parameter; a leading "-" sorts descending
+        sortable: Mapping of sort name to column
+        default: Sort name used when value is empty
+
+    Returns:
+        tuple: (sort name as given, column, descending)
+    """
+    value = value or default
+    name = value.lstrip('-')
+    if name not in sortable:
+        raise InvalidQuery(f"Cannot sort by {name}. Available: {', '.join(sortable)}")
+    return value, sortable[name], value.startswith('-')
+
+
+def parse_limit(value, default, maximum):
+    """Page size from ?limit=, or default (None for no limit)"""
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise InvalidQuery('limit must be a whole number')
+    if not 1 <= limit <= maximum:
+        raise InvalidQuery(f'limit must be between 1 and {maximum}')
+    return limit
+
+
+def encode_cursor(sort, value, last_id):
+    payload = json.dumps([sort, value, last_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    """The (value, last_id) stored in a cursor, which must belong to the same sort"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, value, last_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise InvalidQuery('Invalid cursor')
+    if cursor_sort != sort or not isinstance(last_id, int):
+        raise InvalidQuery('Cursor does not match the requested sort')
+    return value, last_id
+
+
+def after_cursor(column, id_column, value, last_id, descending):
+    """WHERE clause selecting rows that sort after (value, last_id)"""
+    if descending:
+        return sa.or_(column < value, sa.and_(column == value, id_column < last_id))
+    return sa.or_(column > value, sa.and_(column == value, id_column > last_id))
+
+
+def keyset_order(column, id_column, descending):
+    """ORDER BY clauses matching after_cursor"""
+    if descending:
+        return [column.desc(), id_column.desc()]
+    return [column.asc(), id_column.asc()]
@@ -0,0 +1,406 @@
+"""
+Promotions and checkout pricing
+
+Each Promotion is a pricing rule of one kind:
+
+- percent_off: ``value`` percent off each unit
+- amount_off: ``value`` off each unit, down to zero
+- multi_buy: ``quantity`` units for ``value``; a category rule mixes and
+  matches its products, and the dearest units go into deals first
+- bundle: its PromotionItems together for ``value``
+
+The first three apply to one product (product_id) or a whole category. Any
+rule can be limited to a date range (starts_at/ends_at, UTC) and to daily
+hours (daily_start/daily_end, local time at PROMOTION_UTC_OFFSET_HOURS; the
+window may wrap past midnight).
+
+Checkout never scans the rules. ``pricing_engine`` compiles the live rules
+into dicts keyed by product id and by category (bundles under each of their
+products) and each process keeps them until a promotion write bumps
+PromotionState, so a sale reads one counter row. ``PricingEngine.price``
+then prices a basket in one pass over its lines: every line looks up its
+candidate rules and keeps its best per-unit discount, each multi_buy or
+bundle is evaluated once over the lines it matched, and the largest
+discounts are applied first, one promotion per line.
+Promotions do not stack; a rule that loses some lines to a bigger discount
+is evaluated again over the lines left.
+"""
+import heapq
+import math
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta
+from itertools import chain
+
+import sqlalchemy as sa
+from flask import current_app
+from sqlalchemy.orm import selectinload
+
+from app import db
+from models import Product, Promotion, PromotionItem, PromotionState
+from routing import RoutingSession
+from stock_ledger import parse_as_of
+
+STATE_ID = 1
+
+PROMOTION_KINDS = ('percent_off', 'amount_off', 'multi_buy', 'bundle')
+
+# Serializes recompiles; readers use whichever engine is current
+_compile_lock = threading.Lock()
+
+
+def _cents(amount):
+    return round(amount, 2)
+
+
+def current_version(db_session):
+    """The latest committed promotion version visible to the session (0 before any write)"""
+    # Read on every sale, so through Core, skipping the ORM's per-statement overhead
+    table = PromotionState.__table__
+    version = db_session.connection().execute(
+        sa.select(table.c.version).where(table.c.id == STATE_ID)
+    ).scalar()
+    return version or 0
+
+
+def bump_version(db_session):
+    """Increment the promotion version in the session's transaction"""
+    table = PromotionState.__table__
+    connection = db_session.connection()
+    result = connection.execute(
+        table.update().where(table.c.id == STATE_ID).values(version=table.c.version + 1)
+    )
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(id=STATE_ID, version=1))
+
+
+@sa.event.listens_for(RoutingSession, 'before_flush')
+def _track_promotion_writes(db_session, flush_context, instances):
+    if any(isinstance(obj, (Promotion, PromotionItem))
+           for obj in chain(db_session.new, db_session.dirty, db_session.deleted)):
+        bump_version(db_session)
+
+
+def _spread(total, lines, matched):
+    """Split a discount over lines in proportion to their value, to the cent"""
+    gross = [lines[i][2] * lines[i][3] for i in matched]
+    whole = sum(gross)
+    shares = [_cents(total * value / whole) for value in gross]
+    largest = gross.index(max(gross))
+    shares[largest] = _cents(shares[largest] + _cents(total) - sum(shares))
+    return shares
+
+
+class CompiledRule:
+    """A live Promotion reduced to what pricing a basket needs"""
+    __slots__ = ('id', 'kind', 'quantity', 'value', 'per_unit', 'timed', 'starts_at', 'ends_at', 'daily_start',
+                 'daily_end', 'components')
+
+    def __init__(self, promotion):
+        self.id = promotion.id
+        self.kind = promotion.kind
+        self.quantity = promotion.quantity
+        self.value = promotion.value
+        # percent_off and amount_off price each line on its own
+        self.per_unit = promotion.kind in ('percent_off', 'amount_off')
+        self.timed = any(value is not None for value in (
+            promotion.starts_at, promotion.ends_at, promotion.daily_start, promotion.daily_end
+        ))
+        self.starts_at = promotion.starts_at
+        self.ends_at = promotion.ends_at
+        self.daily_start = promotion.daily_start
+        self.daily_end = promotion.daily_end
+        self.components = {item.product_id: item.quantity for item in promotion.items}
+
+    def is_live(self, now, local_time):
+        """Whether the rule applies at a UTC time and the matching local time of day"""
+        if self.starts_at is not None and now < self.starts_at:
+            return False
+        if self.ends_at is not None and now >= self.ends_at:
+            return False
+        if self.daily_start is None or self.daily_end is None:
+            return True
+        if self.daily_start <= self.daily_end:
+            return self.daily_start <= local_time < self.daily_end
+        return local_time >= self.daily_start or local_time < self.daily_end
+
+    def unit_discount(self, unit_price):
+        """Discount on one unit, for percent_off and amount_off rules"""
+        if self.kind == 'percent_off':
+            return unit_price * self.value / 100
+        return min(self.value, unit_price)
+
+    def discounts(self, lines, matched):
+        """
+        Discount from a multi_buy or bundle rule
+
+        Args:
+            lines: (product_id, category, unit_price, quantity) per basket line
+            matched (list): Indexes of the lines the rule applies to
+
+        Returns:
+            tuple: (indexes, discounts): the lines the deals used and the
+            discount on each, or None when the rule gives nothing
+        """
+        if self.kind == 'multi_buy':
+            deals = sum(lines[i][3] for i in matched) // self.quantity
+            if not deals:
+                return None
+            remaining, regular, used = deals * self.quantity, 0.0, []
+            for i in sorted(matched, key=lambda i: -lines[i][2]):
+                taken = min(remaining, lines[i][3])
+                regular += taken * lines[i][2]
+                remaining -= taken
+                used.append(i)
+                if not remaining:
+                    break
+            # Lines with no units in a deal stay free for other promotions
+            matched = sorted(used)
+            total = regular - deals * self.value
+        else:
+            units, prices = Counter(), {}
+            for i in matched:
+                units[lines[i][0]] += lines[i][3]
+                prices[lines[i][0]] = lines[i][2]
+            deals = min(units[product_id] // quantity for product_id, quantity in self.components.items())
+            if not deals:
+                return None
+            regular = sum(prices[product_id] * quantity for product_id, quantity in self.components.items())
+            total = deals * (regular - self.value)
+        if total <= 0:
+            return None
+        return matched, _spread(total, lines, matched)
+
+
+def _offer(rule, lines, matched):
+    """Heap entry for a multi_buy or bundle rule's discount on some lines, or None; biggest first"""
+    priced = rule.discounts(lines, matched)
+    if not priced:
+        return None
+    matched, shares = priced
+    return (-sum(shares), rule.id, matched[0], rule, matched, shares)
+
+
+class PricingEngine:
+    """The live promotions at one PromotionState version, indexed by product and category"""
+
+    def __init__(self, version, promotions, utc_offset_hours=0.0):
+        self.version = version
+        self.utc_offset = timedelta(hours=utc_offset_hours)
+        by_product, by_category = defaultdict(list), defaultdict(list)
+        self.rules = 0
+        for promotion in promotions:
+            rule = CompiledRule(promotion)
+            self.rules += 1
+            if rule.kind == 'bundle':
+                for product_id in rule.components:
+                    by_product[product_id].append(rule)
+            elif promotion.product_id is not None:
+                by_product[promotion.product_id].append(rule)
+            else:
+                by_category[promotion.category].append(rule)
+        self.by_product = {key: tuple(rules) for key, rules in by_product.items()}
+        self.by_category = {key: tuple(rules) for key, rules in by_category.items()}
+
+    def price(self, lines, now=None):
+        """
+        Promotion discounts for a basket
+
+        Args:
+            lines: (product_id, category, unit_price, quantity) per basket line
+            now (datetime): UTC time of the sale; defaults to now
+
+        Returns:
+            list: (discount, promotion_id) per line; promotion_id is None for
+            lines sold at full price
+        """
+        now = now or datetime.utcnow()
+        local_time = (now + self.utc_offset).time()
+        offers, grouped = [], {}
+        for index, (product_id, category, unit_price, quantity) in enumerate(lines):
+            # Each line keeps only its best per-unit discount; grouped rules are priced below
+            best = None
+            for rules in (self.by_product.get(product_id, ()), self.by_category.get(category, ())):
+                for rule in rules:
+                    if rule.timed and not rule.is_live(now, local_time):
+                        continue
+                    if not rule.per_unit:
+                        grouped.setdefault(rule, []).append(index)
+                        continue
+                    discount = _cents(rule.unit_discount(unit_price) * quantity)
+                    if discount > 0 and (best is None or (-discount, rule.id) < best[:2]):
+                        best = (-discount, rule.id, index, rule, [index], [discount])
+            if best is not None:
+                offers.append(best)
+        for rule, indexes in grouped.items():
+            offer = _offer(rule, lines, indexes)
+            if offer is not None:
+                offers.append(offer)
+
+        heapq.heapify(offers)
+        priced = [(0.0, None)] * len(lines)
+        claimed = [False] * len(lines)
+        while offers:
+            _, _, _, rule, indexes, shares = heapq.heappop(offers)
+            free = [i for i in indexes if not claimed[i]]
+            if len(free) < len(indexes):
+                # Some lines went to a bigger discount; offer the rest again
+                offer = _offer(rule, lines, free) if free else None
+                if offer is not None:
+                    heapq.heappush(offers, offer)
+                continue
+            for i, share in zip(indexes, shares):
+                priced[i] = (share, rule.id)
+                claimed[i] = True
+        return priced
+
+
+def compile_rules(version, now=None):
+    """
+    Load every promotion that is or may become live into a PricingEngine
+
+    Args:
+        version (int): PromotionState version the rules are read at
+        now (datetime): Rules that ended before this are left out
+    """
+    now = now or datetime.utcnow()
+    promotions = db.session.scalars(
+        sa.select(Promotion)
+        .options(selectinload(Promotion.items))
+        .where(Promotion.active.is_(True), sa.or_(Promotion.ends_at.is_(None), Promotion.ends_at > now))
+    ).all()
+    return PricingEngine(version, promotions, current_app.config['PROMOTION_UTC_OFFSET_HOURS'])
+
+
+def pricing_engine():
+    """This app's compiled promotions, recompiled only when a promotion has changed since"""
+    version = current_version(db.session)
+    extensions = current_app.extensions
+    engine = extensions.get('pricing')
+    if engine is None or engine.version != version:
+        with _compile_lock:
+            engine = extensions.get('pricing')
+            if engine is None or engine.version != version:
+                engine = extensions['pricing'] = compile_rules(version)
+    return engine
+
+
+def price_basket(lines, now=None):
+    """
+    Price a basket with the current promotions
+
+    Args:
+        lines: (product_id, category, unit_price, quantity) per basket line
+        now (datetime): UTC time of the sale; defaults to now
+
+    Returns:
+        tuple: (priced, total): per line a dict of unit_price, discount,
+        promotion_id and total_price, and the basket total
+    """
+    priced = [{
+        'unit_price': unit_price,
+        'discount': discount,
+        'promotion_id': promotion_id,
+        'total_price': _cents(unit_price * quantity - discount),
+    } for (_, _, unit_price, quantity), (discount, promotion_id) in zip(lines, pricing_engine().price(lines, now))]
+    return priced, _cents(sum(line['total_price'] for line in priced))
+
+
+def _optional(data, field, convert):
+    value = data[field]
+    if value in (None, ''):
+        return None
+    try:
+        return convert(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{field} is not valid: {value!r}')
+
+
+def _timestamp(value):
+    when = parse_as_of(value)
+    if when is None:
+        raise ValueError
+    return when
+
+
+def update_promotion(promotion, data):
+    """
+    Set a promotion's fields from API input and check they make a valid rule
+
+    Args:
+        promotion (Promotion): A new or existing promotion
+        data (dict): Fields to set; fields left out keep their values. items
+            replaces a bundle's products: [{'product_id', 'quantity'}, ...]
+
+    Raises:
+        ValueError: If a field is malformed or the rule is inconsistent
+    """
+    if 'name' in data:
+        promotion.name = (data['name'] or '').strip()
+    if 'kind' in data:
+        promotion.kind = data['kind']
+    if 'category' in data:
+        promotion.category = data['category'] or None
+    for field, convert in (('product_id', int), ('quantity', int), ('value', float),
+                           ('starts_at', _timestamp), ('ends_at', _timestamp),
+                           ('daily_start', time.fromisoformat), ('daily_end', time.fromisoformat)):
+        if field in data:
+            setattr(promotion, field, _optional(data, field, convert))
+    if 'active' in data:
+        promotion.active = bool(data['active'])
+    if 'items' in data:
+        try:
+            parsed = [(int(item['product_id']), int(item.get('quantity', 1))) for item in data['items'] or []]
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('Each bundle item needs a whole-number product_id and quantity')
+        wanted = {}
+        for product_id, quantity in parsed:
+            if product_id in wanted:
+                raise ValueError(f'Product {product_id} is listed twice in the bundle')
+            wanted[product_id] = quantity
+        existing = {item.product_id: item for item in promotion.items}
+        for product_id, item in existing.items():
+            if product_id in wanted:
+                item.quantity = wanted[product_id]
+            else:
+                promotion.items.remove(item)
+        promotion.items.extend(PromotionItem(product_id=product_id, quantity=quantity)
+                               for product_id, quantity in wanted.items() if product_id not in existing)
+
+    if not promotion.name:
+        raise ValueError('name is required')
+    if promotion.kind not in PROMOTION_KINDS:
+        raise ValueError(f"kind must be one of {', '.join(PROMOTION_KINDS)}")
+    if promotion.value is None or not math.isfinite(promotion.value) or promotion.value < 0:
+        raise ValueError('value must be a finite number, zero or more')
+    if promotion.kind == 'percent_off' and promotion.value > 100:
+        raise ValueError('A percent_off value must be at most 100')
+    if promotion.kind == 'multi_buy' and (promotion.quantity or 0) < 2:
+        raise ValueError('A multi_buy needs a quantity of at least 2')
+    if promotion.kind == 'bundle':
+        if promotion.product_id is not None or promotion.category is not None:
+            raise ValueError('A bundle lists its products as items, not product_id or category')
+        if not promotion.items:
+            raise ValueError('A bundle needs items')
+        if any(item.quantity < 1 for item in promotion.items):
+            raise ValueError('Bundle item quantities must be at least 1')
+    else:
+        if (promotion.product_id is None) == (promotion.category is None):
+            raise ValueError('Give either product_id or category')
+        if promotion.items:
+            raise ValueError('Only bundles have items')
+    if promotion.starts_at and promotion.ends_at and promotion.starts_at >= promotion.ends_at:
+        raise ValueError('starts_at must be before ends_at')
+    if (promotion.daily_start is None) != (promotion.daily_end is None):
+        raise ValueError('Give both daily_start and daily_end, or neither')
+    if promotion.daily_start is not None and promotion.daily_start == promotion.daily_end:
+        raise ValueError('daily_start and daily_end must differ')
+
+    product_ids = {item.product_id for item in promotion.items}
+    if promotion.product_id is not None:
+        product_ids.add(promotion.product_id)
+    if product_ids:
+        found = set(db.session.scalars(sa.select(Product.id).where(Product.id.in_(product_ids))))
+        missing = sorted(product_ids - found)
+        if missing:
+            raise ValueError(f'Product {missing[0]} not found')
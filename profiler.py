@@ -0,0 +1,133 @@
+"""
+Per-request SQL profiling
+
+Hooks SQLAlchemy cursor events to count the queries each request runs and
+time them. Responses get a Server-Timing header, statements slower than
+SQL_SLOW_QUERY_MS are logged, and a statement repeated at least
+SQL_N_PLUS_ONE_THRESHOLD times in one request is reported as a likely N+1
+lazy-load. With SQL_PROFILER_STRICT enabled (meant for tests and CI), a
+request that exceeds its query budget or triggers the N+1 detector raises
+QueryBudgetExceeded instead of only logging.
+"""
+import logging
+import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised in strict mode when a request runs more SQL than allowed"""
+    pass
+
+
+class RequestProfile:
+    """SQL statistics collected for one request"""
+
+    __slots__ = ('started', 'query_count', 'sql_time', 'statements')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.sql_time = 0.0
+        # statement text -> [executions, total seconds]
+        self.statements = {}
+
+    def record(self, statement, duration):
+        self.query_count += 1
+        self.sql_time += duration
+        stats = self.statements.get(statement)
+        if stats is None:
+            self.statements[statement] = [1, duration]
+        else:
+            stats[0] += 1
+            stats[1] += duration
+
+    def repeated(self, threshold):
+        """Statements executed at least threshold times, most frequent first"""
+        hits = [(count, statement) for statement, (count, _) in self.statements.items() if count >= threshold]
+        return sorted(hits, reverse=True)
+
+
+def query_budget(max_queries):
+    """Set the maximum number of SQL statements a view may run per request"""
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def current_profile():
+    """The RequestProfile of the active request, or None"""
+    if not has_request_context():
+        return None
+    return g.get('sql_profile')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and has_request_context() and 'sql_profile' in g:
+        context._profile_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_profile_started', None)
+    profile = current_profile()
+    if started is None or profile is None:
+        return
+    duration = time.perf_counter() - started
+    profile.record(statement, duration)
+    slow_ms = current_app.config['SQL_SLOW_QUERY_MS']
+    if slow_ms and duration * 1000 >= slow_ms:
+        logger.warning("Slow query (%.1f ms) in %s: %s", duration * 1000, request.endpoint, statement)
+
+
+def instrument_engine(engine):
+    """Attach the profiling hooks to an engine"""
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def init_profiler(app, db):
+    """Enable per-request SQL profiling for all of the app's engines"""
+    if not app.config.get('SQL_PROFILER_ENABLED'):
+        return
+
+    with app.app_context():
+        for engine in db.engines.values():
+            instrument_engine(engine)
+
+    @app.before_request
+    def start_profile():
+        g.sql_profile = RequestProfile()
+
+    @app.after_request
+    def finish_profile(response):
+        profile = g.pop('sql_profile', None)
+        if profile is None:
+            return response
+
+        total_ms = (time.perf_counter() - profile.started) * 1000
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={profile.sql_time * 1000:.2f};desc="{profile.query_count} queries", app;dur={total_ms:.2f}'
+        )
+
+        config = current_app.config
+        problems = []
+        suspects = profile.repeated(config['SQL_N_PLUS_ONE_THRESHOLD'])
+        for count, statement in suspects:
+            logger.warning("Possible N+1 in %s: statement ran %d times: %s", request.endpoint, count, statement)
+            problems.append(f'statement ran {count} times: {statement}')
+
+        view = current_app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', None) or config.get('SQL_QUERY_BUDGET')
+        if budget and profile.query_count > budget:
+            logger.warning("%s ran %d queries (budget %d)", request.endpoint, profile.query_count, budget)
+            problems.append(f'{profile.query_count} queries exceeds budget of {budget}')
+
+        if problems and config.get('SQL_PROFILER_STRICT'):
+            raise QueryBudgetExceeded(f'{request.method} {request.path}: ' + '; '.join(problems))
+        return response
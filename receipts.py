@@ -0,0 +1,203 @@
+"""
+Receipts
+
+A sale never changes once written, so neither does its receipt. ``receipt``
+loads a transaction with its items and their product names in one query
+(from the archive tables for closed months), and keeps the result, and each
+format rendered from it, in a per-process LRU cache keyed by transaction id
+holding up to RECEIPT_CACHE_SIZE receipts. Checkout puts each new sale in
+the cache as it commits, so printing it right after the sale reads nothing
+from the database.
+
+Besides the HTML page, receipts render as plain text RECEIPT_WIDTH columns
+wide and as ESC/POS bytes for thermal printers (the same text with the
+header centred, the store name and total in bold, then a feed and a cut).
+"""
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import current_app, render_template
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+
+from app import db
+from archive import archived_transaction
+from metrics import record_cache
+from models import Transaction, TransactionItem
+
+# Shown at the top of every receipt, as on the HTML page
+STORE_HEADER = ('Super POS System', '123 Main Street', 'Anytown, ST 12345', 'Tel: (123) 456-7890')
+FOOTER = ('Thank you for shopping with us!', 'Please come again.')
+
+# ESC/POS commands
+ESC_INIT = b'\x1b@'
+ESC_ALIGN_LEFT = b'\x1ba\x00'
+ESC_ALIGN_CENTER = b'\x1ba\x01'
+ESC_BOLD_ON = b'\x1bE\x01'
+ESC_BOLD_OFF = b'\x1bE\x00'
+ESC_FEED_LINES = b'\x1bd'
+GS_PARTIAL_CUT = b'\x1dV\x01'
+
+FORMATS = ('html', 'text', 'escpos')
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _money(amount):
+    """Amount as the checkout page shows it, e.g. $1,234.50"""
+    sign = '-' if amount < 0 else ''
+    return f'{sign}${abs(amount):,.2f}'
+
+
+def _receipt_data(transaction):
+    """Receipt fields from a transaction dict (Transaction.to_dict() or archived_transaction())"""
+    items = [{
+        'name': item['product_name'],
+        'quantity': item['quantity'],
+        'unit_price': item['unit_price'],
+        'discount': item.get('discount') or 0,
+        'total_price': item['total_price'],
+    } for item in transaction['items']]
+    discount = round(sum(item['discount'] for item in items), 2)
+    date = transaction['transaction_date']
+    return {
+        'id': transaction['id'],
+        'reference_number': transaction['reference_number'],
+        'date': datetime.fromisoformat(date) if isinstance(date, str) else date,
+        'cashier_name': transaction['cashier_name'],
+        'store_id': transaction['store_id'],
+        'payment_method': transaction['payment_method'],
+        'payment_reference': transaction['payment_reference'],
+        'items': items,
+        'subtotal': round(transaction['total_amount'] + discount, 2),
+        'discount': discount,
+        'total': transaction['total_amount'],
+    }
+
+
+def _load(transaction_id):
+    """A transaction dict with items and product names, or None"""
+    transaction = db.session.scalars(
+        select(Transaction)
+        .options(joinedload(Transaction.items).joinedload(TransactionItem.product))
+        .where(Transaction.id == transaction_id)
+    ).unique().first()
+    if transaction is not None:
+        return transaction.to_dict()
+    # Sales from closed months live in the archive tables
+    return archived_transaction(transaction_id)
+
+
+def _store(transaction_id, entry):
+    size = current_app.config['RECEIPT_CACHE_SIZE']
+    with _cache_lock:
+        _cache[transaction_id] = entry
+        _cache.move_to_end(transaction_id)
+        while len(_cache) > size:
+            _cache.popitem(last=False)
+
+
+def remember(transaction):
+    """Cache the receipt of a sale just written, from its Transaction.to_dict()"""
+    _store(transaction['id'], {'data': _receipt_data(transaction)})
+
+
+def receipt(transaction_id, fmt='html'):
+    """
+    A transaction's receipt, rendered and cached
+
+    Args:
+        transaction_id (int): The transaction
+        fmt (str): 'html', 'text' or 'escpos'
+
+    Returns:
+        The HTML or text (str), the ESC/POS bytes, or None if there is no
+        such transaction
+    """
+    with _cache_lock:
+        entry = _cache.get(transaction_id)
+        if entry is not None:
+            _cache.move_to_end(transaction_id)
+    record_cache('receipt', hit=entry is not None)
+    if entry is None:
+        transaction = _load(transaction_id)
+        if transaction is None:
+            return None
+        entry = {'data': _receipt_data(transaction)}
+        _store(transaction_id, entry)
+
+    # Rendered at most once per process; a lost race renders it twice, harmlessly
+    rendered = entry.get(fmt)
+    if rendered is None:
+        rendered = entry[fmt] = RENDERERS[fmt](entry['data'])
+    return rendered
+
+
+def _columns(left, right, width):
+    """One line with left-aligned and right-aligned text, truncating the left"""
+    room = width - len(right) - 1
+    return f'{left[:room]:<{room}} {right}'
+
+
+def _text_lines(data, width):
+    """The receipt as (kind, line) pairs; kind is 'header' for centred lines, 'total' or 'body'"""
+    rule = '-' * width
+    lines = [('header', line[:width]) for line in STORE_HEADER]
+    lines += [
+        ('body', rule),
+        ('body', _columns('Receipt #:', data['reference_number'], width)),
+        ('body', _columns('Date:', data['date'].strftime('%Y-%m-%d %H:%M'), width)),
+        ('body', _columns('Cashier:', data['cashier_name'], width)),
+        ('body', rule),
+    ]
+    for item in data['items']:
+        lines.append(('body', item['name'][:width]))
+        lines.append(('body', _columns(f"  {item['quantity']} x {_money(item['unit_price'])}",
+                                       _money(item['total_price'] + item['discount']), width)))
+        if item['discount']:
+            lines.append(('body', _columns('  Discount', _money(-item['discount']), width)))
+    lines.append(('body', rule))
+    if data['discount']:
+        lines.append(('body', _columns('Subtotal', _money(data['subtotal']), width)))
+        lines.append(('body', _columns('Discount', _money(-data['discount']), width)))
+    lines.append(('total', _columns('TOTAL', _money(data['total']), width)))
+    lines.append(('body', _columns('Paid by', data['payment_method'].upper(), width)))
+    if data['payment_reference']:
+        lines.append(('body', _columns('Reference', data['payment_reference'], width)))
+    lines.append(('body', rule))
+    lines += [('header', line[:width]) for line in FOOTER]
+    return lines
+
+
+def render_text(data):
+    """Plain-text receipt, RECEIPT_WIDTH columns wide"""
+    width = current_app.config['RECEIPT_WIDTH']
+    return '\n'.join(line.center(width).rstrip() if kind == 'header' else line
+                     for kind, line in _text_lines(data, width)) + '\n'
+
+
+def render_escpos(data):
+    """ESC/POS bytes for a thermal printer, in its default code page 437"""
+    width = current_app.config['RECEIPT_WIDTH']
+    out = [ESC_INIT]
+    for index, (kind, line) in enumerate(_text_lines(data, width)):
+        text = line.encode('cp437', errors='replace') + b'\n'
+        if kind == 'header':
+            # The store name is printed bold
+            out += [ESC_ALIGN_CENTER, ESC_BOLD_ON + text + ESC_BOLD_OFF if index == 0 else text, ESC_ALIGN_LEFT]
+        elif kind == 'total':
+            out += [ESC_BOLD_ON, text, ESC_BOLD_OFF]
+        else:
+            out.append(text)
+    out += [ESC_FEED_LINES, bytes([4]), GS_PARTIAL_CUT]
+    return b''.join(out)
+
+
+def render_html(data):
+    """The receipt page"""
+    return render_template('receipt.html', receipt=data, header=STORE_HEADER, footer=FOOTER, money=_money)
+
+
+RENDERERS = {'html': render_html, 'text': render_text, 'escpos': render_escpos}
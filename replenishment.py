@@ -0,0 +1,220 @@
+"""
+Sales velocity and reorder planning
+
+Each product's sales rate is an exponentially weighted moving average of
+units sold per day, updated in O(1) per sale: the stored rate decays by
+exp(-elapsed / tau) since the last sale and the new units add units / tau,
+where tau = VELOCITY_HALF_LIFE_DAYS / ln 2. At a steady selling rate the
+estimate converges to that rate, and a product that stops selling halves its
+rate every half-life.
+
+From the rate, the stock level and the lead time (Product.lead_time_days, or
+REORDER_LEAD_TIME_DAYS) each ProductVelocity row stores:
+
+- days_of_cover: stock / rate
+- reorder_point: rate * (lead time + REORDER_SAFETY_DAYS)
+- reorder_quantity: what brings stock up to cover the lead time, safety
+  days and one REORDER_CYCLE_DAYS order cycle
+
+A before_flush listener keeps the rows current whenever a sale is recorded or
+a product's stock or lead time changes, so /reports/inventory/reorder is one
+indexed read however long the sales history grows. Bulk writes that bypass
+the ORM call ``refresh_products``. ``flask refresh-reorder`` decays every rate
+to the present (run it nightly so products that stopped selling drop off the
+list); with --rebuild it recomputes the rates from the full sales history.
+"""
+import math
+from collections import Counter
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from flask import current_app
+
+from app import db
+from archive import daily_units
+from models import Product, ProductVelocity, TransactionItem
+from routing import RoutingSession
+
+SECONDS_PER_DAY = 86400.0
+
+# Below this rate (one unit every 100 days) a product is treated as not selling
+MIN_UNITS_PER_DAY = 0.01
+
+# Products per IN (...) lookup, to stay under database parameter limits
+REFRESH_CHUNK = 500
+
+
+def velocity_tau(config):
+    """EWMA time constant in days for the configured half-life"""
+    return config['VELOCITY_HALF_LIFE_DAYS'] / math.log(2)
+
+
+def decayed_rate(rate, since, now, tau):
+    """A rate recorded at `since`, decayed to `now`"""
+    if not rate or since is None:
+        return rate or 0.0
+    elapsed = max((now - since).total_seconds() / SECONDS_PER_DAY, 0.0)
+    return rate * math.exp(-elapsed / tau)
+
+
+def lead_time(lead_time_days, config):
+    return config['REORDER_LEAD_TIME_DAYS'] if lead_time_days is None else lead_time_days
+
+
+def plan(rate, stock, lead_time_days, config):
+    """
+    Reorder plan for one product
+
+    Args:
+        rate (float): Current units sold per day
+        stock (int): Current stock level
+        lead_time_days (int): The product's lead time, or None for the default
+        config: The app config
+
+    Returns:
+        dict: days_of_cover (None when not selling), reorder_point,
+        reorder_quantity and needs_reorder
+    """
+    if rate < MIN_UNITS_PER_DAY:
+        return {'days_of_cover': None, 'reorder_point': 0, 'reorder_quantity': 0, 'needs_reorder': False}
+
+    cover_days = lead_time(lead_time_days, config) + config['REORDER_SAFETY_DAYS']
+    reorder_point = math.ceil(rate * cover_days)
+    target = math.ceil(rate * (cover_days + config['REORDER_CYCLE_DAYS']))
+    return {
+        'days_of_cover': max(stock, 0) / rate,
+        'reorder_point': reorder_point,
+        'reorder_quantity': max(target - stock, 0),
+        'needs_reorder': stock <= reorder_point,
+    }
+
+
+def _stock_or_lead_time_changed(product):
+    attrs = sa.inspect(product).attrs
+    return attrs.stock_quantity.history.has_changes() or attrs.lead_time_days.history.has_changes()
+
+
+@sa.event.listens_for(RoutingSession, 'before_flush')
+def _track_sales_and_stock(db_session, flush_context, instances):
+    sold = Counter()
+    for obj in db_session.new:
+        if isinstance(obj, TransactionItem) and obj.product_id is not None and obj.quantity > 0:
+            sold[obj.product_id] += obj.quantity
+    changed = {obj.id for obj in db_session.dirty
+               if isinstance(obj, Product) and obj.id is not None and _stock_or_lead_time_changed(obj)}
+    if not sold and not changed:
+        return
+
+    config = current_app.config
+    tau = velocity_tau(config)
+    now = datetime.utcnow()
+    product_ids = sorted(changed | set(sold))
+    with db_session.no_autoflush:
+        rows = {row.product_id: row for row in db_session.scalars(
+            sa.select(ProductVelocity).where(ProductVelocity.product_id.in_(product_ids))
+        )}
+        for product_id in product_ids:
+            product = db_session.get(Product, product_id)
+            row = rows.get(product_id)
+            units = sold[product_id]
+            if product is None or (row is None and not units):
+                # Never sold, so there is nothing to plan yet
+                continue
+            if row is None:
+                row = ProductVelocity(product_id=product_id, units_per_day=0.0)
+                db_session.add(row)
+
+            rate = decayed_rate(row.units_per_day, row.last_sale_at, now, tau)
+            if units:
+                rate += units / tau
+                row.units_per_day, row.last_sale_at = rate, now
+            for field, value in plan(rate, product.stock_quantity, product.lead_time_days, config).items():
+                setattr(row, field, value)
+            row.updated_at = now
+
+
+def refresh_products(product_ids=None, now=None):
+    """
+    Recompute reorder plans from the stored rates, in bulk
+
+    For writes that change stock without going through the ORM, and for the
+    nightly decay. The caller commits.
+
+    Args:
+        product_ids: Products to refresh, or None for every product with a rate
+        now (datetime): Time to decay the rates to; defaults to now
+
+    Returns:
+        int: Number of plans updated
+    """
+    config = current_app.config
+    tau = velocity_tau(config)
+    now = now or datetime.utcnow()
+    query = sa.select(
+        ProductVelocity.product_id, ProductVelocity.units_per_day, ProductVelocity.last_sale_at,
+        Product.stock_quantity, Product.lead_time_days
+    ).join(Product, Product.id == ProductVelocity.product_id)
+
+    if product_ids is None:
+        queries = [query]
+    else:
+        ids = sorted(product_ids)
+        queries = [query.where(ProductVelocity.product_id.in_(ids[i:i + REFRESH_CHUNK]))
+                   for i in range(0, len(ids), REFRESH_CHUNK)]
+
+    updates = []
+    for chunk in queries:
+        for row in db.session.execute(chunk):
+            rate = decayed_rate(row.units_per_day, row.last_sale_at, now, tau)
+            updates.append(dict(plan(rate, row.stock_quantity, row.lead_time_days, config),
+                                product_id=row.product_id, updated_at=now))
+    if updates:
+        db.session.execute(sa.update(ProductVelocity), updates)
+    return len(updates)
+
+
+def rebuild_velocity(now=None):
+    """
+    Recompute every product's rate from the full sales history and replace
+    all reorder plans; commits
+
+    Sales, live and archived, are summed per product and day in one grouped
+    query, and each day counts as a single sale at noon.
+
+    Returns:
+        int: Number of products with a rate
+    """
+    config = current_app.config
+    tau = velocity_tau(config)
+    now = now or datetime.utcnow()
+    sales = daily_units(end=now)
+    daily_sales = (
+        sa.select(sales.c.product_id, sales.c.day, sa.func.sum(sales.c.quantity))
+        .group_by(sales.c.product_id, sales.c.day)
+        .having(sa.func.sum(sales.c.quantity) > 0)
+        .order_by(sales.c.product_id, sales.c.day)
+    )
+
+    rates = {}
+    for product_id, sold_on, units in db.session.execute(daily_sales):
+        when = min(datetime.fromisoformat(str(sold_on)) + timedelta(hours=12), now)
+        rate, last_sale_at = rates.get(product_id, (0.0, None))
+        rates[product_id] = (decayed_rate(rate, last_sale_at, when, tau) + units / tau, when)
+
+    rows = []
+    for product_id, stock, lead_time_days in db.session.execute(
+        sa.select(Product.id, Product.stock_quantity, Product.lead_time_days)
+    ):
+        if product_id not in rates:
+            continue
+        rate, last_sale_at = rates[product_id]
+        rows.append(dict(
+            plan(decayed_rate(rate, last_sale_at, now, tau), stock, lead_time_days, config),
+            product_id=product_id, units_per_day=rate, last_sale_at=last_sale_at, updated_at=now
+        ))
+
+    db.session.execute(sa.delete(ProductVelocity))
+    if rows:
+        db.session.execute(ProductVelocity.__table__.insert(), rows)
+    db.session.commit()
+    return len(rows)
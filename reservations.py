@@ -0,0 +1,260 @@
+"""
+Stock reservations for in-flight payments
+
+An M-PESA payment takes 30 seconds or more to complete on the customer's
+phone. ``reserve`` holds the basket's units at the till's store while it does,
+so other lanes cannot sell them and the sale cannot fail once the customer
+has paid. A hold is one conditional UPDATE per product that adds to
+StoreStock.held_quantity only while stock_quantity - held_quantity still
+covers it, so two lanes racing for the last units cannot both win, and
+available-to-sell is read straight off the StoreStock row (see
+``available_levels`` in stores.py) with no scan of open reservations.
+
+A reservation ends exactly once: ``convert`` (the sale went through),
+``release`` (the payment failed or was abandoned) and ``sweep_expired``
+(nobody came back within RESERVATION_TTL_SECONDS) each claim it with an
+UPDATE conditional on status 'held' and only the winner gives its units
+back. None of them commit; the caller's transaction does.
+
+A sale takes its units with ``sell``, the same conditional UPDATE as a hold
+but on stock_quantity itself, so it can never take units held for another
+lane or sell what a racing sale already took.
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+
+from app import db
+from models import Product, StockReservation, StockReservationItem, StoreStock
+
+# Expired reservations swept before each new hold; the CLI sweeps the rest
+SWEEP_BATCH = 100
+
+
+class InsufficientStock(ValueError):
+    """The store cannot hold all of a basket's units"""
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__('Not enough stock to hold product(s) ' + ', '.join(str(p) for p in sorted(shortages)))
+
+
+def _basket(items):
+    """Total quantity by product id of [{'product_id', 'quantity'}] items; raises ValueError"""
+    quantities = Counter()
+    try:
+        for item in items:
+            quantities[int(item['product_id'])] += int(item.get('quantity', 1))
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('Each item needs a whole-number product_id and quantity')
+    if not quantities:
+        raise ValueError('Cannot reserve a basket with no items')
+    if min(quantities.values()) < 1:
+        raise ValueError('Quantities must be at least 1')
+    return quantities
+
+
+def _take(connection, store_id, quantities, column):
+    """
+    Add to a StoreStock column (held_quantity for a hold, or take off
+    stock_quantity for a sale) product by product, only while the units not
+    yet held still cover it
+
+    Returns:
+        dict: Quantity by product id of the products that were short
+    """
+    table = StoreStock.__table__
+    sign = -1 if column == 'stock_quantity' else 1
+    shortages = {}
+    # In product order, so lanes with overlapping baskets lock rows alike
+    for product_id, quantity in sorted(quantities.items()):
+        taken = connection.execute(
+            table.update()
+            .where(table.c.store_id == store_id, table.c.product_id == product_id,
+                   table.c.stock_quantity - table.c.held_quantity >= quantity)
+            .values({column: table.c[column] + sign * quantity})
+        ).rowcount
+        if taken != 1:
+            shortages[product_id] = quantity
+    return shortages
+
+
+def _change_holds(connection, store_id, quantities, sign):
+    """Add (sign=1) or give back (sign=-1) held units at a store"""
+    table = StoreStock.__table__
+    connection.execute(
+        table.update()
+        .where(table.c.store_id == store_id, table.c.product_id == sa.bindparam('p'))
+        .values(held_quantity=table.c.held_quantity + sign * sa.bindparam('q')),
+        [{'p': product_id, 'q': quantity} for product_id, quantity in sorted(quantities.items())]
+    )
+
+
+def reserve(items, store_id, ttl_seconds, now=None):
+    """
+    Hold a basket's units at a store until the reservation ends or expires
+
+    Args:
+        items (list): [{'product_id': int, 'quantity': int}]
+        store_id (int): The store selling them
+        ttl_seconds (int): How long the hold lasts unless converted or released
+        now (datetime): Current UTC time; defaults to now
+
+    Returns:
+        StockReservation: The flushed reservation
+
+    Raises:
+        ValueError: For a malformed basket
+        InsufficientStock: When any product is short; roll back, as earlier
+            products may already be held
+    """
+    quantities = _basket(items)
+    now = now or datetime.utcnow()
+    sweep_expired(now, limit=SWEEP_BATCH)
+
+    shortages = _take(db.session.connection(), store_id, quantities, 'held_quantity')
+    if shortages:
+        raise InsufficientStock(shortages)
+
+    reservation = StockReservation(
+        store_id=store_id,
+        status='held',
+        created_at=now,
+        expires_at=now + timedelta(seconds=ttl_seconds),
+        items=[StockReservationItem(product_id=product_id, quantity=quantity)
+               for product_id, quantity in sorted(quantities.items())]
+    )
+    db.session.add(reservation)
+    db.session.flush()
+    return reservation
+
+
+def _end(condition, status):
+    """
+    Move held reservations matching a condition to a final status and give
+    their units back
+
+    Returns:
+        list: Ids of the reservations this call ended
+    """
+    connection = db.session.connection()
+    table = StockReservation.__table__
+    ended = connection.execute(
+        table.update()
+        .where(condition, table.c.status == 'held')
+        .values(status=status)
+        .returning(table.c.id, table.c.store_id)
+    ).all()
+    if not ended:
+        return []
+
+    items = StockReservationItem.__table__
+    store_of = dict(ended)
+    by_store = {}
+    for reservation_id, product_id, quantity in connection.execute(
+        sa.select(items.c.reservation_id, items.c.product_id, items.c.quantity)
+        .where(items.c.reservation_id.in_(store_of))
+    ):
+        by_store.setdefault(store_of[reservation_id], Counter())[product_id] += quantity
+    for store_id, quantities in by_store.items():
+        _change_holds(connection, store_id, quantities, -1)
+    return list(store_of)
+
+
+def release(reservation_id=None, payment_reference=None):
+    """
+    Give a held reservation's units back, by id or payment reference
+
+    Returns:
+        bool: Whether it was still held (False once converted, released or expired)
+    """
+    table = StockReservation.__table__
+    if reservation_id is not None:
+        condition = table.c.id == reservation_id
+    elif payment_reference:
+        condition = table.c.payment_reference == payment_reference
+    else:
+        return False
+    return bool(_end(condition, 'released'))
+
+
+def convert(reservation_id, store_id, quantities):
+    """
+    Turn a held reservation at a store into the sale being written: its holds
+    are dropped so the sale's own stock decrement takes the units
+
+    Only a reservation holding exactly the sale's basket is converted, so a
+    sale cannot free the holds of a basket it is not selling.
+
+    Args:
+        reservation_id (int): The reservation
+        store_id (int): The store making the sale
+        quantities (dict): Units sold by product id
+
+    Returns:
+        bool: Whether it was converted; if it was no longer held, or holds a
+            different basket, the sale has to find the stock like any other
+    """
+    items = StockReservationItem.__table__
+    held = Counter()
+    for product_id, quantity in db.session.connection().execute(
+        sa.select(items.c.product_id, items.c.quantity).where(items.c.reservation_id == reservation_id)
+    ):
+        held[product_id] += quantity
+    if held != Counter(quantities):
+        return False
+    table = StockReservation.__table__
+    return bool(_end(sa.and_(table.c.id == reservation_id, table.c.store_id == store_id), 'converted'))
+
+
+def sell(quantities, store_id):
+    """
+    Take a sale's units off a store's stock and the chain-wide totals
+
+    Units held for other payments cannot be sold; when a product is short,
+    expired holds are swept and it is tried once more. Goes around the ORM,
+    so expire stock_quantity on Product objects the session holds. Does not
+    commit.
+
+    Args:
+        quantities (dict): Units sold by product id
+        store_id (int): The store making the sale
+
+    Raises:
+        InsufficientStock: When any product is short; roll back, as other
+            products may already be taken
+    """
+    connection = db.session.connection()
+    shortages = _take(connection, store_id, quantities, 'stock_quantity')
+    if shortages and sweep_expired():
+        shortages = _take(connection, store_id, shortages, 'stock_quantity')
+    if shortages:
+        raise InsufficientStock(shortages)
+
+    table = Product.__table__
+    connection.execute(
+        table.update()
+        .where(table.c.id == sa.bindparam('p'))
+        .values(stock_quantity=table.c.stock_quantity - sa.bindparam('q')),
+        [{'p': product_id, 'q': quantity} for product_id, quantity in sorted(quantities.items())]
+    )
+
+
+def sweep_expired(now=None, limit=None):
+    """
+    Release reservations whose time ran out
+
+    Args:
+        now (datetime): Current UTC time; defaults to now
+        limit (int): Most reservations to sweep; all when None
+
+    Returns:
+        int: Number of reservations expired
+    """
+    now = now or datetime.utcnow()
+    table = StockReservation.__table__
+    due = sa.select(table.c.id).where(table.c.status == 'held', table.c.expires_at <= now)
+    if limit:
+        due = due.order_by(table.c.expires_at).limit(limit)
+    return len(_end(table.c.id.in_(due.scalar_subquery()), 'expired'))
@@ -1,17 +1,35 @@
-from flask import render_template, redirect, url_for
-from app import app
+from flask import Blueprint, Response, abort, render_template, request
+from receipts import FORMATS, receipt as render_receipt
 
-@app.route('/')
+# Blueprint for the top-level pages
+main_bp = Blueprint('main', __name__)
+
+# Content types of the receipt formats
+RECEIPT_MIMETYPES = {
+    'html': 'text/html',
+    'text': 'text/plain',
+    'escpos': 'application/octet-stream',
+}
+
+@main_bp.route('/')
 def index():
     """Main entry point of the application"""
     return render_template('index.html')
 
-@app.route('/receipt/<transaction_id>')
+@main_bp.route('/receipt/<int:transaction_id>')
 def receipt(transaction_id):
-    """Display a receipt for a specific transaction"""
-    return render_template('receipt.html', transaction_id=transaction_id)
-
-# Import all route modules
-import routes.inventory  # noqa: F401
-import routes.checkout  # noqa: F401
-import routes.reports  # noqa: F401
+    """
+    Display a receipt for a specific transaction, rendered on the server;
+    ?format=text gives plain text and ?format=escpos raw bytes for a
+    thermal printer
+    """
+    fmt = request.args.get('format', 'html')
+    if fmt not in FORMATS:
+        abort(400, description=f"format must be one of {', '.join(FORMATS)}")
+    body = render_receipt(transaction_id, fmt)
+    if body is None:
+        abort(404, description=f'Transaction {transaction_id} not found')
+    response = Response(body, mimetype=RECEIPT_MIMETYPES[fmt])
+    if fmt == 'escpos':
+        response.headers['Content-Disposition'] = f'attachment; filename=receipt-{transaction_id}.bin'
+    return response
@@ -1,32 +1,49 @@
 from flask import Blueprint, render_template, jsonify, request
 from app import db
-from models import Product, Transaction, TransactionItem, StockMovement
+from models import Product, StockReservation, StoreStock, TillSession, Transaction, TransactionItem, StockMovement, product_rows
+from collections import Counter
 from datetime import datetime
 import random
 import string
 import logging
+from sqlalchemy import and_, select, update
+from sqlalchemy.orm import joinedload, selectinload
+from profiler import query_budget
+from routing import replica_reads
+from serializers import InvalidFields
+from catalog import catalog_conditional
+from archive import archived_transaction
+from stores import available_levels, current_store_id, requested_store_id
+from pricing import price_basket
+from reservations import InsufficientStock, convert, sell
+from tills import TillSessionClosed
+from receipts import remember
 
 # Create a blueprint for checkout
 checkout_bp = Blueprint('checkout', __name__, url_prefix='/checkout')
 
+logger = logging.getLogger(__name__)
+
 @checkout_bp.route('/')
 def checkout_page():
     """Display the checkout page"""
     return render_template('checkout.html')
 
 @checkout_bp.route('/search', methods=['GET'])
+@catalog_conditional
 def search_products():
     """API endpoint to search for products by barcode, name, or category"""
     try:
         query = request.args.get('q', '')
         category = request.args.get('category', '')
+        fields = product_rows.parse_fields(request.args.get('fields'))
         
         # Base query
-        product_query = Product.query
+        product_query = select(*product_rows.columns(fields)).order_by(Product.id)
         
         # Filter by search term if provided
         if query:
-            product_query = product_query.filter(
+            product_query = product_query.where(
                 (Product.name.ilike(f'%{query}%')) |
                 (Product.barcode.ilike(f'%{query}%')) |
                 (Product.description.ilike(f'%{query}%'))
@@ -34,22 +51,113 @@ def search_products():
         
         # Filter by category if provided
         if category:
-            product_query = product_query.filter(Product.category == category)
+            product_query = product_query.where(Product.category == category)
         
         # Get results
-        products = product_query.all()
+        rows = db.session.execute(product_query)
+        
+        return jsonify({
+            'success': True,
+            'products': product_rows.serialize(fields, rows)
+        })
+    except InvalidFields as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error("Error searching products: %s", e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@checkout_bp.route('/quote', methods=['POST'])
+# The promotion version and the basket, plus two when promotions changed and are recompiled
+@query_budget(4)
+def quote_basket():
+    """
+    API endpoint to price a basket without selling it: line prices with
+    promotions, totals and each line's stock at the request's store. Tills
+    call it as items are scanned; the sale is priced the same way.
+    """
+    try:
+        data = request.json or {}
+        try:
+            basket = [(int(item['product_id']), int(item.get('quantity', 1))) for item in data.get('items', [])]
+        except (KeyError, TypeError, ValueError):
+            return jsonify({
+                'success': False,
+                'error': 'Each item needs a whole-number product_id and quantity'
+            }), 400
+        if any(quantity < 1 for _, quantity in basket):
+            return jsonify({
+                'success': False,
+                'error': 'Quantities must be at least 1'
+            }), 400
+        
+        # Products, prices and store stock not held for other payments, for the whole basket in one query
+        store_id = current_store_id()
+        rows = {row.id: row for row in db.session.execute(
+            select(Product.id, Product.name, Product.category, Product.price,
+                   (StoreStock.stock_quantity - StoreStock.held_quantity).label('available'))
+            .outerjoin(StoreStock, and_(StoreStock.product_id == Product.id, StoreStock.store_id == store_id))
+            .where(Product.id.in_(sorted({product_id for product_id, _ in basket})))
+        )}
+        missing = [product_id for product_id, _ in basket if product_id not in rows]
+        if missing:
+            return jsonify({
+                'success': False,
+                'error': f'Product with ID {missing[0]} not found'
+            }), 404
+        
+        lines = [(product_id, rows[product_id].category, float(rows[product_id].price), quantity)
+                 for product_id, quantity in basket]
+        priced, total = price_basket(lines)
         
+        # Lines of the same product draw on one stock level, as in a sale
+        needed = {}
+        quote_lines = []
+        for (product_id, quantity), line in zip(basket, priced):
+            available = max(rows[product_id].available or 0, 0)
+            needed[product_id] = needed.get(product_id, 0) + quantity
+            quote_lines.append(dict(
+                line,
+                product_id=product_id,
+                name=rows[product_id].name,
+                quantity=quantity,
+                available=available,
+                in_stock=needed[product_id] <= available
+            ))
+        discount = round(sum(line['discount'] for line in priced), 2)
         return jsonify({
             'success': True,
-            'products': [product.to_dict() for product in products]
+            'quote': {
+                'store_id': store_id,
+                'lines': quote_lines,
+                'subtotal': round(total + discount, 2),
+                'discount': discount,
+                'total': total,
+                'in_stock': all(line['in_stock'] for line in quote_lines)
+            }
         })
     except Exception as e:
-        logging.error(f"Error searching products: {str(e)}")
+        logger.error("Error quoting basket: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+def _optional_id(data, field):
+    """Optional whole-number id from a request body; raises ValueError"""
+    value = data.get(field)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{field} must be a whole number')
+
 @checkout_bp.route('/transactions', methods=['POST'])
 def create_transaction():
     """API endpoint to create a new transaction (complete a sale)"""
@@ -66,47 +174,114 @@ def create_transaction():
         # Generate a unique reference number
         reference_number = 'TRX-' + ''.join(random.choices(string.digits, k=6))
         
+        try:
+            basket = [(int(item['product_id']), int(item.get('quantity', 0))) for item in items]
+        except (KeyError, TypeError, ValueError):
+            return jsonify({
+                'success': False,
+                'error': 'Each item needs a whole-number product_id and quantity'
+            }), 400
+        try:
+            till_session_id = _optional_id(data, 'till_session_id')
+            reservation_id = _optional_id(data, 'reservation_id')
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        # Sales rung up in a till session add to its running totals
+        store_id = current_store_id()
+        if till_session_id is not None:
+            till_session = db.session.get(TillSession, till_session_id)
+            if till_session is None or till_session.store_id != store_id:
+                return jsonify({
+                    'success': False,
+                    'error': f'Till session {till_session_id} not found at this store'
+                }), 400
+            if till_session.status != 'open':
+                return jsonify({
+                    'success': False,
+                    'error': f'Till session {till_session_id} is closed'
+                }), 409
+        
+        # Load the basket's products at once
+        products = {product.id: product for product in db.session.scalars(
+            select(Product).where(Product.id.in_({product_id for product_id, _ in basket}))
+        )}
+        
+        lines = []
+        quantities = Counter()
+        for product_id, quantity in basket:
+            # Get the product
+            product = products.get(product_id)
+            if not product:
+                return jsonify({
+                    'success': False,
+                    'error': f'Product with ID {product_id} not found'
+                }), 404
+            if quantity < 1:
+                return jsonify({
+                    'success': False,
+                    'error': f'Quantity of {product.name} must be at least 1'
+                }), 400
+            quantities[product.id] += quantity
+            lines.append((product.id, product.category, float(product.price), quantity))
+        
+        # A sale paid for under a reservation of this basket takes the units
+        # held for it
+        if reservation_id is not None and not convert(reservation_id, store_id, quantities):
+            logger.warning("Reservation %s is not held for this basket; selling from available stock",
+                           reservation_id)
+            reservation_id = None
+        
+        # Stock is taken at the store making the sale, never from units held
+        # for other lanes' payments
+        try:
+            sell(quantities, store_id)
+        except InsufficientStock as e:
+            db.session.rollback()
+            available = available_levels(store_id, e.shortages)
+            product = next(products[product_id] for product_id, _, _, _ in lines if product_id in e.shortages)
+            return jsonify({
+                'success': False,
+                'error': f'Not enough stock for {product.name}. Available: {available.get(product.id, 0)}'
+            }), 400
+        for product in products.values():
+            db.session.expire(product, ['stock_quantity'])
+        
+        # Prices and the total are set here, with promotions applied
+        priced, total_amount = price_basket(lines)
+        if data.get('total_amount') is not None and abs(float(data['total_amount']) - total_amount) >= 0.01:
+            logger.info("Sale priced at %s; the till sent %s", total_amount, data['total_amount'])
+        
         # Create the transaction
         transaction = Transaction(
             reference_number=reference_number,
             transaction_date=datetime.utcnow(),
-            total_amount=float(data.get('total_amount', 0)),
+            total_amount=total_amount,
             payment_method=data.get('payment_method', 'cash'),
             payment_reference=data.get('payment_reference', ''),
-            cashier_name=data.get('cashier_name', 'System')
+            cashier_name=data.get('cashier_name', 'System'),
+            store_id=store_id,
+            till_session_id=till_session_id
         )
         db.session.add(transaction)
         db.session.flush()  # Get the transaction ID without committing
+        if reservation_id is not None:
+            db.session.execute(
+                update(StockReservation).where(StockReservation.id == reservation_id)
+                .values(transaction_id=transaction.id)
+            )
         
         # Add transaction items
-        for item in items:
-            product_id = item.get('product_id')
-            quantity = int(item.get('quantity', 0))
-            
-            # Get the product
-            product = Product.query.get(product_id)
-            if not product:
-                db.session.rollback()
-                return jsonify({
-                    'success': False,
-                    'error': f'Product with ID {product_id} not found'
-                }), 404
-            
-            # Check if enough stock is available
-            if product.stock_quantity < quantity:
-                db.session.rollback()
-                return jsonify({
-                    'success': False,
-                    'error': f'Not enough stock for {product.name}. Available: {product.stock_quantity}'
-                }), 400
-            
+        for (product_id, _, _, quantity), line in zip(lines, priced):
             # Create transaction item
             transaction_item = TransactionItem(
                 transaction_id=transaction.id,
                 product_id=product_id,
                 quantity=quantity,
-                unit_price=float(product.price),
-                total_price=float(product.price * quantity)
+                **line
             )
             db.session.add(transaction_item)
             
@@ -119,52 +294,80 @@ def create_transaction():
                 notes=f'Sale transaction {transaction.reference_number}'
             )
             db.session.add(stock_movement)
-            
-            # Update product stock
-            product.stock_quantity -= quantity
         
         # Commit all changes
         db.session.commit()
         
+        # Cached now, so the receipt printed next needs no database reads
+        sale = transaction.to_dict()
+        remember(sale)
         return jsonify({
             'success': True,
-            'transaction': transaction.to_dict()
+            'transaction': sale
         }), 201
+    except TillSessionClosed as e:
+        # Closed while the sale was being written; its Z-report is already taken
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 409
     except Exception as e:
         db.session.rollback()
-        logging.error(f"Error creating transaction: {str(e)}")
+        logger.error("Error creating transaction: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
 @checkout_bp.route('/transactions/<int:transaction_id>', methods=['GET'])
+@query_budget(3)
 def get_transaction(transaction_id):
     """API endpoint to get details of a specific transaction"""
     try:
-        transaction = Transaction.query.get_or_404(transaction_id)
+        transaction = Transaction.query.options(
+            selectinload(Transaction.items).joinedload(TransactionItem.product)
+        ).filter_by(id=transaction_id).first()
+        if transaction is not None:
+            transaction = transaction.to_dict()
+        else:
+            # Sales from closed months live in the archive tables
+            transaction = archived_transaction(transaction_id)
+        if transaction is None:
+            return jsonify({
+                'success': False,
+                'error': f'Transaction {transaction_id} not found'
+            }), 404
         return jsonify({
             'success': True,
-            'transaction': transaction.to_dict()
+            'transaction': transaction
         })
     except Exception as e:
-        logging.error(f"Error fetching transaction {transaction_id}: {str(e)}")
+        logger.error("Error fetching transaction %s: %s", transaction_id, e)
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
 @checkout_bp.route('/transactions', methods=['GET'])
+@query_budget(3)
+@replica_reads
 def get_transactions():
-    """API endpoint to get recent transactions"""
+    """API endpoint to get recent transactions, of the request's store when one is given"""
     try:
-        transactions = Transaction.query.order_by(Transaction.transaction_date.desc()).limit(50).all()
+        query = Transaction.query.options(
+            selectinload(Transaction.items).joinedload(TransactionItem.product)
+        )
+        store_id = requested_store_id()
+        if store_id is not None:
+            query = query.filter(Transaction.store_id == store_id)
+        transactions = query.order_by(Transaction.transaction_date.desc()).limit(50).all()
         return jsonify({
             'success': True,
             'transactions': [transaction.to_dict() for transaction in transactions]
         })
     except Exception as e:
-        logging.error(f"Error fetching transactions: {str(e)}")
+        logger.error("Error fetching transactions: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
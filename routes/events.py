@@ -0,0 +1,33 @@
+from flask import Blueprint, jsonify, request, current_app
+import logging
+from outbox import event_dict, read_events
+from profiler import query_budget
+
+# Create a blueprint for the change stream
+events_bp = Blueprint('events', __name__, url_prefix='/events')
+
+logger = logging.getLogger(__name__)
+
+@events_bp.route('', methods=['GET'])
+@query_budget(1)
+def get_events():
+    """
+    API endpoint to stream changes: the events after ?after=<event id>,
+    oldest first. Pass the returned next_after as ?after= to continue.
+    """
+    try:
+        after = request.args.get('after', 0, type=int)
+        batch_size = current_app.config['OUTBOX_BATCH_SIZE']
+        limit = min(max(request.args.get('limit', batch_size, type=int), 1), batch_size)
+        events = [event_dict(row) for row in read_events(after, limit)]
+        return jsonify({
+            'success': True,
+            'events': events,
+            'next_after': events[-1]['id'] if events else after
+        })
+    except Exception as e:
+        logger.error("Error fetching events: %s", e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
@@ -1,27 +1,216 @@
-from flask import Blueprint, render_template, jsonify, request
+from flask import Blueprint, render_template, jsonify, request, g
 from app import db
-from models import Product, StockMovement
+from models import Product, ProductTombstone, StockMovement, Store, StoreStock, product_rows, stock_movement_rows
+from catalog import catalog_conditional, current_version
+from batch_updates import BatchError, apply_product_changes
 import logging
+from datetime import datetime
+from sqlalchemy import func, select
+from profiler import query_budget
+from routing import replica_reads
+from serializers import InvalidFields
+from stock_ledger import parse_as_of, stock_as_of
+from stores import requested_store_id, store_levels
+from pagination import (
+    InvalidQuery, after_cursor, decode_cursor, encode_cursor, keyset_order, parse_limit, parse_sort
+)
 
 # Create a blueprint for inventory management
 inventory_bp = Blueprint('inventory', __name__, url_prefix='/inventory')
 
+logger = logging.getLogger(__name__)
+
+# ?sort= options for the product listing; each has an index on (column, id)
+PRODUCT_SORTS = {
+    'id': Product.id,
+    'name': Product.name,
+    'barcode': Product.barcode,
+    'price': Product.price,
+    'category': Product.category,
+    'stock_quantity': Product.stock_quantity,
+}
+
+MAX_PAGE_SIZE = 1000
+
+# Sign applied to a stock movement's quantity, by movement_type
+MOVEMENT_SIGNS = {'in': 1, 'out': -1, 'adjustment': 1}
+
 @inventory_bp.route('/')
 def inventory_page():
     """Display the inventory management page"""
     return render_template('inventory.html')
 
+def _int_arg(name):
+    value = request.args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise InvalidQuery(f'{name} must be a whole number')
+
+def _product_filters():
+    """SQL conditions for the listing's category, q, min_stock and max_stock parameters"""
+    conditions = []
+    category = request.args.get('category')
+    if category and category != 'all':
+        conditions.append(Product.category == category)
+    query = request.args.get('q', '').strip()
+    if query:
+        pattern = f'%{query}%'
+        conditions.append(
+            Product.name.ilike(pattern) |
+            Product.barcode.ilike(pattern) |
+            Product.category.ilike(pattern) |
+            Product.description.ilike(pattern)
+        )
+    min_stock, max_stock = _int_arg('min_stock'), _int_arg('max_stock')
+    if min_stock is not None:
+        conditions.append(Product.stock_quantity >= min_stock)
+    if max_stock is not None:
+        conditions.append(Product.stock_quantity <= max_stock)
+    return conditions
+
 @inventory_bp.route('/products', methods=['GET'])
+@catalog_conditional
 def get_products():
-    """API endpoint to get all products"""
+    """
+    API endpoint to list products
+
+    Filters (category, q, min_stock, max_stock) and sorting (?sort=price,
+    ?sort=-name) run in SQL. With ?limit= the result is paged: pass the
+    returned next_cursor as ?cursor= to get the following page. total is the
+    number of matching products; ?fields=id,name,... limits the keys returned.
+    """
+    try:
+        fields = product_rows.parse_fields(request.args.get('fields'))
+        sort, sort_column, descending = parse_sort(request.args.get('sort'), PRODUCT_SORTS, 'id')
+        limit = parse_limit(request.args.get('limit'), None, MAX_PAGE_SIZE)
+        cursor = request.args.get('cursor')
+        conditions = _product_filters()
+        
+        total = db.session.execute(
+            select(func.count()).select_from(Product).where(*conditions)
+        ).scalar_one()
+        
+        # The sort value and id ride along after the requested fields to build the cursor
+        page_query = select(*product_rows.columns(fields), sort_column, Product.id).where(*conditions)
+        if cursor:
+            value, last_id = decode_cursor(cursor, sort)
+            page_query = page_query.where(after_cursor(sort_column, Product.id, value, last_id, descending))
+        page_query = page_query.order_by(*keyset_order(sort_column, Product.id, descending))
+        if limit:
+            page_query = page_query.limit(limit + 1)
+        rows = db.session.execute(page_query).all()
+        
+        next_cursor = None
+        if limit and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(sort, rows[-1][-2], rows[-1][-1])
+        
+        return jsonify({
+            'success': True,
+            'version': g.catalog_version,
+            'total': total,
+            'next_cursor': next_cursor,
+            'products': product_rows.serialize(fields, rows)
+        })
+    except (InvalidFields, InvalidQuery) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error("Error fetching products: %s", e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@inventory_bp.route('/products/changes', methods=['GET'])
+def get_product_changes():
+    """
+    API endpoint to get products created, updated or deleted after catalog
+    version ?since=; apply 'deleted' before upserting 'products'
+
+    Stock-only changes do not move the catalog version, so stock levels
+    here are as of each product's last catalog change.
+    """
     try:
-        products = Product.query.all()
+        since = request.args.get('since', type=int)
+        if since is None:
+            return jsonify({
+                'success': False,
+                'error': 'since must be a catalog version number'
+            }), 400
+        fields = product_rows.parse_fields(request.args.get('fields'))
+        
+        # Read the version first so the rows returned are at least that new
+        version = current_version(db.session)
+        rows = db.session.execute(
+            select(*product_rows.columns(fields))
+            .where(Product.catalog_version > since)
+            .order_by(Product.id)
+        )
+        deleted = db.session.execute(
+            select(ProductTombstone.product_id)
+            .where(ProductTombstone.catalog_version > since)
+            .distinct()
+        ).scalars().all()
         return jsonify({
             'success': True,
-            'products': [product.to_dict() for product in products]
+            'version': version,
+            'products': product_rows.serialize(fields, rows),
+            'deleted': deleted
         })
+    except InvalidFields as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
-        logging.error(f"Error fetching products: {str(e)}")
+        logger.error("Error fetching product changes: %s", e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@inventory_bp.route('/products/batch', methods=['POST'])
+def batch_update_products():
+    """
+    API endpoint to change the price, cost price or counted stock of many
+    products at once
+
+    All changes are applied in one transaction, or none if any is invalid.
+    With "dry_run": true the per-product diff is returned without saving.
+    """
+    try:
+        data = request.json or {}
+        dry_run = bool(data.get('dry_run', False))
+        applied, results, summary = apply_product_changes(
+            data.get('changes'),
+            reference=data.get('reference'),
+            notes=data.get('notes'),
+            dry_run=dry_run
+        )
+        response = {
+            'success': applied or (dry_run and not summary['error']),
+            'dry_run': dry_run,
+            'summary': summary,
+            'results': results
+        }
+        if summary['error']:
+            response['error'] = f"{summary['error']} change(s) failed validation; nothing was saved"
+            return jsonify(response), 400
+        return jsonify(response)
+    except BatchError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Error applying product batch: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -37,7 +226,7 @@ def get_product(product_id):
             'product': product.to_dict()
         })
     except Exception as e:
-        logging.error(f"Error fetching product {product_id}: {str(e)}")
+        logger.error("Error fetching product %s: %s", product_id, e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -58,7 +247,7 @@ def add_product():
             stock_quantity=int(data.get('stock_quantity', 0))
         )
         db.session.add(product)
-        db.session.commit()
+        db.session.flush()  # Get the product ID without committing
         
         # Create stock movement for initial stock
         if product.stock_quantity > 0:
@@ -70,7 +259,9 @@ def add_product():
                 notes='Initial stock upon product creation'
             )
             db.session.add(stock_movement)
-            db.session.commit()
+        
+        # Product and movement are saved together
+        db.session.commit()
             
         return jsonify({
             'success': True,
@@ -78,7 +269,7 @@ def add_product():
         }), 201
     except Exception as e:
         db.session.rollback()
-        logging.error(f"Error adding product: {str(e)}")
+        logger.error("Error adding product: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -93,6 +284,7 @@ def update_product(product_id):
         
         # Track stock changes for movement record
         old_stock = product.stock_quantity
+        old_level = new_level = old_stock
         
         # Update product fields if present in the request
         if 'barcode' in data:
@@ -108,9 +300,18 @@ def update_product(product_id):
         if 'category' in data:
             product.category = data['category']
         if 'stock_quantity' in data:
-            product.stock_quantity = int(data['stock_quantity'])
-        
-        db.session.commit()
+            new_level = int(data['stock_quantity'])
+            store_id = requested_store_id()
+            if store_id is None:
+                product.stock_quantity = new_level
+            else:
+                # A count at one store sets that store's level; the chain
+                # total moves by the same amount
+                old_level = store_levels(store_id, [product.id]).get(product.id, 0)
+                product.stock_quantity = old_stock + new_level - old_level
+        if 'lead_time_days' in data:
+            lead_time_days = data['lead_time_days']
+            product.lead_time_days = None if lead_time_days in (None, '') else int(lead_time_days)
         
         # Create stock movement if quantity changed
         new_stock = product.stock_quantity
@@ -122,10 +323,12 @@ def update_product(product_id):
                 quantity=quantity if movement_type == 'in' else -quantity,
                 movement_type=movement_type,
                 reference='Stock Adjustment',
-                notes=f'Stock adjusted from {old_stock} to {new_stock}'
+                notes=f'Stock adjusted from {old_level} to {new_level}'
             )
             db.session.add(stock_movement)
-            db.session.commit()
+        
+        # Product and movement are saved together
+        db.session.commit()
             
         return jsonify({
             'success': True,
@@ -133,7 +336,7 @@ def update_product(product_id):
         })
     except Exception as e:
         db.session.rollback()
-        logging.error(f"Error updating product {product_id}: {str(e)}")
+        logger.error("Error updating product %s: %s", product_id, e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -152,23 +355,136 @@ def delete_product(product_id):
         })
     except Exception as e:
         db.session.rollback()
-        logging.error(f"Error deleting product {product_id}: {str(e)}")
+        logger.error("Error deleting product %s: %s", product_id, e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@inventory_bp.route('/products/<int:product_id>/stock', methods=['GET'])
+def get_product_stock(product_id):
+    """
+    API endpoint to get a product's stock from the ledger, now or as of
+    ?as_of=<ISO 8601 date or timestamp, UTC>
+    """
+    try:
+        as_of = parse_as_of(request.args.get('as_of'))
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    try:
+        product = db.session.get(Product, product_id)
+        if product is None:
+            return jsonify({
+                'success': False,
+                'error': f'Product with ID {product_id} not found'
+            }), 404
+        
+        ledger = stock_as_of(product_id, as_of)
+        result = {
+            'success': True,
+            'product_id': product_id,
+            'as_of': (as_of or datetime.utcnow()).isoformat(),
+            **ledger
+        }
+        if as_of is None:
+            # The current ledger stock should agree with the live counter
+            result['recorded_stock_quantity'] = product.stock_quantity
+            result['drift'] = product.stock_quantity - ledger['stock_quantity']
+        return jsonify(result)
+    except Exception as e:
+        logger.error("Error fetching stock for product %s: %s", product_id, e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@inventory_bp.route('/products/<int:product_id>/stores', methods=['GET'])
+def get_product_store_stock(product_id):
+    """API endpoint to get a product's stock at each store, and how much of it is held for payments"""
+    try:
+        product = db.session.get(Product, product_id)
+        if product is None:
+            return jsonify({
+                'success': False,
+                'error': f'Product with ID {product_id} not found'
+            }), 404
+        
+        rows = db.session.execute(
+            select(Store.id, Store.code, Store.name, StoreStock.stock_quantity, StoreStock.held_quantity)
+            .join(StoreStock, StoreStock.store_id == Store.id)
+            .where(StoreStock.product_id == product_id)
+            .order_by(Store.id)
+        )
+        return jsonify({
+            'success': True,
+            'product_id': product_id,
+            'stock_quantity': product.stock_quantity,
+            'stores': [{
+                'store_id': store_id,
+                'code': code,
+                'name': name,
+                'stock_quantity': stock_quantity,
+                'held_quantity': held_quantity,
+                'available': max(stock_quantity - held_quantity, 0)
+            } for store_id, code, name, stock_quantity, held_quantity in rows]
+        })
+    except Exception as e:
+        logger.error("Error fetching store stock for product %s: %s", product_id, e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@inventory_bp.route('/stores', methods=['GET'])
+def get_stores():
+    """API endpoint to list the chain's stores"""
+    try:
+        stores = db.session.execute(select(Store).order_by(Store.id)).scalars()
+        return jsonify({
+            'success': True,
+            'stores': [store.to_dict() for store in stores]
+        })
+    except Exception as e:
+        logger.error("Error fetching stores: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
 @inventory_bp.route('/stock-movements', methods=['GET'])
+@query_budget(2)
+@replica_reads
 def get_stock_movements():
-    """API endpoint to get stock movement history"""
+    """
+    API endpoint to get stock movement history, of the request's store when
+    one is given; ?fields=id,quantity,... limits the keys returned
+    """
     try:
-        movements = StockMovement.query.order_by(StockMovement.movement_date.desc()).all()
+        fields = stock_movement_rows.parse_fields(request.args.get('fields'))
+        query = (
+            select(*stock_movement_rows.columns(fields))
+            .select_from(StockMovement)
+            .outerjoin(Product, StockMovement.product_id == Product.id)
+            .order_by(StockMovement.movement_date.desc())
+        )
+        store_id = requested_store_id()
+        if store_id is not None:
+            query = query.where(StockMovement.store_id == store_id)
+        rows = db.session.execute(query)
         return jsonify({
             'success': True,
-            'movements': [movement.to_dict() for movement in movements]
+            'movements': stock_movement_rows.serialize(fields, rows)
         })
+    except InvalidFields as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
-        logging.error(f"Error fetching stock movements: {str(e)}")
+        logger.error("Error fetching stock movements: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -183,21 +499,33 @@ def add_stock_movement():
         quantity = int(data.get('quantity', 0))
         movement_type = data.get('movement_type')
         
+        # 'in' and 'out' take a positive quantity; an adjustment is a signed
+        # correction (e.g. -3 after a stock count finds three missing)
+        if movement_type not in MOVEMENT_SIGNS:
+            return jsonify({
+                'success': False,
+                'error': f"movement_type must be one of {', '.join(MOVEMENT_SIGNS)}"
+            }), 400
+        if quantity <= 0 and (movement_type != 'adjustment' or quantity == 0):
+            return jsonify({
+                'success': False,
+                'error': 'quantity must be a positive number, or non-zero for an adjustment'
+            }), 400
+        quantity *= MOVEMENT_SIGNS[movement_type]
+        
         # Create the stock movement
         stock_movement = StockMovement(
             product_id=product.id,
-            quantity=quantity if movement_type == 'in' else -quantity,
+            quantity=quantity,
             movement_type=movement_type,
             reference=data.get('reference', ''),
             notes=data.get('notes', '')
         )
         db.session.add(stock_movement)
         
-        # Update product stock quantity
-        if movement_type == 'in':
-            product.stock_quantity += quantity
-        elif movement_type == 'out':
-            product.stock_quantity -= quantity
+        # Every movement type changes stock by its signed quantity, so the
+        # ledger always sums to the counter
+        product.stock_quantity += quantity
         
         db.session.commit()
         
@@ -208,13 +536,14 @@ def add_stock_movement():
         }), 201
     except Exception as e:
         db.session.rollback()
-        logging.error(f"Error adding stock movement: {str(e)}")
+        logger.error("Error adding stock movement: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
 @inventory_bp.route('/categories', methods=['GET'])
+@catalog_conditional
 def get_categories():
     """API endpoint to get all product categories"""
     try:
@@ -227,7 +556,7 @@ def get_categories():
             'categories': category_list
         })
     except Exception as e:
-        logging.error(f"Error fetching categories: {str(e)}")
+        logger.error("Error fetching categories: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
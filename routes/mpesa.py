@@ -1,11 +1,12 @@
-from flask import Blueprint, request, jsonify, session, redirect, url_for
+from flask import Blueprint, current_app, request, jsonify, session, redirect, url_for
 import logging
-import json
 from datetime import datetime
 
 from app import db
 from models import Transaction
 from mpesa_integration import MpesaIntegration
+from reservations import InsufficientStock, release, reserve
+from stores import current_store_id
 
 # Create blueprint
 mpesa_bp = Blueprint('mpesa', __name__, url_prefix='/mpesa')
@@ -16,7 +17,11 @@ logger = logging.getLogger(__name__)
 def initiate_payment():
     """
     Initiate an M-PESA STK Push payment
+
+    With the basket's items, their stock is held at the till's store until
+    the sale is recorded, the payment fails or RESERVATION_TTL_SECONDS pass.
     """
+    reservation_id = None
     try:
         data = request.json
         
@@ -41,6 +46,28 @@ def initiate_payment():
         reference = data['reference']
         description = data.get('description', 'Payment for goods')
         
+        # Hold the stock before the customer is asked to pay
+        reservation = None
+        if data.get('items'):
+            try:
+                reservation = reserve(data['items'], current_store_id(), current_app.config['RESERVATION_TTL_SECONDS'])
+            except InsufficientStock as e:
+                db.session.rollback()
+                return jsonify({
+                    'success': False,
+                    'message': str(e),
+                    'shortages': [{'product_id': product_id, 'quantity': quantity}
+                                  for product_id, quantity in sorted(e.shortages.items())]
+                }), 409
+            except ValueError as e:
+                db.session.rollback()
+                return jsonify({
+                    'success': False,
+                    'message': str(e)
+                }), 400
+            reservation_id = reservation.id
+            db.session.commit()
+        
         # Initiate STK Push
         result = MpesaIntegration.initiate_stk_push(
             phone_number=phone,
@@ -51,6 +78,9 @@ def initiate_payment():
         
         # Check for errors
         if result.get('error', False):
+            if reservation_id is not None:
+                release(reservation_id)
+                db.session.commit()
             return jsonify({
                 'success': False,
                 'message': result.get('ResponseDescription', 'Failed to initiate payment'),
@@ -59,6 +89,10 @@ def initiate_payment():
         
         # Store checkout request ID in session for later verification
         checkout_request_id = result.get('CheckoutRequestID')
+        if reservation is not None:
+            # So the payment's callback can find the reservation
+            reservation.payment_reference = checkout_request_id
+            db.session.commit()
         if checkout_request_id:
             # Store in session - this could also be stored in a database
             session['mpesa_checkout_id'] = checkout_request_id
@@ -72,12 +106,18 @@ def initiate_payment():
             'data': {
                 'checkout_request_id': checkout_request_id,
                 'reference': reference,
+                'reservation_id': reservation_id,
+                'expires_at': reservation.expires_at.isoformat() if reservation is not None else None,
                 'simulation': result.get('simulation', False)
             }
         })
         
     except Exception as e:
-        logger.error(f"Error initiating M-PESA payment: {str(e)}")
+        db.session.rollback()
+        if reservation_id is not None:
+            release(reservation_id)
+            db.session.commit()
+        logger.error("Error initiating M-PESA payment: %s", e)
         return jsonify({
             'success': False,
             'message': f'Error: {str(e)}'
@@ -93,7 +133,8 @@ def mpesa_callback():
     try:
         # Parse the M-PESA callback data
         callback_data = request.json
-        logger.info(f"M-PESA callback received: {json.dumps(callback_data)}")
+        # The payload is attached as a structured field and encoded off the request thread
+        logger.info("M-PESA callback received", extra={'payload': callback_data})
         
         # Extract the necessary information
         # The structure depends on the callback data format from Safaricom
@@ -116,7 +157,7 @@ def mpesa_callback():
                 transaction_date = next((item['Value'] for item in callback_metadata if item['Name'] == 'TransactionDate'), '')
                 phone_number = next((item['Value'] for item in callback_metadata if item['Name'] == 'PhoneNumber'), '')
                 
-                logger.info(f"Successful M-PESA payment: {mpesa_receipt}, Amount: {amount}, Phone: {phone_number}")
+                logger.info("Successful M-PESA payment: %s, Amount: %s, Phone: %s", mpesa_receipt, amount, phone_number)
                 
                 # TODO: Update transaction in database
                 # This would typically update a pending transaction to 'completed'
@@ -128,10 +169,14 @@ def mpesa_callback():
                 })
             else:
                 # Payment failed
-                logger.error(f"M-PESA payment failed: {result_desc}")
+                logger.error("M-PESA payment failed: %s", result_desc)
                 
                 # TODO: Update transaction in database to 'failed'
                 
+                # The customer did not pay, so the basket's stock can be sold again
+                if checkout_request_id and release(payment_reference=checkout_request_id):
+                    db.session.commit()
+                
                 # Return acknowledgement to Safaricom
                 return jsonify({
                     "ResultCode": 0,
@@ -139,14 +184,14 @@ def mpesa_callback():
                 })
         
         # Invalid callback data
-        logger.warning(f"Invalid M-PESA callback data: {callback_data}")
+        logger.warning("Invalid M-PESA callback data: %s", callback_data)
         return jsonify({
             "ResultCode": 1,
             "ResultDesc": "Invalid callback data"
         }), 400
         
     except Exception as e:
-        logger.error(f"Error processing M-PESA callback: {str(e)}")
+        logger.error("Error processing M-PESA callback: %s", e)
         return jsonify({
             "ResultCode": 1,
             "ResultDesc": f"Error: {str(e)}"
@@ -171,8 +216,8 @@ def verify_payment(checkout_request_id):
         # Check result code
         result_code = result.get('ResultCode')
         
-        # Payment succeeded
-        if result_code == 0:
+        # Payment succeeded (Daraja reports result codes as strings)
+        if str(result_code) == '0':
             # Here you might update a transaction in the database
             return jsonify({
                 'success': True,
@@ -196,8 +241,29 @@ def verify_payment(checkout_request_id):
         })
         
     except Exception as e:
-        logger.error(f"Error verifying M-PESA payment: {str(e)}")
+        logger.error("Error verifying M-PESA payment: %s", e)
         return jsonify({
             'success': False,
             'message': f'Error: {str(e)}'
-        }), 500
\ No newline at end of file
+        }), 500
+
+@mpesa_bp.route('/reservations/<int:reservation_id>/release', methods=['POST'])
+def release_reservation(reservation_id):
+    """
+    Give back the stock held for a payment that was cancelled or timed out
+    """
+    try:
+        released = release(reservation_id)
+        db.session.commit()
+        return jsonify({
+            'success': True,
+            'released': released,
+            'message': 'Reservation released' if released else 'Reservation was no longer held'
+        })
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Error releasing reservation %s: %s", reservation_id, e)
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        }), 500
@@ -0,0 +1,113 @@
+from flask import Blueprint, jsonify, request
+from app import db
+from models import Promotion
+import logging
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+from pricing import update_promotion
+from profiler import query_budget
+
+# Create a blueprint for promotion management
+promotions_bp = Blueprint('promotions', __name__, url_prefix='/promotions')
+
+logger = logging.getLogger(__name__)
+
+@promotions_bp.route('', methods=['GET'])
+@query_budget(2)
+def get_promotions():
+    """API endpoint to list promotions; ?active=1 leaves out switched-off ones"""
+    try:
+        query = select(Promotion).options(selectinload(Promotion.items)).order_by(Promotion.id)
+        if request.args.get('active', '').lower() in ('1', 'true', 'yes'):
+            query = query.where(Promotion.active.is_(True))
+        promotions = db.session.scalars(query).all()
+        return jsonify({
+            'success': True,
+            'promotions': [promotion.to_dict() for promotion in promotions]
+        })
+    except Exception as e:
+        logger.error("Error fetching promotions: %s", e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@promotions_bp.route('', methods=['POST'])
+def add_promotion():
+    """API endpoint to add a promotion; checkout applies it from the next sale"""
+    try:
+        promotion = Promotion(active=True)
+        update_promotion(promotion, request.json or {})
+        db.session.add(promotion)
+        db.session.commit()
+        return jsonify({
+            'success': True,
+            'promotion': promotion.to_dict()
+        }), 201
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Error adding promotion: %s", e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@promotions_bp.route('/<int:promotion_id>', methods=['PUT'])
+def update_promotion_view(promotion_id):
+    """API endpoint to change a promotion"""
+    try:
+        promotion = db.session.get(Promotion, promotion_id)
+        if promotion is None:
+            return jsonify({
+                'success': False,
+                'error': f'Promotion {promotion_id} not found'
+            }), 404
+        update_promotion(promotion, request.json or {})
+        db.session.commit()
+        return jsonify({
+            'success': True,
+            'promotion': promotion.to_dict()
+        })
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Error updating promotion %s: %s", promotion_id, e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@promotions_bp.route('/<int:promotion_id>', methods=['DELETE'])
+def delete_promotion(promotion_id):
+    """API endpoint to delete a promotion; past sales keep their discounts"""
+    try:
+        promotion = db.session.get(Promotion, promotion_id)
+        if promotion is None:
+            return jsonify({
+                'success': False,
+                'error': f'Promotion {promotion_id} not found'
+            }), 404
+        db.session.delete(promotion)
+        db.session.commit()
+        return jsonify({
+            'success': True,
+            'message': f'Promotion {promotion_id} deleted successfully'
+        })
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Error deleting promotion %s: %s", promotion_id, e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
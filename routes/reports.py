@@ -1,13 +1,26 @@
-from flask import Blueprint, render_template, jsonify, request
+from flask import Blueprint, render_template, jsonify, request, current_app
 from app import db
-from models import Product, Transaction, TransactionItem
+from models import ForecastRun, Product, ProductForecast, ProductVelocity, Store
+import json
 import logging
-from sqlalchemy import func
+from sqlalchemy import func, select
 from datetime import datetime, timedelta
+from routing import use_replica
+from archive import payment_totals, product_sales
+from replenishment import decayed_rate, lead_time, velocity_tau
+from stores import fan_out, requested_store_id
 
 # Create a blueprint for reports
 reports_bp = Blueprint('reports', __name__, url_prefix='/reports')
 
+logger = logging.getLogger(__name__)
+
+# Largest ?limit= for the reorder and forecast reports
+MAX_REPORT_ROWS = 1000
+
+# Reports only read, so they can run on the read replica
+reports_bp.before_request(use_replica)
+
 @reports_bp.route('/')
 def reports_page():
     """Display the reports page"""
@@ -15,7 +28,7 @@ def reports_page():
 
 @reports_bp.route('/sales/summary', methods=['GET'])
 def sales_summary():
-    """API endpoint to get sales summary data"""
+    """API endpoint to get sales summary data, of the request's store when one is given"""
     try:
         # Get filter parameters
         period = request.args.get('period', 'today')
@@ -46,32 +59,18 @@ def sales_summary():
             start = datetime(now.year, now.month, now.day, 0, 0, 0)
             end = datetime(now.year, now.month, now.day, 23, 59, 59)
         
-        # Get sales data
-        sales_data = db.session.query(
-            func.count(Transaction.id).label('total_transactions'),
-            func.sum(Transaction.total_amount).label('total_sales'),
-            func.avg(Transaction.total_amount).label('average_sale')
-        ).filter(
-            Transaction.transaction_date.between(start, end)
-        ).first()
-        
-        # Get payment method breakdown
-        payment_methods = db.session.query(
-            Transaction.payment_method,
-            func.count(Transaction.id).label('count'),
-            func.sum(Transaction.total_amount).label('total')
-        ).filter(
-            Transaction.transaction_date.between(start, end)
-        ).group_by(
-            Transaction.payment_method
-        ).all()
+        # Totals per payment method, including archived days
+        store_id = requested_store_id()
+        payment_methods = payment_totals(start, end, store_id)
+        total_transactions = sum(count for _, count, _ in payment_methods)
+        total_sales = sum(total for _, _, total in payment_methods)
         
         # Format payment methods data
         payment_data = [
             {
                 'method': method, 
                 'count': count, 
-                'total': float(total) if total else 0
+                'total': total
             } 
             for method, count, total in payment_methods
         ]
@@ -84,16 +83,17 @@ def sales_summary():
                     'end': end.isoformat(),
                     'name': period
                 },
+                'store_id': store_id,
                 'sales': {
-                    'total_transactions': sales_data.total_transactions if sales_data.total_transactions else 0,
-                    'total_sales': float(sales_data.total_sales) if sales_data.total_sales else 0,
-                    'average_sale': float(sales_data.average_sale) if sales_data.average_sale else 0
+                    'total_transactions': total_transactions,
+                    'total_sales': total_sales,
+                    'average_sale': total_sales / total_transactions if total_transactions else 0
                 },
                 'payment_methods': payment_data
             }
         })
     except Exception as e:
-        logging.error(f"Error generating sales summary: {str(e)}")
+        logger.error("Error generating sales summary: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -101,7 +101,7 @@ def sales_summary():
 
 @reports_bp.route('/sales/by-category', methods=['GET'])
 def sales_by_category():
-    """API endpoint to get sales data grouped by product category"""
+    """API endpoint to get sales data grouped by product category, of the request's store when one is given"""
     try:
         # Get filter parameters
         period = request.args.get('period', 'today')
@@ -132,17 +132,15 @@ def sales_by_category():
             start = datetime(now.year, now.month, now.day, 0, 0, 0)
             end = datetime(now.year, now.month, now.day, 23, 59, 59)
         
-        # Get sales by category
+        # Get sales by category, including archived days
+        store_id = requested_store_id()
+        sales = product_sales(start, end, store_id)
         sales_by_cat = db.session.query(
             Product.category,
-            func.sum(TransactionItem.total_price).label('total_sales'),
-            func.sum(TransactionItem.quantity).label('quantity_sold')
-        ).join(
-            TransactionItem, TransactionItem.product_id == Product.id
+            func.sum(sales.c.revenue).label('total_sales'),
+            func.sum(sales.c.quantity).label('quantity_sold')
         ).join(
-            Transaction, Transaction.id == TransactionItem.transaction_id
-        ).filter(
-            Transaction.transaction_date.between(start, end)
+            sales, sales.c.product_id == Product.id
         ).group_by(
             Product.category
         ).all()
@@ -165,11 +163,12 @@ def sales_by_category():
                     'end': end.isoformat(),
                     'name': period
                 },
+                'store_id': store_id,
                 'categories': category_data
             }
         })
     except Exception as e:
-        logging.error(f"Error generating sales by category: {str(e)}")
+        logger.error("Error generating sales by category: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -177,7 +176,7 @@ def sales_by_category():
 
 @reports_bp.route('/sales/top-products', methods=['GET'])
 def top_products():
-    """API endpoint to get top selling products"""
+    """API endpoint to get top selling products, of the request's store when one is given"""
     try:
         # Get filter parameters
         period = request.args.get('period', 'today')
@@ -209,22 +208,20 @@ def top_products():
             start = datetime(now.year, now.month, now.day, 0, 0, 0)
             end = datetime(now.year, now.month, now.day, 23, 59, 59)
         
-        # Get top products by quantity sold
+        # Get top products by quantity sold, including archived days
+        store_id = requested_store_id()
+        sales = product_sales(start, end, store_id)
         top_by_quantity = db.session.query(
             Product.id,
             Product.name,
             Product.category,
-            func.sum(TransactionItem.quantity).label('quantity_sold')
+            func.sum(sales.c.quantity).label('quantity_sold')
         ).join(
-            TransactionItem, TransactionItem.product_id == Product.id
-        ).join(
-            Transaction, Transaction.id == TransactionItem.transaction_id
-        ).filter(
-            Transaction.transaction_date.between(start, end)
+            sales, sales.c.product_id == Product.id
         ).group_by(
             Product.id, Product.name, Product.category
         ).order_by(
-            func.sum(TransactionItem.quantity).desc()
+            func.sum(sales.c.quantity).desc()
         ).limit(limit).all()
         
         # Get top products by revenue
@@ -232,17 +229,13 @@ def top_products():
             Product.id,
             Product.name,
             Product.category,
-            func.sum(TransactionItem.total_price).label('total_revenue')
-        ).join(
-            TransactionItem, TransactionItem.product_id == Product.id
+            func.sum(sales.c.revenue).label('total_revenue')
         ).join(
-            Transaction, Transaction.id == TransactionItem.transaction_id
-        ).filter(
-            Transaction.transaction_date.between(start, end)
+            sales, sales.c.product_id == Product.id
         ).group_by(
             Product.id, Product.name, Product.category
         ).order_by(
-            func.sum(TransactionItem.total_price).desc()
+            func.sum(sales.c.revenue).desc()
         ).limit(limit).all()
         
         # Format data
@@ -274,12 +267,95 @@ def top_products():
                     'end': end.isoformat(),
                     'name': period
                 },
+                'store_id': store_id,
                 'top_by_quantity': quantity_data,
                 'top_by_revenue': revenue_data
             }
         })
     except Exception as e:
-        logging.error(f"Error generating top products report: {str(e)}")
+        logger.error("Error generating top products report: %s", e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@reports_bp.route('/sales/stores', methods=['GET'])
+def sales_by_store():
+    """
+    API endpoint to get sales totals of every store and the whole chain; each
+    store's totals are queried concurrently (see stores.fan_out)
+    """
+    try:
+        # Get filter parameters
+        period = request.args.get('period', 'today')
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        
+        # Define date range based on period
+        now = datetime.utcnow()
+        if period == 'today':
+            start = datetime(now.year, now.month, now.day, 0, 0, 0)
+            end = datetime(now.year, now.month, now.day, 23, 59, 59)
+        elif period == 'week':
+            start = now - timedelta(days=7)
+            end = now
+        elif period == 'month':
+            start = datetime(now.year, now.month, 1, 0, 0, 0)
+            end = now
+        elif period == 'custom':
+            try:
+                start = datetime.strptime(start_date, "%Y-%m-%d")
+                end = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1) - timedelta(seconds=1)
+            except (ValueError, TypeError):
+                return jsonify({
+                    'success': False,
+                    'error': 'Invalid date format. Use YYYY-MM-DD.'
+                }), 400
+        else:
+            start = datetime(now.year, now.month, now.day, 0, 0, 0)
+            end = datetime(now.year, now.month, now.day, 23, 59, 59)
+        
+        stores = db.session.execute(select(Store.id, Store.code, Store.name).order_by(Store.id)).all()
+        totals = fan_out(lambda store_id: payment_totals(start, end, store_id), [store.id for store in stores])
+        
+        store_data = []
+        for store_id, code, name in stores:
+            payment_methods = totals[store_id]
+            transactions = sum(count for _, count, _ in payment_methods)
+            sales = sum(total for _, _, total in payment_methods)
+            store_data.append({
+                'store_id': store_id,
+                'code': code,
+                'name': name,
+                'total_transactions': transactions,
+                'total_sales': sales,
+                'average_sale': sales / transactions if transactions else 0,
+                'payment_methods': [
+                    {'method': method, 'count': count, 'total': total}
+                    for method, count, total in payment_methods
+                ]
+            })
+        total_transactions = sum(store['total_transactions'] for store in store_data)
+        total_sales = sum(store['total_sales'] for store in store_data)
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'period': {
+                    'start': start.isoformat(),
+                    'end': end.isoformat(),
+                    'name': period
+                },
+                'sales': {
+                    'total_transactions': total_transactions,
+                    'total_sales': total_sales,
+                    'average_sale': total_sales / total_transactions if total_transactions else 0
+                },
+                'stores': store_data
+            }
+        })
+    except Exception as e:
+        logger.error("Error generating sales by store: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -333,7 +409,128 @@ def inventory_status():
             }
         })
     except Exception as e:
-        logging.error(f"Error generating inventory status report: {str(e)}")
+        logger.error("Error generating inventory status report: %s", e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@reports_bp.route('/inventory/reorder', methods=['GET'])
+def reorder_report():
+    """
+    API endpoint to get products at or below their reorder point, fewest
+    days of cover first; reads the plans kept by replenishment.py
+    """
+    try:
+        limit = min(max(request.args.get('limit', 100, type=int), 1), MAX_REPORT_ROWS)
+        config = current_app.config
+        tau = velocity_tau(config)
+        
+        flagged = ProductVelocity.needs_reorder.is_(True)
+        total = db.session.execute(select(func.count()).where(flagged)).scalar()
+        rows = db.session.execute(
+            select(
+                ProductVelocity.product_id, Product.name, Product.barcode, Product.category,
+                Product.stock_quantity, Product.lead_time_days, ProductVelocity.units_per_day,
+                ProductVelocity.last_sale_at, ProductVelocity.days_of_cover,
+                ProductVelocity.reorder_point, ProductVelocity.reorder_quantity, ProductVelocity.updated_at
+            )
+            .join(Product, Product.id == ProductVelocity.product_id)
+            .where(flagged)
+            .order_by(ProductVelocity.days_of_cover, ProductVelocity.product_id)
+            .limit(limit)
+        )
+        
+        products = [{
+            'product_id': row.product_id,
+            'name': row.name,
+            'barcode': row.barcode,
+            'category': row.category,
+            'stock_quantity': row.stock_quantity,
+            'units_per_day': round(decayed_rate(row.units_per_day, row.last_sale_at, row.updated_at, tau), 3),
+            'days_of_cover': round(row.days_of_cover, 1),
+            'lead_time_days': lead_time(row.lead_time_days, config),
+            'reorder_point': row.reorder_point,
+            'reorder_quantity': row.reorder_quantity,
+            'planned_at': row.updated_at.isoformat()
+        } for row in rows]
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'total': total,
+                'products': products,
+                'settings': {
+                    'velocity_half_life_days': config['VELOCITY_HALF_LIFE_DAYS'],
+                    'default_lead_time_days': config['REORDER_LEAD_TIME_DAYS'],
+                    'safety_days': config['REORDER_SAFETY_DAYS'],
+                    'cycle_days': config['REORDER_CYCLE_DAYS']
+                }
+            }
+        })
+    except Exception as e:
+        logger.error("Error generating reorder report: %s", e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@reports_bp.route('/forecast', methods=['GET'])
+def demand_forecast():
+    """
+    API endpoint to get the latest demand forecast: one product with
+    ?product_id=, otherwise the products with the highest forecast demand
+    """
+    try:
+        limit = min(max(request.args.get('limit', 100, type=int), 1), MAX_REPORT_ROWS)
+        product_id = request.args.get('product_id', type=int)
+        
+        run = db.session.execute(select(ForecastRun).order_by(ForecastRun.id.desc()).limit(1)).scalar()
+        if run is None:
+            return jsonify({
+                'success': False,
+                'error': 'No forecast yet; run flask forecast-demand'
+            }), 404
+        
+        query = (
+            select(ProductForecast, Product.name, Product.category)
+            .outerjoin(Product, Product.id == ProductForecast.product_id)
+            .where(ProductForecast.run_id == run.id)
+        )
+        if product_id is not None:
+            query = query.where(ProductForecast.product_id == product_id)
+        else:
+            query = query.order_by(ProductForecast.total_units.desc()).limit(limit)
+        
+        days = [(run.first_day + timedelta(days=offset)).isoformat() for offset in range(run.horizon_days)]
+        forecasts = [{
+            'product_id': forecast.product_id,
+            'name': name,
+            'category': category,
+            'total_units': forecast.total_units,
+            'daily': [{'date': day, 'units': units}
+                      for day, units in zip(days, json.loads(forecast.daily_units))],
+            'mean_absolute_error': forecast.mean_absolute_error
+        } for forecast, name, category in db.session.execute(query)]
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'run': {
+                    'id': run.id,
+                    'created_at': run.created_at.isoformat(),
+                    'history_start': run.history_start.isoformat(),
+                    'history_days': run.history_days,
+                    'first_day': run.first_day.isoformat(),
+                    'horizon_days': run.horizon_days,
+                    'products': run.products,
+                    'mean_absolute_error': run.mean_absolute_error
+                },
+                'forecasts': forecasts
+            }
+        })
+    except Exception as e:
+        logger.error("Error fetching demand forecast: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
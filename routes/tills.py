@@ -0,0 +1,250 @@
+from flask import Blueprint, jsonify, request
+from app import db
+from models import TillSession, ZReport
+from datetime import datetime, timedelta
+import logging
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from profiler import query_budget
+from routing import replica_reads
+from stores import current_store_id, requested_store_id
+from tills import close_session
+
+# Create a blueprint for till sessions and Z-reports
+tills_bp = Blueprint('tills', __name__, url_prefix='/tills')
+
+logger = logging.getLogger(__name__)
+
+def _amount(data, field):
+    """Optional non-negative amount from a request body; raises ValueError"""
+    value = data.get(field)
+    if value is None or value == '':
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{field} must be a number')
+    if value < 0:
+        raise ValueError(f'{field} cannot be negative')
+    return value
+
+@tills_bp.route('/sessions', methods=['POST'])
+def open_till_session():
+    """API endpoint to open a till session (start a cashier's shift) at the request's store"""
+    try:
+        data = request.json or {}
+        till = str(data.get('till') or '').strip()
+        cashier_name = str(data.get('cashier_name') or '').strip()
+        if not till or not cashier_name:
+            return jsonify({
+                'success': False,
+                'error': 'till and cashier_name are required'
+            }), 400
+        try:
+            opening_float = _amount(data, 'opening_float') or 0
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+
+        store_id = current_store_id()
+        session = TillSession(store_id=store_id, till=till[:50], cashier_name=cashier_name[:100],
+                              opening_float=opening_float, status='open', opened_at=datetime.utcnow())
+        db.session.add(session)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # The partial unique index allows one open session per till
+            db.session.rollback()
+            return jsonify({
+                'success': False,
+                'error': f'Till {till} already has an open session; close it first'
+            }), 409
+        return jsonify({
+            'success': True,
+            'session': session.to_dict()
+        }), 201
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Error opening till session: %s", e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@tills_bp.route('/sessions', methods=['GET'])
+@query_budget(2)
+def get_till_sessions():
+    """API endpoint to list till sessions with their running totals; ?status=open for open ones"""
+    try:
+        query = (
+            select(TillSession).options(selectinload(TillSession.totals))
+            .order_by(TillSession.opened_at.desc(), TillSession.id.desc())
+            .limit(min(request.args.get('limit', 100, type=int), 1000))
+        )
+        store_id = requested_store_id()
+        if store_id is not None:
+            query = query.where(TillSession.store_id == store_id)
+        status = request.args.get('status')
+        if status:
+            query = query.where(TillSession.status == status)
+        sessions = db.session.scalars(query).all()
+        return jsonify({
+            'success': True,
+            'sessions': [session.to_dict() for session in sessions]
+        })
+    except Exception as e:
+        logger.error("Error fetching till sessions: %s", e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@tills_bp.route('/sessions/<int:till_session_id>', methods=['GET'])
+@query_budget(2)
+def get_till_session(till_session_id):
+    """API endpoint for a till session's running totals (an X-report while it is open)"""
+    try:
+        session = db.session.scalars(
+            select(TillSession).options(selectinload(TillSession.totals)).where(TillSession.id == till_session_id)
+        ).first()
+        if session is None:
+            return jsonify({
+                'success': False,
+                'error': f'Till session {till_session_id} not found'
+            }), 404
+        return jsonify({
+            'success': True,
+            'session': session.to_dict()
+        })
+    except Exception as e:
+        logger.error("Error fetching till session %s: %s", till_session_id, e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@tills_bp.route('/sessions/<int:till_session_id>/close', methods=['POST'])
+@query_budget(4)
+def close_till_session(till_session_id):
+    """API endpoint to close a till session and take its Z-report"""
+    try:
+        # Counting the drawer is optional, so the body may be empty
+        data = request.get_json(silent=True) or {}
+        try:
+            counted_cash = _amount(data, 'counted_cash')
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+
+        report = close_session(till_session_id, counted_cash)
+        if report is None:
+            db.session.rollback()
+            if db.session.get(TillSession, till_session_id) is None:
+                return jsonify({
+                    'success': False,
+                    'error': f'Till session {till_session_id} not found'
+                }), 404
+            return jsonify({
+                'success': False,
+                'error': f'Till session {till_session_id} is already closed'
+            }), 409
+        db.session.commit()
+        return jsonify({
+            'success': True,
+            'z_report': report.to_dict()
+        }), 201
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Error closing till session %s: %s", till_session_id, e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@tills_bp.route('/z-reports', methods=['GET'])
+@query_budget(1)
+@replica_reads
+def get_z_reports():
+    """
+    API endpoint to list Z-reports closed on a day (?date=YYYY-MM-DD, default
+    today) or between ?start_date= and ?end_date=, of the request's store
+    when one is given, with their combined totals
+    """
+    try:
+        try:
+            if request.args.get('start_date') or request.args.get('end_date'):
+                start = datetime.strptime(request.args['start_date'], "%Y-%m-%d")
+                end = datetime.strptime(request.args['end_date'], "%Y-%m-%d") + timedelta(days=1)
+            else:
+                start = (datetime.strptime(request.args['date'], "%Y-%m-%d") if request.args.get('date')
+                         else datetime.combine(datetime.utcnow().date(), datetime.min.time()))
+                end = start + timedelta(days=1)
+        except (KeyError, ValueError):
+            return jsonify({
+                'success': False,
+                'error': 'Invalid date format. Use YYYY-MM-DD.'
+            }), 400
+
+        query = (
+            select(ZReport)
+            .where(ZReport.closed_at >= start, ZReport.closed_at < end)
+            .order_by(ZReport.closed_at, ZReport.id)
+        )
+        store_id = requested_store_id()
+        if store_id is not None:
+            query = query.where(ZReport.store_id == store_id)
+        reports = [report.to_dict() for report in db.session.scalars(query)]
+
+        # Combined from the snapshots; the sales behind them are never read
+        methods = {}
+        for report in reports:
+            for method in report['payment_methods']:
+                combined = methods.setdefault(method['method'], {'method': method['method'], 'count': 0, 'total': 0})
+                combined['count'] += method['count']
+                combined['total'] = round(combined['total'] + method['total'], 2)
+        return jsonify({
+            'success': True,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'store_id': store_id,
+            'z_reports': reports,
+            'totals': {
+                'transaction_count': sum(report['transaction_count'] for report in reports),
+                'total_amount': round(sum(report['total_amount'] for report in reports), 2),
+                'payment_methods': sorted(methods.values(), key=lambda method: method['method'])
+            }
+        })
+    except Exception as e:
+        logger.error("Error fetching Z-reports: %s", e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@tills_bp.route('/z-reports/<int:report_id>', methods=['GET'])
+@query_budget(1)
+@replica_reads
+def get_z_report(report_id):
+    """API endpoint to get one Z-report"""
+    try:
+        report = db.session.get(ZReport, report_id)
+        if report is None:
+            return jsonify({
+                'success': False,
+                'error': f'Z-report {report_id} not found'
+            }), 404
+        return jsonify({
+            'success': True,
+            'z_report': report.to_dict()
+        })
+    except Exception as e:
+        logger.error("Error fetching Z-report %s: %s", report_id, e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
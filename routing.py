@@ -0,0 +1,110 @@
+"""
+Read/write session routing
+
+Views marked as read-only (whole blueprints via ``use_replica`` or single
+views via ``replica_reads``) run their queries on the ``replica`` bind when
+one is configured; everything else, and any flush or DML statement, goes to
+the primary. With READ_YOUR_WRITES_SECONDS set, a client that has just
+committed a write keeps reading from the primary for that many seconds so it
+never sees replica lag on its own changes.
+"""
+import time
+from functools import wraps
+
+import sqlalchemy as sa
+from flask import current_app, g, has_request_context, session
+from flask_sqlalchemy.session import Session
+
+REPLICA_BIND = 'replica'
+
+# Flask session key holding the time of the client's last committed write
+LAST_WRITE_KEY = '_db_last_write'
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends read-only requests to the replica bind"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and _replica_requested(clause):
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _replica_requested(clause):
+    if not has_request_context() or not g.get('db_use_replica'):
+        return False
+    if isinstance(clause, sa.UpdateBase):
+        return False
+    window = current_app.config.get('READ_YOUR_WRITES_SECONDS', 0)
+    if window:
+        last_write = session.get(LAST_WRITE_KEY)
+        if last_write is not None and time.time() - last_write < window:
+            return False
+    return True
+
+
+def use_replica():
+    """before_request hook routing a whole blueprint's reads to the replica"""
+    g.db_use_replica = True
+
+
+def replica_reads(view):
+    """Route the reads of a single view to the replica"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_use_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def replica_binds(config, primary_options):
+    """
+    SQLALCHEMY_BINDS entries for the configured replica
+
+    Uses SQLALCHEMY_REPLICA_URI when set, otherwise a read-only connection to
+    the primary SQLite file when SQLITE_READONLY_REPLICA is enabled.
+    """
+    url = config.get('SQLALCHEMY_REPLICA_URI')
+    if not url and config.get('SQLITE_READONLY_REPLICA'):
+        primary = sa.engine.make_url(config['SQLALCHEMY_DATABASE_URI'])
+        if primary.get_backend_name() == 'sqlite' and primary.database not in (None, '', ':memory:'):
+            url = f'sqlite:///file:{primary.database}?mode=ro&uri=true'
+    if not url:
+        return {}
+    return {REPLICA_BIND: dict(primary_options, url=url)}
+
+
+@sa.event.listens_for(RoutingSession, 'after_flush')
+def _mark_flush(db_session, flush_context):
+    db_session.info['db_wrote'] = True
+
+
+@sa.event.listens_for(RoutingSession, 'do_orm_execute')
+def _mark_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['db_wrote'] = True
+
+
+@sa.event.listens_for(RoutingSession, 'after_commit')
+def _remember_write(db_session):
+    if db_session.info.pop('db_wrote', False) and has_request_context():
+        g.db_committed_write = True
+
+
+@sa.event.listens_for(RoutingSession, 'after_soft_rollback')
+def _forget_write(db_session, previous_transaction):
+    db_session.info.pop('db_wrote', None)
+
+
+def init_routing(app):
+    """Stamp the client's session after a committed write when READ_YOUR_WRITES_SECONDS is set"""
+    if not app.config.get('READ_YOUR_WRITES_SECONDS'):
+        return
+
+    @app.after_request
+    def stamp_last_write(response):
+        if g.pop('db_committed_write', False):
+            session[LAST_WRITE_KEY] = time.time()
+        return response
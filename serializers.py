@@ -0,0 +1,131 @@
+"""
+JSON encoding and column-tuple serializers for the API
+
+OrjsonProvider replaces Flask's stdlib JSON provider when orjson is
+installed (JSON_PROVIDER=orjson, the default); dates, Decimals and other
+types orjson does not handle natively still go through Flask's default
+conversions, so the output is the same apart from whitespace and key order.
+
+RowSerializer builds list responses straight from selected columns instead
+of loading ORM instances and calling to_dict(), and lets clients ask for a
+subset of fields with ?fields=id,name,price.
+"""
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib provider is used instead
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson"""
+
+    sort_keys = False
+
+    def _options(self, indent=None):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return option
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self._options(kwargs.get('indent'))).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=self.default, option=self._options(indent) | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+JSON_PROVIDERS = {
+    'default': DefaultJSONProvider,
+    'orjson': OrjsonProvider,
+}
+
+
+def init_json(app):
+    """Install the JSON provider named by JSON_PROVIDER, if it is available"""
+    name = app.config.get('JSON_PROVIDER', 'orjson')
+    if name == 'orjson' and orjson is None:
+        name = 'default'
+    provider = JSON_PROVIDERS[name]
+    if type(app.json) is not provider:
+        app.json = provider(app)
+
+
+class InvalidFields(ValueError):
+    """Raised when ?fields= names a field the serializer does not offer"""
+    pass
+
+
+class RowSerializer:
+    """
+    Serialize result rows from a fixed set of named columns
+
+    Args:
+        fields: Mapping of output key to a column expression, or to a
+            (column, converter) pair when the value needs converting (e.g.
+            datetimes to ISO strings)
+    """
+
+    def __init__(self, fields):
+        self.fields = {
+            name: spec if isinstance(spec, tuple) else (spec, None)
+            for name, spec in fields.items()
+        }
+        self._compiled = {}
+
+    def parse_fields(self, value):
+        """
+        Turn a comma-separated ?fields= value into a tuple of field names
+
+        Returns:
+            All fields when value is empty
+
+        Raises:
+            InvalidFields: If a name is not one of the serializer's fields
+        """
+        if not value:
+            return tuple(self.fields)
+        names = tuple(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+        unknown = [name for name in names if name not in self.fields]
+        if unknown or not names:
+            raise InvalidFields(
+                f"Unknown field(s): {', '.join(unknown) or value}. Available: {', '.join(self.fields)}"
+            )
+        return names
+
+    def columns(self, names):
+        """Column expressions to select for the given field names"""
+        return [self.fields[name][0] for name in names]
+
+    def serialize(self, names, rows):
+        """Turn rows selected with columns(names) into a list of dicts"""
+        return self._compile(names)(rows)
+
+    def _compile(self, names):
+        serialize = self._compiled.get(names)
+        if serialize is None:
+            converters = [(index, self.fields[name][1]) for index, name in enumerate(names)
+                          if self.fields[name][1] is not None]
+            if converters:
+                def serialize(rows):
+                    result = []
+                    for row in rows:
+                        values = list(row)
+                        for index, convert in converters:
+                            values[index] = convert(values[index])
+                        result.append(dict(zip(names, values)))
+                    return result
+            else:
+                def serialize(rows):
+                    return [dict(zip(names, row)) for row in rows]
+            self._compiled[names] = serialize
+        return serialize
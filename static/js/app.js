@@ -6,6 +6,8 @@
 // Global application state
 const AppState = {
     cashierName: 'Demo Cashier',
+    // Till session sales are rung up in, set and cleared by the checkout page's shift controls
+    tillSessionId: localStorage.getItem('tillSessionId'),
     isLoading: false,
     toastQueue: [],
     processingToast: false
@@ -210,149 +212,15 @@ function updateLoadingState() {
 }
 
 /**
- * Generate a printable receipt
+ * Print a transaction's receipt, rendered by the server
  * @param {object} transaction - Transaction data
  */
 function printReceipt(transaction) {
-    const receiptWindow = window.open('', '_blank', 'width=400,height=600');
+    const receiptWindow = window.open(`/receipt/${transaction.id}?print=1`, '_blank', 'width=400,height=600');
     
     if (!receiptWindow) {
         showToast('Error', 'Please allow pop-ups to print receipts', 'error');
-        return;
     }
-    
-    // Build receipt HTML
-    let receiptHtml = `
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Receipt #${transaction.reference_number}</title>
-        <style>
-            body {
-                font-family: 'Courier New', monospace;
-                font-size: 12px;
-                margin: 0;
-                padding: 10px;
-                width: 300px;
-            }
-            .receipt-header {
-                text-align: center;
-                margin-bottom: 10px;
-            }
-            .receipt-title {
-                font-size: 16px;
-                font-weight: bold;
-            }
-            .receipt-info {
-                margin-bottom: 10px;
-            }
-            .receipt-table {
-                width: 100%;
-                border-collapse: collapse;
-            }
-            .receipt-table th {
-                text-align: left;
-                border-bottom: 1px solid #000;
-                padding: 5px 0;
-            }
-            .receipt-table td {
-                padding: 5px 0;
-            }
-            .receipt-total {
-                margin-top: 10px;
-                text-align: right;
-                font-weight: bold;
-            }
-            .receipt-footer {
-                margin-top: 20px;
-                text-align: center;
-                font-size: 10px;
-            }
-            .text-right {
-                text-align: right;
-            }
-            .text-center {
-                text-align: center;
-            }
-            @media print {
-                body {
-                    width: 100%;
-                }
-                .no-print {
-                    display: none;
-                }
-            }
-        </style>
-    </head>
-    <body>
-        <div class="receipt-header">
-            <div class="receipt-title">Super POS System</div>
-            <div>123 Main Street</div>
-            <div>Anytown, ST 12345</div>
-            <div>Tel: (123) 456-7890</div>
-        </div>
-        
-        <div class="receipt-info">
-            <div>Receipt #: ${transaction.reference_number}</div>
-            <div>Date: ${formatDate(transaction.transaction_date)}</div>
-            <div>Cashier: ${transaction.cashier_name}</div>
-        </div>
-        
-        <table class="receipt-table">
-            <thead>
-                <tr>
-                    <th>Item</th>
-                    <th class="text-right">Qty</th>
-                    <th class="text-right">Price</th>
-                    <th class="text-right">Total</th>
-                </tr>
-            </thead>
-            <tbody>
-    `;
-    
-    // Add items to receipt
-    transaction.items.forEach(item => {
-        receiptHtml += `
-            <tr>
-                <td>${item.product_name}</td>
-                <td class="text-right">${item.quantity}</td>
-                <td class="text-right">${formatCurrency(item.unit_price)}</td>
-                <td class="text-right">${formatCurrency(item.total_price)}</td>
-            </tr>
-        `;
-    });
-    
-    // Add totals and footer
-    receiptHtml += `
-            </tbody>
-        </table>
-        
-        <div class="receipt-total">
-            <div>Total: ${formatCurrency(transaction.total_amount)}</div>
-        </div>
-        
-        <div class="receipt-info">
-            <div>Payment Method: ${transaction.payment_method.toUpperCase()}</div>
-            ${transaction.payment_reference ? `<div>Payment Reference: ${transaction.payment_reference}</div>` : ''}
-        </div>
-        
-        <div class="receipt-footer">
-            <div>Thank you for shopping with us!</div>
-            <div>Please come again.</div>
-        </div>
-        
-        <div class="no-print" style="margin-top: 20px; text-align: center;">
-            <button onclick="window.print()">Print Receipt</button>
-        </div>
-    </body>
-    </html>
-    `;
-    
-    // Write to the new window
-    receiptWindow.document.write(receiptHtml);
-    receiptWindow.document.close();
 }
 
 /**
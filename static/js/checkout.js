@@ -10,11 +10,16 @@ const CheckoutState = {
     searchResults: [],
     categories: [],
     currentTransaction: null,
+    // Server prices for the cart, with the cart contents they were quoted for
+    quote: null,
     paymentMethod: 'cash',
     paymentReference: '',
     selectedCategory: 'all'
 };
 
+// Only the product fields the grid and cart use
+const GRID_FIELDS = 'id,name,price,category,stock_quantity';
+
 // DOM Elements
 document.addEventListener('DOMContentLoaded', function() {
     if (document.getElementById('checkoutPage')) {
@@ -30,7 +35,8 @@ async function initializeCheckout() {
         // Load products and categories
         await Promise.all([
             loadCheckoutProducts(),
-            loadCheckoutCategories()
+            loadCheckoutCategories(),
+            refreshTillSession()
         ]);
         
         // Set up event listeners
@@ -88,6 +94,37 @@ function setupCheckoutEventListeners() {
         paymentForm.addEventListener('submit', handlePaymentSubmit);
     }
     
+    // A payment abandoned by closing the modal gives its held stock back
+    const paymentModalElem = document.getElementById('paymentModal');
+    if (paymentModalElem) {
+        paymentModalElem.addEventListener('hidden.bs.modal', releaseReservation);
+    }
+    
+    // Shift open/close
+    const shiftBtn = document.getElementById('shiftBtn');
+    if (shiftBtn) {
+        shiftBtn.addEventListener('click', function() {
+            if (AppState.tillSessionId) {
+                new bootstrap.Modal(document.getElementById('closeShiftModal')).show();
+                return;
+            }
+            // The till this browser opened its last shift on
+            const tillInput = document.getElementById('shiftTill');
+            if (tillInput && !tillInput.value) {
+                tillInput.value = localStorage.getItem('tillName') || '';
+            }
+            new bootstrap.Modal(document.getElementById('openShiftModal')).show();
+        });
+    }
+    const openShiftForm = document.getElementById('openShiftForm');
+    if (openShiftForm) {
+        openShiftForm.addEventListener('submit', handleOpenShift);
+    }
+    const closeShiftForm = document.getElementById('closeShiftForm');
+    if (closeShiftForm) {
+        closeShiftForm.addEventListener('submit', handleCloseShift);
+    }
+    
     // Payment method selection
     const paymentMethodBtns = document.querySelectorAll('input[name="paymentMethod"]');
     paymentMethodBtns.forEach(btn => {
@@ -100,7 +137,7 @@ function setupCheckoutEventListeners() {
  */
 async function loadCheckoutProducts() {
     try {
-        const response = await apiCall('/checkout/search');
+        const response = await apiCall(`/checkout/search?fields=${GRID_FIELDS}`);
         CheckoutState.products = response.products || [];
         renderProductGrid(CheckoutState.products);
     } catch (error) {
@@ -237,9 +274,10 @@ function addToCart(product, quantity = 1) {
             return;
         }
         
-        // Update quantity
+        // Update quantity; the discount is unknown until the next quote
         existingItem.quantity += quantity;
         existingItem.total = existingItem.quantity * existingItem.price;
+        existingItem.discount = 0;
     } else {
         // Check if we have enough stock
         if (product.stock_quantity < quantity) {
@@ -254,6 +292,7 @@ function addToCart(product, quantity = 1) {
             price: product.price,
             quantity: quantity,
             total: product.price * quantity,
+            discount: 0,
             stock_available: product.stock_quantity
         });
     }
@@ -266,9 +305,90 @@ function addToCart(product, quantity = 1) {
 }
 
 /**
- * Update the cart display
+ * Update the cart display and ask the server to price the new cart
  */
 function updateCart() {
+    renderCart();
+    scheduleQuote();
+}
+
+/**
+ * Product ids and quantities of the cart, as the quote and sale endpoints take them
+ * @returns {Array} Basket items
+ */
+function basketItems() {
+    return CheckoutState.cart.map(item => ({
+        product_id: item.product_id,
+        quantity: item.quantity
+    }));
+}
+
+/**
+ * Get the cart total: the server's quote when it matches the cart, otherwise list prices
+ * @returns {number} Cart total
+ */
+function cartTotal() {
+    const quote = CheckoutState.quote;
+    if (quote && quote.key === JSON.stringify(basketItems())) {
+        return quote.total;
+    }
+    return CheckoutState.cart.reduce((sum, item) => sum + item.total, 0);
+}
+
+/**
+ * Price the cart on the server: promotions, totals and stock at this store
+ * @returns {Promise<boolean>} Whether the quote now matches the cart
+ */
+async function refreshQuote() {
+    const items = basketItems();
+    const key = JSON.stringify(items);
+    if (items.length === 0) {
+        CheckoutState.quote = null;
+        return true;
+    }
+    
+    try {
+        const response = await apiCall('/checkout/quote', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ items: items })
+        });
+        
+        // The cart changed while this quote was on its way; a newer one follows
+        if (key !== JSON.stringify(basketItems())) return false;
+        
+        const quote = response.quote;
+        quote.lines.forEach((line, index) => {
+            const item = CheckoutState.cart[index];
+            item.price = line.unit_price;
+            item.discount = line.discount;
+            item.total = line.total_price;
+            item.stock_available = line.available;
+            item.in_stock = line.in_stock;
+        });
+        CheckoutState.quote = {
+            key: key,
+            total: quote.total,
+            discount: quote.discount,
+            inStock: quote.in_stock
+        };
+        renderCart();
+        return true;
+    } catch (error) {
+        console.error('Error quoting cart:', error);
+        return false;
+    }
+}
+
+// Quote once scanning pauses rather than on every keypress
+const scheduleQuote = debounce(refreshQuote, 200);
+
+/**
+ * Render the cart from its current contents
+ */
+function renderCart() {
     const cartItemsElem = document.getElementById('cartItems');
     const cartTotalElem = document.getElementById('cartTotal');
     const cartEmptyElem = document.getElementById('cartEmpty');
@@ -293,16 +413,18 @@ function updateCart() {
     if (cartEmptyElem) cartEmptyElem.style.display = 'none';
     if (cartActionsElem) cartActionsElem.style.display = 'block';
     
-    // Calculate total
-    let total = 0;
+    // Count items
     let itemCount = 0;
     
     // Add items to cart
     CheckoutState.cart.forEach((item, index) => {
-        total += item.total;
         itemCount += item.quantity;
         
         const itemRow = document.createElement('tr');
+        if (item.in_stock === false) {
+            itemRow.classList.add('table-warning');
+            itemRow.title = `Only ${item.stock_available} units available`;
+        }
         itemRow.innerHTML = `
             <td class="text-truncate" style="max-width: 150px;" title="${item.name}">${item.name}</td>
             <td>
@@ -313,7 +435,10 @@ function updateCart() {
                 </div>
             </td>
             <td class="text-end">${formatCurrency(item.price)}</td>
-            <td class="text-end">${formatCurrency(item.total)}</td>
+            <td class="text-end">
+                ${formatCurrency(item.total)}
+                ${item.discount > 0 ? `<br><small class="text-success">-${formatCurrency(item.discount)}</small>` : ''}
+            </td>
             <td class="text-center">
                 <button class="btn btn-sm btn-outline-danger remove-item" data-index="${index}">
                     <i class="bi bi-trash"></i>
@@ -355,7 +480,7 @@ function updateCart() {
     });
     
     // Update total and item count
-    cartTotalElem.textContent = formatCurrency(total);
+    cartTotalElem.textContent = formatCurrency(cartTotal());
     if (itemCountElem) itemCountElem.textContent = itemCount.toString();
 }
 
@@ -379,9 +504,10 @@ function updateCartItemQuantity(index, quantity) {
         return;
     }
     
-    // Update quantity and total
+    // Update quantity and total; the discount is unknown until the next quote
     item.quantity = quantity;
     item.total = item.price * quantity;
+    item.discount = 0;
     
     // Update cart UI
     updateCart();
@@ -423,7 +549,7 @@ async function handleProductSearch(event) {
     
     try {
         // Search products
-        const response = await apiCall(`/checkout/search?q=${encodeURIComponent(searchTerm)}`);
+        const response = await apiCall(`/checkout/search?q=${encodeURIComponent(searchTerm)}&fields=${GRID_FIELDS}`);
         CheckoutState.searchResults = response.products || [];
         
         // Apply category filter if active
@@ -462,17 +588,24 @@ function filterProductsByCategory(category) {
 /**
  * Handle complete sale button click
  */
-function handleCompleteSale() {
+async function handleCompleteSale() {
     if (CheckoutState.cart.length === 0) {
         showToast('Error', 'Cannot complete sale with empty cart', 'error');
         return;
     }
     
+    // Charge the server's price, and catch stock shortfalls before taking payment
+    const quoted = await refreshQuote();
+    if (quoted && !CheckoutState.quote.inStock) {
+        showToast('Warning', 'Some items are short of stock; adjust the highlighted lines', 'warning');
+        return;
+    }
+    
     // Show payment modal
     const paymentModal = new bootstrap.Modal(document.getElementById('paymentModal'));
     
     // Calculate total
-    const total = CheckoutState.cart.reduce((sum, item) => sum + item.total, 0);
+    const total = cartTotal();
     document.getElementById('paymentTotal').textContent = formatCurrency(total);
     
     // Reset payment form
@@ -507,7 +640,7 @@ function handlePaymentMethodChange(event) {
     if (method === 'cash') {
         const cashInput = document.getElementById('cashAmount');
         const changeOutput = document.getElementById('changeAmount');
-        const total = CheckoutState.cart.reduce((sum, item) => sum + item.total, 0);
+        const total = cartTotal();
         
         cashInput.addEventListener('input', function() {
             const cashAmount = parseFloat(this.value) || 0;
@@ -527,6 +660,14 @@ async function handlePaymentSubmit(event) {
     const formData = new FormData(event.target);
     const paymentMethod = formData.get('paymentMethod');
     
+    // M-PESA holds the basket's stock, then completes the sale once the customer pays
+    if (paymentMethod === 'mpesa') {
+        PaymentState.amount = cartTotal();
+        PaymentState.items = basketItems();
+        processPayment(payment => completeSale('mpesa', payment.reference, PaymentState.reservationId));
+        return;
+    }
+    
     let paymentReference = '';
     
     // Get payment reference based on method
@@ -534,26 +675,33 @@ async function handlePaymentSubmit(event) {
         const cardType = formData.get('cardType');
         const lastFour = formData.get('cardNumber').slice(-4);
         paymentReference = `${cardType}-${lastFour}`;
-    } else if (paymentMethod === 'mpesa') {
-        paymentReference = formData.get('mpesaReference');
     } else {
         // For cash, use the cash amount
         const cashAmount = formData.get('cashAmount');
         paymentReference = `Cash: ${cashAmount}`;
     }
     
-    // Prepare transaction data
-    const total = CheckoutState.cart.reduce((sum, item) => sum + item.total, 0);
+    await completeSale(paymentMethod, paymentReference, null);
+}
+
+/**
+ * Record the sale once it has been paid for
+ * @param {string} paymentMethod - cash, card or mpesa
+ * @param {string} paymentReference - Reference of the payment
+ * @param {number|null} reservationId - Stock reservation made for the payment, if any
+ */
+async function completeSale(paymentMethod, paymentReference, reservationId) {
+    // The sale takes over the reservation's stock, so closing the modal must not release it
+    PaymentState.reservationId = null;
+    
+    // Prepare transaction data; the server prices the sale itself
     const transactionData = {
-        items: CheckoutState.cart.map(item => ({
-            product_id: item.product_id,
-            quantity: item.quantity,
-            unit_price: item.price,
-            total_price: item.total
-        })),
-        total_amount: total,
+        items: basketItems(),
+        total_amount: cartTotal(),
         payment_method: paymentMethod,
         payment_reference: paymentReference,
+        reservation_id: reservationId,
+        till_session_id: AppState.tillSessionId,
         cashier_name: AppState.cashierName
     };
     
@@ -606,6 +754,121 @@ async function handlePaymentSubmit(event) {
     }
 }
 
+/**
+ * Remember the till session sales are rung up in, or forget it
+ * @param {object|null} session - The open session, or null
+ */
+function setTillSession(session) {
+    AppState.tillSessionId = session ? session.id : null;
+    if (session) {
+        localStorage.setItem('tillSessionId', session.id);
+        localStorage.setItem('tillName', session.till);
+    } else {
+        localStorage.removeItem('tillSessionId');
+    }
+    
+    const status = document.getElementById('shiftStatus');
+    const label = document.getElementById('shiftBtnLabel');
+    if (status) {
+        status.textContent = session ? `${session.till} · ${session.cashier_name}` : 'No shift open';
+    }
+    if (label) {
+        label.textContent = session ? 'Close Shift' : 'Open Shift';
+    }
+}
+
+/**
+ * Check the remembered till session is still open
+ */
+async function refreshTillSession() {
+    if (!AppState.tillSessionId) {
+        setTillSession(null);
+        return;
+    }
+    try {
+        const response = await fetch(`/tills/sessions/${AppState.tillSessionId}`);
+        if (response.status === 404) {
+            setTillSession(null);
+            return;
+        }
+        const data = await response.json();
+        if (data.success) {
+            setTillSession(data.session.status === 'open' ? data.session : null);
+        }
+    } catch (error) {
+        // Keep the session; the server rejects sales on a closed one
+        console.error('Error checking till session:', error);
+    }
+}
+
+/**
+ * Open a till session for the cashier's shift
+ * @param {Event} e - Form submit event
+ */
+async function handleOpenShift(e) {
+    e.preventDefault();
+    const formData = new FormData(e.target);
+    
+    try {
+        const response = await apiCall('/tills/sessions', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                till: formData.get('till'),
+                cashier_name: AppState.cashierName,
+                opening_float: formData.get('opening_float')
+            })
+        });
+        setTillSession(response.session);
+        bootstrap.Modal.getInstance(document.getElementById('openShiftModal')).hide();
+        showToast('Success', `Shift opened on ${response.session.till}`, 'success');
+    } catch (error) {
+        console.error('Error opening shift:', error);
+    }
+}
+
+/**
+ * Close the till session and show its Z-report totals
+ * @param {Event} e - Form submit event
+ */
+async function handleCloseShift(e) {
+    e.preventDefault();
+    const formData = new FormData(e.target);
+    
+    try {
+        const response = await apiCall(`/tills/sessions/${AppState.tillSessionId}/close`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                counted_cash: formData.get('counted_cash')
+            })
+        });
+        setTillSession(null);
+        e.target.reset();
+        bootstrap.Modal.getInstance(document.getElementById('closeShiftModal')).hide();
+        
+        const report = response.z_report;
+        Swal.fire({
+            title: 'Shift Closed',
+            html: `
+                <p>Sales: ${report.transaction_count}</p>
+                <p>Total: ${formatCurrency(report.total_amount)}</p>
+                <p>Expected Cash: ${formatCurrency(report.expected_cash)}</p>
+            `,
+            icon: 'success',
+            confirmButtonText: 'OK'
+        });
+    } catch (error) {
+        // Already closed elsewhere, or gone; stop ringing sales up in it
+        console.error('Error closing shift:', error);
+        await refreshTillSession();
+    }
+}
+
 /**
  * Debounce function for search input
  * @param {Function} func - Function to debounce
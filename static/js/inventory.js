@@ -10,8 +10,17 @@ const InventoryState = {
     stockMovements: [],
     selectedProduct: null,
     currentView: 'products', // 'products' or 'stock'
+    // Server-side product filters, sort and paging
+    productQuery: { q: '', category: 'all', sort: 'name' },
+    nextCursor: null,
+    totalProducts: 0,
+    loadingMore: false,
+    searchTimer: null
 };
 
+// Products fetched per page; more pages load as the list scrolls
+const PRODUCT_PAGE_SIZE = 100;
+
 // DOM Elements
 document.addEventListener('DOMContentLoaded', function() {
     if (document.getElementById('inventoryPage')) {
@@ -60,6 +69,7 @@ function setupInventoryEventListeners() {
     const stockForm = document.getElementById('stockMovementForm');
     if (stockForm) {
         stockForm.addEventListener('submit', handleStockMovementSubmit);
+        document.getElementById('movementType').addEventListener('change', updateMovementQuantityInput);
     }
     
     // New product button
@@ -93,6 +103,21 @@ function setupInventoryEventListeners() {
     if (categoryFilter) {
         categoryFilter.addEventListener('change', handleCategoryFilter);
     }
+    
+    // Sortable product columns
+    document.querySelectorAll('#productsContainer th.sortable').forEach(header => {
+        header.addEventListener('click', () => handleProductSort(header.dataset.sort));
+    });
+    
+    // Load the next page when the end of the product list scrolls into view
+    const listEnd = document.getElementById('productListEnd');
+    if (listEnd && 'IntersectionObserver' in window) {
+        new IntersectionObserver(entries => {
+            if (entries[0].isIntersecting && InventoryState.currentView === 'products') {
+                loadMoreProducts();
+            }
+        }, { rootMargin: '400px' }).observe(listEnd);
+    }
 }
 
 /**
@@ -140,18 +165,57 @@ function showStockView() {
 }
 
 /**
- * Load products from API
+ * Build the product listing URL for the current filters and sort
+ * @param {string|null} cursor - Cursor of the page to fetch, or null for the first page
+ */
+function productListUrl(cursor) {
+    const query = InventoryState.productQuery;
+    const params = new URLSearchParams({ limit: PRODUCT_PAGE_SIZE, sort: query.sort });
+    if (query.q) params.set('q', query.q);
+    if (query.category !== 'all') params.set('category', query.category);
+    if (cursor) params.set('cursor', cursor);
+    return `/inventory/products?${params}`;
+}
+
+/**
+ * Load the first page of products from API
  */
 async function loadProducts() {
     try {
-        const response = await apiCall('/inventory/products');
+        const response = await apiCall(productListUrl(null));
         InventoryState.products = response.products || [];
+        InventoryState.nextCursor = response.next_cursor;
+        InventoryState.totalProducts = response.total || 0;
         renderProductList();
     } catch (error) {
         console.error('Error loading products:', error);
     }
 }
 
+/**
+ * Append the next page of products, if there is one
+ */
+async function loadMoreProducts() {
+    if (!InventoryState.nextCursor || InventoryState.loadingMore) return;
+    
+    InventoryState.loadingMore = true;
+    try {
+        const response = await apiCall(productListUrl(InventoryState.nextCursor));
+        const page = response.products || [];
+        InventoryState.products = InventoryState.products.concat(page);
+        InventoryState.nextCursor = response.next_cursor;
+        InventoryState.totalProducts = response.total || 0;
+        
+        const productListElem = document.getElementById('productList');
+        page.forEach(product => productListElem.appendChild(createProductRow(product)));
+        renderProductCount();
+    } catch (error) {
+        console.error('Error loading more products:', error);
+    } finally {
+        InventoryState.loadingMore = false;
+    }
+}
+
 /**
  * Load categories from API
  */
@@ -267,14 +331,17 @@ function renderProductList() {
     
     // Clear current list
     productListElem.innerHTML = '';
+    renderProductCount();
+    renderSortIndicators();
     
     // Check if there are products
     if (InventoryState.products.length === 0) {
+        const filtered = InventoryState.productQuery.q || InventoryState.productQuery.category !== 'all';
         productListElem.innerHTML = `
             <tr>
                 <td colspan="6" class="text-center py-4">
                     <div class="alert alert-info mb-0">
-                        No products found. Add your first product to get started.
+                        ${filtered ? 'No products match your search.' : 'No products found. Add your first product to get started.'}
                     </div>
                 </td>
             </tr>
@@ -284,77 +351,86 @@ function renderProductList() {
     
     // Add products to list
     InventoryState.products.forEach(product => {
-        // Determine stock status class
-        let stockStatusClass = '';
-        let stockStatusText = '';
-        
-        if (product.stock_quantity <= 0) {
-            stockStatusClass = 'text-danger';
-            stockStatusText = 'Out of Stock';
-        } else if (product.stock_quantity <= 10) {
-            stockStatusClass = 'text-warning';
-            stockStatusText = 'Low Stock';
-        } else {
-            stockStatusClass = 'text-success';
-            stockStatusText = 'In Stock';
-        }
-        
-        const row = document.createElement('tr');
-        row.innerHTML = `
-            <td>${product.barcode}</td>
-            <td>${product.name}</td>
-            <td>${formatCurrency(product.price)}</td>
-            <td>${product.category}</td>
-            <td class="${stockStatusClass}">
-                ${product.stock_quantity} 
-                <small>(${stockStatusText})</small>
-            </td>
-            <td>
-                <div class="btn-group btn-group-sm" role="group">
-                    <button type="button" class="btn btn-outline-primary edit-product" data-id="${product.id}">
-                        <i class="bi bi-pencil"></i>
-                    </button>
-                    <button type="button" class="btn btn-outline-danger delete-product" data-id="${product.id}">
-                        <i class="bi bi-trash"></i>
-                    </button>
-                </div>
-            </td>
-        `;
-        
-        // Add event listeners
-        row.querySelector('.edit-product').addEventListener('click', () => {
-            editProduct(product.id);
-        });
-        
-        row.querySelector('.delete-product').addEventListener('click', () => {
-            deleteProduct(product.id);
-        });
-        
-        productListElem.appendChild(row);
+        productListElem.appendChild(createProductRow(product));
     });
-    
-    // Set up event listeners for buttons
-    setupProductButtonListeners();
 }
 
 /**
- * Setup listeners for product action buttons
+ * Build the table row for a product
+ * @param {Object} product - Product to render
  */
-function setupProductButtonListeners() {
-    // Edit product buttons
-    document.querySelectorAll('.edit-product').forEach(button => {
-        button.addEventListener('click', function() {
-            const productId = this.getAttribute('data-id');
-            editProduct(productId);
-        });
+function createProductRow(product) {
+    // Determine stock status class
+    let stockStatusClass = '';
+    let stockStatusText = '';
+    
+    if (product.stock_quantity <= 0) {
+        stockStatusClass = 'text-danger';
+        stockStatusText = 'Out of Stock';
+    } else if (product.stock_quantity <= 10) {
+        stockStatusClass = 'text-warning';
+        stockStatusText = 'Low Stock';
+    } else {
+        stockStatusClass = 'text-success';
+        stockStatusText = 'In Stock';
+    }
+    
+    const row = document.createElement('tr');
+    row.innerHTML = `
+        <td>${product.barcode}</td>
+        <td>${product.name}</td>
+        <td>${formatCurrency(product.price)}</td>
+        <td>${product.category}</td>
+        <td class="${stockStatusClass}">
+            ${product.stock_quantity} 
+            <small>(${stockStatusText})</small>
+        </td>
+        <td>
+            <div class="btn-group btn-group-sm" role="group">
+                <button type="button" class="btn btn-outline-primary edit-product" data-id="${product.id}">
+                    <i class="bi bi-pencil"></i>
+                </button>
+                <button type="button" class="btn btn-outline-danger delete-product" data-id="${product.id}">
+                    <i class="bi bi-trash"></i>
+                </button>
+            </div>
+        </td>
+    `;
+    
+    // Add event listeners
+    row.querySelector('.edit-product').addEventListener('click', () => {
+        editProduct(product.id);
     });
     
-    // Delete product buttons
-    document.querySelectorAll('.delete-product').forEach(button => {
-        button.addEventListener('click', function() {
-            const productId = this.getAttribute('data-id');
-            deleteProduct(productId);
-        });
+    row.querySelector('.delete-product').addEventListener('click', () => {
+        deleteProduct(product.id);
+    });
+    
+    return row;
+}
+
+/**
+ * Show how many of the matching products are loaded
+ */
+function renderProductCount() {
+    const countElem = document.getElementById('productCount');
+    if (countElem) {
+        countElem.textContent = `Showing ${InventoryState.products.length} of ${InventoryState.totalProducts} products`;
+    }
+}
+
+/**
+ * Mark the sorted column header
+ */
+function renderSortIndicators() {
+    const sort = InventoryState.productQuery.sort;
+    const descending = sort.startsWith('-');
+    document.querySelectorAll('#productsContainer th.sortable').forEach(header => {
+        const icon = header.querySelector('i');
+        if (icon) icon.remove();
+        if (header.dataset.sort === sort.replace(/^-/, '')) {
+            header.insertAdjacentHTML('beforeend', ` <i class="bi ${descending ? 'bi-sort-down' : 'bi-sort-up'}"></i>`);
+        }
     });
 }
 
@@ -593,6 +669,20 @@ function resetProductForm() {
     }
 }
 
+/**
+ * Adjustments take a signed quantity; stock in and out take a positive one
+ */
+function updateMovementQuantityInput() {
+    const isAdjustment = document.getElementById('movementType').value === 'adjustment';
+    const quantityInput = document.getElementById('quantity');
+    if (isAdjustment) {
+        quantityInput.removeAttribute('min');
+    } else {
+        quantityInput.min = 1;
+    }
+    document.getElementById('adjustmentHelp').classList.toggle('d-none', !isAdjustment);
+}
+
 /**
  * Reset the stock movement form
  */
@@ -600,6 +690,7 @@ function resetStockMovementForm() {
     const form = document.getElementById('stockMovementForm');
     if (form) {
         form.reset();
+        updateMovementQuantityInput();
         
         // Populate product dropdown
         const productSelect = document.getElementById('stockProductId');
@@ -621,21 +712,12 @@ function handleInventorySearch(event) {
     const searchTerm = event.target.value.trim().toLowerCase();
     
     if (InventoryState.currentView === 'products') {
-        // Filter products
-        const filteredProducts = InventoryState.products.filter(product => {
-            return (
-                product.name.toLowerCase().includes(searchTerm) ||
-                product.barcode.toLowerCase().includes(searchTerm) ||
-                product.category.toLowerCase().includes(searchTerm) ||
-                (product.description && product.description.toLowerCase().includes(searchTerm))
-            );
-        });
-        
-        // Update view with filtered products
-        const tempProducts = InventoryState.products;
-        InventoryState.products = filteredProducts;
-        renderProductList();
-        InventoryState.products = tempProducts;
+        // Search on the server once typing pauses
+        clearTimeout(InventoryState.searchTimer);
+        InventoryState.searchTimer = setTimeout(() => {
+            InventoryState.productQuery.q = searchTerm;
+            loadProducts();
+        }, 250);
     } else {
         // Filter stock movements
         const filteredMovements = InventoryState.stockMovements.filter(movement => {
@@ -658,19 +740,16 @@ function handleInventorySearch(event) {
  * Handle category filter change
  */
 function handleCategoryFilter(event) {
-    const category = event.target.value;
-    
-    if (category === 'all') {
-        // Show all products
-        renderProductList();
-    } else {
-        // Filter products by category
-        const filteredProducts = InventoryState.products.filter(product => product.category === category);
-        
-        // Update view with filtered products
-        const tempProducts = InventoryState.products;
-        InventoryState.products = filteredProducts;
-        renderProductList();
-        InventoryState.products = tempProducts;
-    }
+    InventoryState.productQuery.category = event.target.value;
+    loadProducts();
+}
+
+/**
+ * Sort products by a column, toggling direction when it is already sorted
+ * @param {string} column - Sort key of the clicked column
+ */
+function handleProductSort(column) {
+    const current = InventoryState.productQuery.sort;
+    InventoryState.productQuery.sort = current === column ? `-${column}` : column;
+    loadProducts();
 }
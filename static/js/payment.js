@@ -10,7 +10,10 @@ const PaymentState = {
     reference: '',
     isProcessing: false,
     mpesaCheckoutRequestId: null,
-    mpesaVerificationTimer: null
+    mpesaVerificationTimer: null,
+    // Basket whose stock is held while an M-PESA payment completes
+    items: [],
+    reservationId: null
 };
 
 /**
@@ -273,7 +276,8 @@ function processMpesaPayment(phoneNumber, reference, onSuccess) {
             phone_number: phoneNumber,
             amount: PaymentState.amount,
             reference: reference,
-            description: 'Payment for goods at SuperPOS'
+            description: 'Payment for goods at SuperPOS',
+            items: PaymentState.items
         })
     })
     .then(response => {
@@ -281,6 +285,7 @@ function processMpesaPayment(phoneNumber, reference, onSuccess) {
             // Show success message
             const checkoutRequestId = response.data.checkout_request_id;
             PaymentState.mpesaCheckoutRequestId = checkoutRequestId;
+            PaymentState.reservationId = response.data.reservation_id;
             
             // Update UI to show payment is in progress
             if (mpesaDetailsContainer) {
@@ -552,6 +557,18 @@ function verifyMpesaPayment(checkoutRequestId, reference, onSuccess, statusDiv)
         });
 }
 
+/**
+ * Give back the stock held for an M-PESA payment that will not complete
+ */
+function releaseReservation() {
+    const reservationId = PaymentState.reservationId;
+    if (!reservationId) return;
+    PaymentState.reservationId = null;
+    
+    apiCall(`/mpesa/reservations/${reservationId}/release`, { method: 'POST' })
+        .catch(error => console.error('Error releasing stock reservation:', error));
+}
+
 /**
  * Reset payment processing state
  * @param {boolean} keepDisabled - Whether to keep the form disabled
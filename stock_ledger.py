@@ -0,0 +1,203 @@
+"""
+Stock ledger, checkpoints and reconciliation
+
+StockMovement (plus stock_movement_archive for closed months) is the stock
+ledger: every write to Product.stock_quantity also records a signed
+movement, so the stock at any moment is the sum of the movements dated up
+to it. Summing a product's whole history gets slower every
+day, so ``flask checkpoint-stock`` (run nightly) stores each product's
+running total at a timestamp as a StockCheckpoint. Stock as of any time is
+then the latest checkpoint at or before it plus the movements in between, a
+scan bounded by the checkpoint interval.
+
+Movements are stamped when they are written, so a checkpoint taken in the
+past is not invalidated by later activity. ``flask reconcile-stock`` compares
+the ledger with the stock_quantity counter for every product in a handful of
+grouped queries and reports (or books) the drift.
+"""
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from sqlalchemy import delete, func, select
+
+from app import db
+from models import DEFAULT_STORE_ID, Product, StockCheckpoint, StockMovement, stock_movement_archive
+from outbox import movement_events, record_events
+
+RECONCILE_REFERENCE = 'Reconciliation'
+
+# Live movements, and those of closed months moved out by archive.py
+LEDGER_TABLES = (StockMovement.__table__, stock_movement_archive)
+
+
+def parse_as_of(value):
+    """
+    Parse an ?as_of= / --as-of value
+
+    Args:
+        value (str): ISO 8601 date or timestamp; a bare date means midnight
+            at the start of that day, and a timestamp with an offset is
+            converted to UTC
+
+    Returns:
+        datetime: Naive UTC timestamp, or None when value is empty
+
+    Raises:
+        ValueError: If value is not an ISO 8601 date or timestamp
+    """
+    if not value:
+        return None
+    try:
+        when = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError('as_of must be an ISO 8601 date or timestamp')
+    if when.tzinfo is not None:
+        when = when.astimezone(timezone.utc).replace(tzinfo=None)
+    return when
+
+
+def stock_as_of(product_id, when=None):
+    """
+    Ledger stock of one product at a point in time
+
+    Args:
+        product_id (int): The product
+        when (datetime): Naive UTC timestamp, or None for the current stock
+
+    Returns:
+        dict: stock_quantity, the checkpoint used (or None) and the number
+        of movements scanned after it
+    """
+    checkpoint = (
+        select(StockCheckpoint.as_of, StockCheckpoint.stock_quantity)
+        .where(StockCheckpoint.product_id == product_id)
+        .order_by(StockCheckpoint.as_of.desc())
+        .limit(1)
+    )
+    if when is not None:
+        checkpoint = checkpoint.where(StockCheckpoint.as_of <= when)
+    checkpoint = db.session.execute(checkpoint).first()
+
+    delta = scanned = 0
+    for movements in LEDGER_TABLES:
+        query = select(func.coalesce(func.sum(movements.c.quantity), 0), func.count()).where(
+            movements.c.product_id == product_id
+        )
+        if when is not None:
+            query = query.where(movements.c.movement_date <= when)
+        if checkpoint is not None:
+            query = query.where(movements.c.movement_date > checkpoint.as_of)
+        table_delta, table_scanned = db.session.execute(query).one()
+        delta, scanned = delta + table_delta, scanned + table_scanned
+
+    base = checkpoint.stock_quantity if checkpoint is not None else 0
+    return {
+        'stock_quantity': base + delta,
+        'checkpoint': None if checkpoint is None else {
+            'as_of': checkpoint.as_of.isoformat(),
+            'stock_quantity': checkpoint.stock_quantity,
+        },
+        'movements_scanned': scanned,
+    }
+
+
+def _ledger_totals(as_of=None):
+    """Ledger stock per product id at as_of (None for now), from the latest checkpoint before it"""
+    latest = select(func.max(StockCheckpoint.as_of))
+    if as_of is not None:
+        latest = latest.where(StockCheckpoint.as_of < as_of)
+    latest = db.session.execute(latest).scalar()
+
+    totals = {}
+    if latest is not None:
+        totals.update(db.session.execute(
+            select(StockCheckpoint.product_id, StockCheckpoint.stock_quantity)
+            .where(StockCheckpoint.as_of == latest)
+        ).all())
+
+    for movements in LEDGER_TABLES:
+        deltas = select(movements.c.product_id, func.sum(movements.c.quantity)).group_by(movements.c.product_id)
+        if latest is not None:
+            deltas = deltas.where(movements.c.movement_date > latest)
+        if as_of is not None:
+            deltas = deltas.where(movements.c.movement_date <= as_of)
+        for product_id, delta in db.session.execute(deltas):
+            totals[product_id] = totals.get(product_id, 0) + delta
+    return totals
+
+
+def create_checkpoint(as_of):
+    """
+    Record every product's ledger stock at as_of
+
+    Builds on the latest earlier checkpoint, so only the movements since it
+    are read. Running it again for the same as_of replaces that checkpoint.
+
+    Args:
+        as_of (datetime): Naive UTC timestamp, not in the future
+
+    Returns:
+        int: Number of checkpoint rows written
+    """
+    if as_of > datetime.utcnow():
+        raise ValueError('Cannot checkpoint stock in the future')
+
+    totals = _ledger_totals(as_of)
+    product_ids = set(db.session.execute(select(Product.id)).scalars())
+    rows = [{'product_id': product_id, 'as_of': as_of, 'stock_quantity': quantity}
+            for product_id, quantity in sorted(totals.items()) if product_id in product_ids]
+
+    db.session.execute(delete(StockCheckpoint).where(StockCheckpoint.as_of == as_of))
+    if rows:
+        db.session.execute(StockCheckpoint.__table__.insert(), rows)
+    db.session.commit()
+    return len(rows)
+
+
+def reconcile(fix=False):
+    """
+    Compare the ledger with Product.stock_quantity for every product
+
+    Args:
+        fix (bool): Book an 'adjustment' movement for each drifted product so
+            the ledger agrees with the counter, which reflects the last
+            physical count and every sale
+
+    Returns:
+        list: One dict per drifted product (product_id, name, stock_quantity,
+        ledger_quantity, drift), largest absolute drift first
+    """
+    totals = _ledger_totals()
+    drifted = []
+    for product_id, name, stock in db.session.execute(select(Product.id, Product.name, Product.stock_quantity)):
+        ledger = totals.get(product_id, 0)
+        if ledger != stock:
+            drifted.append({
+                'product_id': product_id,
+                'name': name,
+                'stock_quantity': stock,
+                'ledger_quantity': ledger,
+                'drift': stock - ledger,
+            })
+    drifted.sort(key=lambda row: (-abs(row['drift']), row['product_id']))
+
+    if fix and drifted:
+        now = datetime.utcnow()
+        movements = [{
+            'product_id': row['product_id'],
+            'movement_date': now,
+            'quantity': row['drift'],
+            'movement_type': 'adjustment',
+            'reference': RECONCILE_REFERENCE,
+            'notes': f"Ledger {row['ledger_quantity']} reconciled to stock {row['stock_quantity']}",
+            'store_id': DEFAULT_STORE_ID,
+        } for row in drifted]
+        table = StockMovement.__table__
+        ids = db.session.execute(
+            table.insert().returning(table.c.id, sort_by_parameter_order=True), movements
+        ).scalars().all()
+        record_events(db.session.connection(), movement_events(
+            SimpleNamespace(**movement, id=movement_id) for movement, movement_id in zip(movements, ids)
+        ))
+        db.session.commit()
+    return drifted
@@ -0,0 +1,245 @@
+"""
+Stores of the chain
+
+Every Transaction and StockMovement records the store (branch) it happened
+at, and StoreStock holds each product's stock per store; Product.stock_quantity
+stays the chain-wide total, so catalog listings and reorder planning are
+unchanged. StoreStock.held_quantity counts the units held for in-flight
+payments, and ``available_levels`` gives what is left to sell.
+
+A request picks its store with the X-Store-Id header (or ?store_id=). Writes
+land in that store, or DEFAULT_STORE_ID when none is given; transaction and
+movement history and the sales reports are filtered to it, and cover the
+whole chain when none is given. The store-leading indexes keep each store's
+rows together, so a store's queries read only its own range however many
+stores share the database.
+
+A before_flush listener stamps new rows with the request's store and applies
+every ORM change to Product.stock_quantity to that store's StoreStock row.
+Bulk writes that bypass the ORM call ``adjust_store_stock``, and sales take
+their units with ``sell`` in reservations.py. A stock count
+sent with a store is that store's level: the product update and the batch
+endpoint diff it against the store's StoreStock row and move the chain total
+by the difference, so the stores always sum to the total.
+
+``fan_out`` runs one query per store concurrently, each in its own app
+context and so on its own session and connection, for reports that break the
+chain down by store.
+"""
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import sqlalchemy as sa
+from flask import current_app, g, has_request_context, jsonify, request
+
+from app import db
+from models import DEFAULT_STORE_ID, Product, StockMovement, Store, StoreStock, Transaction
+from routing import RoutingSession
+
+STORE_HEADER = 'X-Store-Id'
+
+# Products per IN (...) lookup, to stay under database parameter limits
+LOOKUP_CHUNK = 500
+
+# Ids of stores known to exist; stores are never deleted, so this only grows
+_known_stores = set()
+
+
+def requested_store_id():
+    """The store the current request asked for, or None (chain-wide)"""
+    return g.get('store_id') if has_request_context() else None
+
+
+def current_store_id():
+    """The store writes in the current request belong to"""
+    return requested_store_id() or DEFAULT_STORE_ID
+
+
+def init_stores(app):
+    """Resolve each request's store from the X-Store-Id header or ?store_id="""
+
+    @app.before_request
+    def resolve_store():
+        value = request.headers.get(STORE_HEADER) or request.args.get('store_id')
+        if not value:
+            return None
+        try:
+            store_id = int(value)
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'error': 'store_id must be a whole number'
+            }), 400
+        if store_id not in _known_stores:
+            if db.session.get(Store, store_id) is None:
+                return jsonify({
+                    'success': False,
+                    'error': f'Store {store_id} not found'
+                }), 404
+            _known_stores.add(store_id)
+        g.store_id = store_id
+        return None
+
+
+def store_levels(store_id, product_ids, connection=None):
+    """
+    Stock of some products at one store
+
+    Args:
+        store_id (int): The store
+        product_ids: Products to look up
+        connection: Connection to read on; defaults to the session's
+
+    Returns:
+        dict: Stock by product id; products with no row at the store are left out
+    """
+    connection = connection or db.session.connection()
+    table = StoreStock.__table__
+    ids = sorted(set(product_ids))
+    levels = {}
+    for i in range(0, len(ids), LOOKUP_CHUNK):
+        levels.update(connection.execute(
+            sa.select(table.c.product_id, table.c.stock_quantity)
+            .where(table.c.store_id == store_id, table.c.product_id.in_(ids[i:i + LOOKUP_CHUNK]))
+        ).all())
+    return levels
+
+
+def available_levels(store_id, product_ids, connection=None):
+    """
+    Stock of some products at one store that is free to sell: on hand less
+    the units held for in-flight payments (see reservations.py)
+
+    Args:
+        store_id (int): The store
+        product_ids: Products to look up
+        connection: Connection to read on; defaults to the session's
+
+    Returns:
+        dict: Available units by product id, never below 0; products with no
+            row at the store are left out
+    """
+    connection = connection or db.session.connection()
+    table = StoreStock.__table__
+    ids = sorted(set(product_ids))
+    levels = {}
+    for i in range(0, len(ids), LOOKUP_CHUNK):
+        levels.update(connection.execute(
+            sa.select(table.c.product_id, table.c.stock_quantity - table.c.held_quantity)
+            .where(table.c.store_id == store_id, table.c.product_id.in_(ids[i:i + LOOKUP_CHUNK]))
+        ).all())
+    # Stock counted down below what is held leaves nothing, not a debt
+    return {product_id: max(level, 0) for product_id, level in levels.items()}
+
+
+def adjust_store_stock(connection, deltas, store_id):
+    """
+    Add stock changes to a store's StoreStock rows, creating missing rows
+
+    Args:
+        connection: Connection in the writing transaction
+        deltas (dict): Change in stock by product id
+        store_id (int): The store the changes happened at
+    """
+    deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    table = StoreStock.__table__
+    existing = store_levels(store_id, deltas, connection)
+    updates = [{'s': store_id, 'p': product_id, 'd': delta}
+               for product_id, delta in deltas.items() if product_id in existing]
+    inserts = [{'store_id': store_id, 'product_id': product_id, 'stock_quantity': delta}
+               for product_id, delta in deltas.items() if product_id not in existing]
+    if updates:
+        connection.execute(
+            table.update()
+            .where(table.c.store_id == sa.bindparam('s'), table.c.product_id == sa.bindparam('p'))
+            .values(stock_quantity=table.c.stock_quantity + sa.bindparam('d')),
+            updates
+        )
+    if inserts:
+        connection.execute(table.insert(), inserts)
+
+
+def _stock_change(db_session, product):
+    """How much a flush changes a persistent product's stock_quantity"""
+    history = sa.inspect(product).attrs.stock_quantity.history
+    if not history.added:
+        return 0
+    if history.deleted:
+        old = history.deleted[0]
+    else:
+        # Assigned without being loaded first
+        old = db_session.execute(sa.select(Product.stock_quantity).where(Product.id == product.id)).scalar()
+    return (history.added[0] or 0) - (old or 0)
+
+
+@sa.event.listens_for(RoutingSession, 'before_flush')
+def _track_store_writes(db_session, flush_context, instances):
+    store_id = current_store_id()
+    deltas = Counter()
+    with db_session.no_autoflush:
+        for obj in list(db_session.new):
+            if isinstance(obj, (Transaction, StockMovement)) and obj.store_id is None:
+                obj.store_id = store_id
+            elif isinstance(obj, Product) and obj.stock_quantity:
+                # No id yet; the relationship fills it in during the flush
+                db_session.add(StoreStock(product=obj, store_id=store_id, stock_quantity=obj.stock_quantity))
+        for obj in db_session.dirty:
+            if isinstance(obj, Product) and obj.id is not None:
+                deltas[obj.id] += _stock_change(db_session, obj)
+    if any(deltas.values()):
+        adjust_store_stock(db_session.connection(), deltas, store_id)
+
+
+def ensure_stores():
+    """
+    Create the default store if missing, and put the stock of products that
+    have no StoreStock rows yet (from before stores existed, or bulk
+    loaded) in it; commits
+
+    Returns:
+        int: Number of products whose stock was assigned to the default store
+    """
+    if db.session.get(Store, DEFAULT_STORE_ID) is None:
+        db.session.add(Store(id=DEFAULT_STORE_ID, code='MAIN', name='Main store'))
+        db.session.flush()
+    unassigned = (
+        sa.select(sa.literal(DEFAULT_STORE_ID), Product.id, Product.stock_quantity)
+        .where(Product.stock_quantity != 0, ~sa.exists().where(StoreStock.product_id == Product.id))
+    )
+    count = db.session.execute(StoreStock.__table__.insert().from_select(
+        ['store_id', 'product_id', 'stock_quantity'], unassigned
+    )).rowcount
+    db.session.commit()
+    return count
+
+
+def fan_out(query, store_ids, workers=None):
+    """
+    Run query(store_id) for each store concurrently
+
+    Each call runs in its own app context, so it gets its own session and
+    connection (on the primary: the threads have no request to route by); it
+    must only use db.session and return plain data.
+
+    Args:
+        query: Called with a store id
+        store_ids: Stores to run it for
+        workers (int): Threads to use; defaults to STORE_FANOUT_WORKERS
+
+    Returns:
+        dict: query's result by store id
+    """
+    store_ids = list(store_ids)
+    app = current_app._get_current_object()
+    workers = min(workers or app.config['STORE_FANOUT_WORKERS'], len(store_ids))
+    if workers <= 1:
+        return {store_id: query(store_id) for store_id in store_ids}
+
+    def run(store_id):
+        with app.app_context():
+            return query(store_id)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(store_ids, pool.map(run, store_ids)))
@@ -0,0 +1,259 @@
+"""
+Synthetic dataset generator for benchmarking
+
+Builds a large, realistic catalog and sales history with bulk inserts:
+Zipf-distributed product popularity, weekly and intraday seasonality,
+several cashiers and payment methods, optionally several stores, and a stock
+ledger that matches the final stock levels. The output is fully determined by
+the seed and end date.
+"""
+import itertools
+import logging
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, update
+
+from app import db
+from catalog import bump_version
+from models import DEFAULT_STORE_ID, Product, Store, StoreStock, Transaction, TransactionItem, StockMovement
+
+logger = logging.getLogger(__name__)
+
+# Category -> (product nouns, sizes, median price)
+CATALOG = {
+    'Groceries': (['Rice', 'Flour', 'Sugar', 'Salt', 'Pasta', 'Beans', 'Lentils', 'Maize Meal', 'Cooking Oil', 'Tea Leaves'],
+                  ['500g', '1kg', '2kg', '5kg'], 3.0),
+    'Dairy': (['Milk', 'Cheese', 'Yogurt', 'Butter', 'Cream', 'Ghee'], ['200g', '250ml', '500ml', '1L'], 2.5),
+    'Beverages': (['Cola', 'Orange Juice', 'Mineral Water', 'Lemonade', 'Iced Tea', 'Energy Drink', 'Coffee'],
+                  ['330ml', '500ml', '1L', '2L'], 1.8),
+    'Bakery': (['Bread', 'Croissant', 'Muffin', 'Bagel', 'Cake', 'Buns'], ['1pc', '4pk', '400g', '700g'], 2.0),
+    'Household': (['Dish Soap', 'Laundry Detergent', 'Bleach', 'Toilet Paper', 'Sponges', 'Bin Bags'],
+                  ['1pc', '500ml', '1kg', '10pk'], 4.0),
+    'Snacks': (['Potato Chips', 'Chocolate Bar', 'Biscuits', 'Peanuts', 'Popcorn', 'Crackers'],
+               ['50g', '100g', '150g', '300g'], 1.5),
+    'Produce': (['Apples', 'Bananas', 'Tomatoes', 'Onions', 'Potatoes', 'Carrots', 'Avocados', 'Mangoes'],
+                ['500g', '1kg', '2kg'], 2.2),
+    'Meat': (['Chicken Breast', 'Ground Beef', 'Pork Chops', 'Sausages', 'Goat Meat', 'Fish Fillet'],
+             ['250g', '500g', '1kg'], 6.0),
+    'Personal Care': (['Shampoo', 'Toothpaste', 'Body Lotion', 'Bar Soap', 'Deodorant'], ['100ml', '250ml', '400ml'], 3.5),
+    'Baby': (['Diapers', 'Baby Wipes', 'Baby Formula', 'Baby Cereal'], ['1pk', '400g', '900g'], 8.0),
+}
+
+BRANDS = ['Acme', 'Savanna', 'Golden', 'Kilimo', 'FreshCo', 'Baraka', 'Nyota', 'Prime', 'Tuzo', 'Jamii',
+          'Highland', 'Coast', 'Daily', 'Value', 'Select']
+
+CASHIERS = ['Achieng', 'Brian', 'Cynthia', 'David', 'Esther', 'Faith', 'George', 'Hassan', 'Irene', 'James']
+
+PAYMENT_METHODS = ['cash', 'mpesa', 'card']
+PAYMENT_WEIGHTS = [45, 40, 15]
+
+# Relative traffic by weekday (Mon..Sun) and by opening hour (07:00..21:00)
+WEEKDAY_WEIGHTS = [0.85, 0.8, 0.85, 0.9, 1.1, 1.35, 1.15]
+HOURS = list(range(7, 22))
+HOUR_WEIGHTS = [2, 4, 5, 5, 6, 8, 7, 6, 6, 7, 9, 10, 9, 6, 3]
+
+# Basket sizes 1..12 with a long tail
+BASKET_SIZES = list(range(1, 13))
+BASKET_WEIGHTS = [22, 18, 14, 11, 9, 7, 6, 4, 3, 2, 2, 2]
+
+
+def zipf_cum_weights(n, exponent):
+    """Cumulative Zipf weights for ranks 1..n, for random.choices(cum_weights=...)"""
+    return list(itertools.accumulate(1.0 / (rank ** exponent) for rank in range(1, n + 1)))
+
+
+def _bulk_insert(model, rows):
+    if rows:
+        db.session.execute(model.__table__.insert(), rows)
+
+
+def generate_synthetic_data(products=100000, days=90, transactions_per_day=2000, seed=42,
+                            end_date=None, zipf_exponent=1.1, stock_movements=True,
+                            stores=1, chunk_size=20000, progress=None):
+    """
+    Generate a synthetic catalog and sales history
+
+    Args:
+        products (int): Number of SKUs to create
+        days (int): Days of sales history ending at end_date
+        transactions_per_day (int): Average number of sales per day
+        seed (int): Random seed; identical seed and end_date give identical data
+        end_date (datetime, optional): Last day of history. Defaults to today.
+        zipf_exponent (float): Skew of product popularity
+        stock_movements (bool): Write an 'out' movement per line item, as checkout does
+        stores (int): Spread sales and stock across this many stores, creating
+            any that do not exist yet
+        chunk_size (int): Transactions inserted per batch
+        progress (callable, optional): Called with a status string after each batch
+
+    Returns:
+        dict: Counts of inserted rows and elapsed seconds
+    """
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    end_date = end_date or datetime.utcnow()
+    end_day = datetime(end_date.year, end_date.month, end_date.day)
+    start_day = end_day - timedelta(days=days - 1)
+
+    store_ids = list(range(DEFAULT_STORE_ID, DEFAULT_STORE_ID + stores))
+    for store_id in store_ids:
+        if db.session.get(Store, store_id) is None:
+            db.session.add(Store(id=store_id, code=f'S{store_id:03d}', name=f'Store {store_id}'))
+    db.session.commit()
+
+    # Continue numbering after any existing rows so the generator can be re-run
+    product_base = (db.session.query(func.max(Product.id)).scalar() or 0) + 1
+    transaction_base = (db.session.query(func.max(Transaction.id)).scalar() or 0) + 1
+
+    # --- Catalog ---
+    categories = list(CATALOG)
+    product_rows = []
+    for offset in range(products):
+        product_id = product_base + offset
+        category = categories[rng.randrange(len(categories))]
+        nouns, sizes, median_price = CATALOG[category]
+        noun = nouns[rng.randrange(len(nouns))]
+        size = sizes[rng.randrange(len(sizes))]
+        price = round(max(0.25, rng.lognormvariate(0, 0.5) * median_price), 2)
+        product_rows.append({
+            'id': product_id,
+            'barcode': f'89{product_id:011d}',
+            'name': f'{BRANDS[rng.randrange(len(BRANDS))]} {noun} {size}',
+            'description': f'{size} {noun.lower()} ({category.lower()})',
+            'price': price,
+            'cost_price': round(price * rng.uniform(0.55, 0.85), 2),
+            'category': category,
+            'stock_quantity': 0,
+            'created_at': start_day,
+            'updated_at': start_day,
+        })
+    for i in range(0, len(product_rows), chunk_size):
+        _bulk_insert(Product, product_rows[i:i + chunk_size])
+    prices = [row['price'] for row in product_rows]
+    del product_rows
+    if progress:
+        progress(f'{products} products inserted')
+
+    # Popularity rank -> product offset, shuffled so best sellers span categories
+    by_rank = list(range(products))
+    rng.shuffle(by_rank)
+    cum_weights = zipf_cum_weights(products, zipf_exponent)
+    sold = {store_id: [0] * products for store_id in store_ids}
+
+    # --- Sales history ---
+    transaction_id = transaction_base
+    item_count = 0
+    movement_count = 0
+    transactions, items, movements = [], [], []
+
+    def flush():
+        _bulk_insert(Transaction, transactions)
+        _bulk_insert(TransactionItem, items)
+        _bulk_insert(StockMovement, movements)
+        db.session.commit()
+        transactions.clear()
+        items.clear()
+        movements.clear()
+
+    for day_index in range(days):
+        day = start_day + timedelta(days=day_index)
+        volume = rng.gauss(transactions_per_day * WEEKDAY_WEIGHTS[day.weekday()], transactions_per_day * 0.05)
+        hours = rng.choices(HOURS, weights=HOUR_WEIGHTS, k=max(0, int(volume)))
+        hours.sort()
+        for hour in hours:
+            when = day + timedelta(hours=hour, seconds=rng.randrange(3600))
+            store_id = store_ids[rng.randrange(stores)] if stores > 1 else DEFAULT_STORE_ID
+            reference = f'SYN-{transaction_id:010d}'
+            basket = rng.choices(by_rank, cum_weights=cum_weights, k=rng.choices(BASKET_SIZES, BASKET_WEIGHTS)[0])
+            lines = Counter(basket)
+            total = 0.0
+            for offset, picks in lines.items():
+                quantity = picks + (1 if rng.random() < 0.15 else 0)
+                unit_price = prices[offset]
+                line_total = round(unit_price * quantity, 2)
+                total += line_total
+                sold[store_id][offset] += quantity
+                product_id = product_base + offset
+                items.append({
+                    'transaction_id': transaction_id,
+                    'product_id': product_id,
+                    'quantity': quantity,
+                    'unit_price': unit_price,
+                    'total_price': line_total,
+                })
+                if stock_movements:
+                    movements.append({
+                        'product_id': product_id,
+                        'movement_date': when,
+                        'quantity': -quantity,
+                        'movement_type': 'out',
+                        'reference': reference,
+                        'notes': f'Sale transaction {reference}',
+                        'store_id': store_id,
+                    })
+            item_count += len(lines)
+            transactions.append({
+                'id': transaction_id,
+                'reference_number': reference,
+                'transaction_date': when,
+                'total_amount': round(total, 2),
+                'payment_method': rng.choices(PAYMENT_METHODS, PAYMENT_WEIGHTS)[0],
+                'payment_reference': f'PAY-{transaction_id:010d}',
+                'cashier_name': CASHIERS[rng.randrange(len(CASHIERS))],
+                'store_id': store_id,
+            })
+            transaction_id += 1
+            if len(transactions) >= chunk_size:
+                movement_count += len(movements)
+                flush()
+                if progress:
+                    progress(f'{transaction_id - transaction_base} transactions, {item_count} line items')
+    movement_count += len(movements)
+    flush()
+
+    # --- Opening stock so that opening - sold = final stock ---
+    # Every product is written here, so one catalog version covers the load
+    version = bump_version(db.session)
+    opening_rows, stock_rows, store_rows = [], [], []
+    for offset in range(products):
+        product_id = product_base + offset
+        total = 0
+        for store_id in store_ids:
+            opening = sold[store_id][offset] + rng.randint(0, 200)
+            stock = opening - sold[store_id][offset]
+            total += stock
+            if stock:
+                store_rows.append({'store_id': store_id, 'product_id': product_id, 'stock_quantity': stock})
+            if stock_movements and opening:
+                opening_rows.append({
+                    'product_id': product_id,
+                    'movement_date': start_day,
+                    'quantity': opening,
+                    'movement_type': 'in',
+                    'reference': 'Initial Stock',
+                    'notes': 'Opening stock for synthetic dataset',
+                    'store_id': store_id,
+                })
+        stock_rows.append({'id': product_id, 'stock_quantity': total,
+                           'updated_at': end_day, 'catalog_version': version})
+    for i in range(0, products, chunk_size):
+        db.session.execute(update(Product), stock_rows[i:i + chunk_size])
+    for i in range(0, len(store_rows), chunk_size):
+        _bulk_insert(StoreStock, store_rows[i:i + chunk_size])
+    for i in range(0, len(opening_rows), chunk_size):
+        _bulk_insert(StockMovement, opening_rows[i:i + chunk_size])
+    movement_count += len(opening_rows)
+    db.session.commit()
+
+    elapsed = time.perf_counter() - started
+    logger.info("Synthetic data generated in %.1fs", elapsed)
+    return {
+        'products': products,
+        'transactions': transaction_id - transaction_base,
+        'line_items': item_count,
+        'stock_movements': movement_count,
+        'elapsed_seconds': round(elapsed, 2),
+    }
@@ -0,0 +1,165 @@
+"""
+Till sessions and Z-reports
+
+A TillSession is one cashier's shift on one till. Sales rung up with its id
+add to the session's running totals (count and value, overall and by payment
+method) from a before_flush listener, in the same database transaction as
+the sale, so the totals change exactly when the sale commits. An X-report of
+an open session, or the close that ends it, reads the session's few rows
+however many sales the shift took.
+
+``close_session`` claims the session with an UPDATE conditional on status
+'open' and freezes its totals into a ZReport. The listener adds to a session
+with an UPDATE conditional on the same status, so a sale racing the close
+either lands before the snapshot or fails with TillSessionClosed. Z-reports
+are never changed once written, and historical reports are read from them,
+not from the sales tables, so they still hold after archive-history moves
+the sales out.
+"""
+import json
+from collections import Counter
+from datetime import datetime
+
+import sqlalchemy as sa
+
+from app import db
+from models import TillSession, TillSessionTotal, Transaction, ZReport
+from routing import RoutingSession
+
+
+class TillSessionClosed(ValueError):
+    """A sale was rung up on a till session that is no longer open"""
+
+    def __init__(self, till_session_id):
+        self.till_session_id = till_session_id
+        super().__init__(f'Till session {till_session_id} is closed')
+
+
+def _add_sales(connection, till_session_id, count, total, by_method):
+    """Add sales to a session's running totals; raises TillSessionClosed"""
+    sessions = TillSession.__table__
+    updated = connection.execute(
+        sessions.update()
+        .where(sessions.c.id == till_session_id, sessions.c.status == 'open')
+        .values(transaction_count=sessions.c.transaction_count + count,
+                total_amount=sessions.c.total_amount + total)
+    ).rowcount
+    if updated != 1:
+        raise TillSessionClosed(till_session_id)
+
+    # The session row update above serializes sales on the same till, so
+    # the insert of a method's first total cannot race another
+    totals = TillSessionTotal.__table__
+    for method, (method_count, method_total) in sorted(by_method.items()):
+        updated = connection.execute(
+            totals.update()
+            .where(totals.c.till_session_id == till_session_id, totals.c.payment_method == method)
+            .values(transaction_count=totals.c.transaction_count + method_count,
+                    total_amount=totals.c.total_amount + method_total)
+        ).rowcount
+        if not updated:
+            connection.execute(totals.insert().values(
+                till_session_id=till_session_id, payment_method=method,
+                transaction_count=method_count, total_amount=method_total
+            ))
+
+
+@sa.event.listens_for(RoutingSession, 'before_flush')
+def _track_till_sales(db_session, flush_context, instances):
+    for obj in db_session.deleted:
+        if isinstance(obj, ZReport):
+            raise ValueError(f'Z-report {obj.id} cannot be deleted')
+    for obj in db_session.dirty:
+        if isinstance(obj, ZReport) and db_session.is_modified(obj):
+            raise ValueError(f'Z-report {obj.id} cannot be changed')
+
+    counts, totals, by_method = Counter(), Counter(), {}
+    for obj in db_session.new:
+        if isinstance(obj, Transaction) and obj.till_session_id is not None:
+            counts[obj.till_session_id] += 1
+            totals[obj.till_session_id] += obj.total_amount
+            methods = by_method.setdefault(obj.till_session_id, {})
+            count, total = methods.get(obj.payment_method, (0, 0.0))
+            methods[obj.payment_method] = (count + 1, total + obj.total_amount)
+    if not counts:
+        return
+    connection = db_session.connection()
+    for till_session_id in sorted(counts):
+        _add_sales(connection, till_session_id, counts[till_session_id], totals[till_session_id],
+                   by_method[till_session_id])
+
+
+def close_session(till_session_id, counted_cash=None, now=None):
+    """
+    Close an open till session and freeze its totals into a Z-report
+
+    Reads only the session and its per-method totals; does not commit.
+
+    Args:
+        till_session_id (int): The session
+        counted_cash (float): Cash counted in the drawer, if it was
+        now (datetime): Closing time (UTC); defaults to now
+
+    Returns:
+        ZReport: The flushed report, or None if the session was not open
+    """
+    now = now or datetime.utcnow()
+    connection = db.session.connection()
+    sessions = TillSession.__table__
+    session = connection.execute(
+        sessions.update()
+        .where(sessions.c.id == till_session_id, sessions.c.status == 'open')
+        .values(status='closed', closed_at=now)
+        .returning(sessions.c.store_id, sessions.c.till, sessions.c.cashier_name, sessions.c.opened_at,
+                   sessions.c.opening_float, sessions.c.transaction_count, sessions.c.total_amount)
+    ).first()
+    if session is None:
+        return None
+
+    totals = TillSessionTotal.__table__
+    methods = [
+        {'method': method, 'count': count, 'total': round(total, 2)}
+        for method, count, total in connection.execute(
+            sa.select(totals.c.payment_method, totals.c.transaction_count, totals.c.total_amount)
+            .where(totals.c.till_session_id == till_session_id)
+            .order_by(totals.c.payment_method)
+        )
+    ]
+    cash = sum(method['total'] for method in methods if method['method'] == 'cash')
+    report = ZReport(
+        till_session_id=till_session_id,
+        store_id=session.store_id,
+        till=session.till,
+        cashier_name=session.cashier_name,
+        opened_at=session.opened_at,
+        closed_at=now,
+        transaction_count=session.transaction_count,
+        total_amount=round(session.total_amount, 2),
+        opening_float=session.opening_float,
+        expected_cash=round(session.opening_float + cash, 2),
+        counted_cash=counted_cash,
+        payment_methods=json.dumps(methods)
+    )
+    db.session.add(report)
+    db.session.flush()
+    return report
+
+
+def close_open_sessions(store_id=None, now=None):
+    """
+    End-of-day close: close every open till session, of one store or all;
+    commits after each
+
+    Returns:
+        list: The Z-reports taken
+    """
+    query = sa.select(TillSession.id).where(TillSession.status == 'open').order_by(TillSession.id)
+    if store_id is not None:
+        query = query.where(TillSession.store_id == store_id)
+    reports = []
+    for till_session_id in db.session.scalars(query).all():
+        report = close_session(till_session_id, now=now)
+        db.session.commit()
+        if report is not None:
+            reports.append(report)
+    return reports